@@ -1,5 +1,9 @@
+import os
 import csv
-from typing import Optional, Dict, List
+import threading
+from typing import Optional, Dict, List, Tuple, NamedTuple
+
+import numpy as np
 
 from PyQt5.QtGui import QColor
 from qgis.core import (
@@ -14,7 +18,10 @@ from qgis.core import (
     QgsClassificationQuantile,
     QgsFields,
     QgsRuleBasedRenderer,
-    QgsExpression
+    QgsExpression,
+    QgsFeatureRequest,
+    QgsMessageLog,
+    Qgis
 )
 from PyQt5.QtCore import QVariant, Qt
 
@@ -186,6 +193,112 @@ def _calculate_cn_value(feature: QgsFeature, cn_dict: Dict[int, List[float]]) ->
     return None
 
 
+def _to_int_array(values: list) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert attribute values to an int array and a mask of converted values (NULL and non-numeric are False)."""
+    out = np.zeros(len(values), dtype=np.int64)
+    ok = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        try:
+            out[i] = int(value)
+            ok[i] = True
+        except (TypeError, ValueError, OverflowError):
+            continue
+    return out, ok
+
+
+# Largest LandUse_code of a table compiled into a dense array (8 MB), tables with larger codes are searched
+CN_DENSE_MAX_CODE = 200_000
+
+
+class CNLookup(NamedTuple):
+    codes: Optional[np.ndarray]  # sorted LandUse codes of the table rows, None if the rows are indexed by the code
+    table: np.ndarray  # CN by [row, HSG], HSG 0 (water body) is 99, missing combinations are NaN
+
+
+def cn_lookup_array(cn_dict: Dict[int, List[float]], max_dense_code: int = CN_DENSE_MAX_CODE) -> CNLookup:
+    """
+    Compile the CN table into an array indexed by [LandUse_code, HSG], or by [row of the sorted codes, HSG]
+    if the largest code exceeds max_dense_code. Negative codes are not land use codes, their rows are logged
+    and left out.
+    """
+    for code in sorted(code for code in cn_dict if code < 0):
+        QgsMessageLog.logMessage(f"CN table row with negative LandUse_code {code} ignored", "CzLandUseCN",
+                                 level=Qgis.Warning)
+    codes = sorted(code for code in cn_dict if code >= 0)
+    dense = not codes or codes[-1] <= max_dense_code
+    lookup = np.full((codes[-1] + 1 if dense and codes else len(codes), 5), np.nan, dtype=float)
+    lookup[:, 0] = 99
+    for row, code in enumerate(codes):
+        cn_values = cn_dict[code][:4]
+        lookup[code if dense else row, 1:1 + len(cn_values)] = cn_values
+    return CNLookup(None if dense else np.array(codes, dtype=np.int64), lookup)
+
+
+# Parsed CN tables by path, see load_cn_lookup
+_cn_tables: Dict[str, Tuple[float, CNLookup]] = {}
+_cn_tables_lock = threading.Lock()
+
+
+def load_cn_lookup(path: str) -> CNLookup:
+    """Load the CN table as a lookup array (see cn_lookup_array), reused until the file is modified."""
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    with _cn_tables_lock:
+        cached = _cn_tables.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+    lookup = cn_lookup_array(CNCreator(None, path)._load_cn_table())
+    # shared by all CN tasks
+    for array in lookup:
+        if array is not None:
+            array.setflags(write=False)
+    with _cn_tables_lock:
+        _cn_tables[path] = (mtime, lookup)
+    return lookup
+
+
+def calculate_cn_values(landuse_values: list, hsg_values: list, lookup: CNLookup) -> Tuple[np.ndarray, np.ndarray]:
+    """Return CN2 and CN3 arrays (NaN where CN is not defined) for LandUse_code and HSG attribute values."""
+    landuse, landuse_ok = _to_int_array(landuse_values)
+    hsg, hsg_ok = _to_int_array(hsg_values)
+
+    cn2 = np.full(len(landuse), np.nan, dtype=float)
+    known = landuse_ok & hsg_ok
+    # HSG 0 == water body regardless of the land use
+    cn2[known & (hsg == 0)] = 99
+    if lookup.codes is None:
+        rows = landuse
+        in_table = known & (landuse >= 0) & (landuse < lookup.table.shape[0])
+    else:
+        # codes is not empty (see cn_lookup_array)
+        rows = np.minimum(np.searchsorted(lookup.codes, landuse), len(lookup.codes) - 1)
+        in_table = known & (lookup.codes[rows] == landuse)
+    in_table &= (hsg >= 1) & (hsg <= 4)
+    cn2[in_table] = lookup.table[rows[in_table], hsg[in_table]]
+
+    cn3 = 23 * cn2 / (10 + 0.13 * cn2)
+    return cn2, cn3
+
+
+def cn_inputs_match(int_layer: QgsVectorLayer, cn_layer: QgsVectorLayer) -> bool:
+    """
+    Return True if the CN layer holds the current LandUse_code and HSG values of the intersection layer
+    (same features in the same order), i.e. only the CN values may need to be recomputed.
+    """
+    values = []
+    for layer in (int_layer, cn_layer):
+        fields = layer.fields()
+        landuse_idx, hsg_idx = fields.indexOf("LandUse_code"), fields.indexOf("HSG")
+        if landuse_idx == -1 or hsg_idx == -1:
+            return False
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([landuse_idx, hsg_idx])
+        values.append([(feature.attribute(landuse_idx), feature.attribute(hsg_idx))
+                       for feature in layer.getFeatures(request)])
+    return values[0] == values[1]
+
+
 class CNCreator:
     def __init__(self, IntLayer: QgsVectorLayer, CN_table_path: str) -> None:
         self.IntLayer: QgsVectorLayer = IntLayer
@@ -197,10 +310,10 @@ class CNCreator:
         try:
 
 
-            cn_dict = self._load_cn_table()
+            lookup = load_cn_lookup(self.CN_table_path)
             new_layer = self._create_memory_layer()
 
-            self._copy_features_with_cn(new_layer, cn_dict)
+            self._copy_features_with_cn(new_layer, lookup)
 
             new_layer.updateExtents()
             self.CNLayer = new_layer
@@ -209,6 +322,74 @@ class CNCreator:
         except Exception as e:
             raise CNCreatorError(f"Failed to create CN layer: {e}")
 
+    def UpdateCNLayer(self, cn_layer: QgsVectorLayer) -> QgsVectorLayer:
+        """
+        Recompute CN2/CN3 of an existing CN layer in place from its LandUse_code and HSG attributes
+        (e.g. after the CN table changed). Geometries are neither read nor copied.
+        Layers in the project are updated by ComputeCNValues in a task and WriteCNValues in the main thread.
+        """
+        self.WriteCNValues(cn_layer, self.ComputeCNValues(cn_layer, cn_layer.fields()))
+        return self.CNLayer
+
+    def ComputeCNValues(self, source, fields: QgsFields) -> Dict[int, Tuple[Optional[float], Optional[float]]]:
+        """
+        Return CN2 and CN3 (None if not defined) by feature id, computed from LandUse_code and HSG of the source
+        (layer or QgsVectorLayerFeatureSource of the CN layer, thread-safe) with the given fields.
+        """
+        try:
+            lookup = load_cn_lookup(self.CN_table_path)
+            landuse_idx, hsg_idx = fields.indexOf("LandUse_code"), fields.indexOf("HSG")
+            if landuse_idx == -1 or hsg_idx == -1:
+                raise CNCreatorError("CN layer does not contain LandUse_code or HSG attribute.")
+
+            request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+            request.setSubsetOfAttributes([landuse_idx, hsg_idx])
+            fids, landuse_values, hsg_values = [], [], []
+            for feature in source.getFeatures(request):
+                fids.append(feature.id())
+                landuse_values.append(feature.attribute(landuse_idx))
+                hsg_values.append(feature.attribute(hsg_idx))
+
+            cn2, cn3 = calculate_cn_values(landuse_values, hsg_values, lookup)
+            # NaN == not defined
+            return {fid: (cn2_val if cn2_val == cn2_val else None, cn3_val if cn3_val == cn3_val else None)
+                    for fid, cn2_val, cn3_val in zip(fids, cn2.tolist(), cn3.tolist())}
+
+        except Exception as e:
+            raise CNCreatorError(f"Failed to update CN layer: {e}")
+
+    def WriteCNValues(self, cn_layer: QgsVectorLayer,
+                      cn_values: Dict[int, Tuple[Optional[float], Optional[float]]]) -> None:
+        """
+        Write CN values of ComputeCNValues to the CN layer, adding missing CN fields.
+        A layer in edit mode is changed through its edit buffer. Must be called in the main thread
+        for layers in the project.
+        """
+        try:
+            missing = [QgsField(name, QVariant.Double) for name in ("CN2", "CN3")
+                       if cn_layer.fields().indexOf(name) == -1]
+            editable = cn_layer.isEditable()
+            if missing:
+                if editable:
+                    for field in missing:
+                        cn_layer.addAttribute(field)
+                else:
+                    cn_layer.dataProvider().addAttributes(missing)
+                    cn_layer.updateFields()
+
+            cn2_idx, cn3_idx = cn_layer.fields().indexOf("CN2"), cn_layer.fields().indexOf("CN3")
+            attribute_map = {fid: {cn2_idx: cn2, cn3_idx: cn3} for fid, (cn2, cn3) in cn_values.items()}
+            if editable:
+                for fid, values in attribute_map.items():
+                    cn_layer.changeAttributeValues(fid, values)
+            elif not cn_layer.dataProvider().changeAttributeValues(attribute_map):
+                raise CNCreatorError("Failed to write CN values")
+
+            self.CNLayer = cn_layer
+
+        except Exception as e:
+            raise CNCreatorError(f"Failed to update CN layer: {e}")
+
     def _load_cn_table(self) -> Dict[int, List[float]]:
         """Loads the CN table CSV into a dictionary."""
         cn_dict: Dict[int, List[float]] = {}
@@ -243,8 +424,39 @@ class CNCreator:
         new_layer.updateFields()
         return new_layer
 
-    def _copy_features_with_cn(self, new_layer: QgsVectorLayer, cn_dict: Dict[int, List[float]]) -> None:
-        """Copies features from the input layer to the new layer with CN values calculated."""
+    def _copy_features_with_cn(self, new_layer: QgsVectorLayer, lookup: CNLookup) -> None:
+        """Copies features from the input layer to the new layer with CN values calculated for all features at once."""
+        new_fields: QgsFields = new_layer.fields()
+        cn2_idx, cn3_idx = new_fields.indexOf("CN2"), new_fields.indexOf("CN3")
+        fields = self.IntLayer.fields()
+        landuse_idx, hsg_idx = fields.indexOf("LandUse_code"), fields.indexOf("HSG")
+        if landuse_idx == -1 or hsg_idx == -1:
+            raise CNCreatorError("Input layer does not contain LandUse_code or HSG attribute.")
+
+        features = list(self.IntLayer.getFeatures())
+        cn2, cn3 = calculate_cn_values([feature.attribute(landuse_idx) for feature in features],
+                                       [feature.attribute(hsg_idx) for feature in features], lookup)
+
+        new_features = []
+        for feature, cn2_val, cn3_val in zip(features, cn2.tolist(), cn3.tolist()):
+            attrs = feature.attributes()
+            attrs.extend([None] * (new_fields.count() - len(attrs)))
+            # NaN == not defined
+            attrs[cn2_idx] = cn2_val if cn2_val == cn2_val else None
+            attrs[cn3_idx] = cn3_val if cn3_val == cn3_val else None
+
+            new_feat = QgsFeature(new_fields)
+            new_feat.setGeometry(feature.geometry())
+            new_feat.setAttributes(attrs)
+            new_features.append(new_feat)
+
+        if not new_layer.dataProvider().addFeatures(new_features)[0]:
+            raise CNCreatorError("Failed to write CN features")
+
+    def _copy_features_with_cn_per_feature(self, new_layer: QgsVectorLayer, cn_dict: Dict[int, List[float]]) -> None:
+        """
+        Reference (per-feature) implementation of _copy_features_with_cn, kept to verify the vectorized one.
+        """
         new_fields: QgsFields = new_layer.fields()
         new_layer_data = new_layer.dataProvider()
 
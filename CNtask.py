@@ -1,6 +1,6 @@
 import os
 
-from qgis.core import QgsTask, QgsMessageLog, Qgis
+from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsVectorLayerFeatureSource
 from PyQt5.QtCore import pyqtSignal
 
 from .CNCreator import CNCreator, add_cn_symbology, prune_cn_layer_fields
@@ -10,11 +10,18 @@ class TASK_CN(QgsTask):
     """Task Intersect Soil and LandUse layers."""
     taskFinished_CN  = pyqtSignal(list)
 
-    def __init__(self, IntLayer, CN_table_path):
+    def __init__(self, IntLayer, CN_table_path, CNLayer=None):
         super().__init__("CN Creation.", QgsTask.CanCancel)
         self.IntLayer = IntLayer
         self.CN_table_path = CN_table_path
-        self.CNLayer = None
+        # Existing CN layer of IntLayer, its CN values are recomputed in place
+        self.CNLayer = CNLayer
+        self.update_in_place = CNLayer is not None
+        self.cn_values = None
+        if self.update_in_place:
+            # The project layer is read in run() through a feature source and written in finished()
+            self._cn_source = QgsVectorLayerFeatureSource(CNLayer)
+            self._cn_fields = CNLayer.fields()
 
 
 
@@ -23,28 +30,46 @@ class TASK_CN(QgsTask):
         if result:
             QgsMessageLog.logMessage("Task of CN creation completed.", "CzLandUseCN", level=Qgis.Info,
                                      notifyUser=False)
+            if self.update_in_place:
+                # Layer in the project is changed in the main thread
+                try:
+                    CNCreator(self.IntLayer, self.CN_table_path).WriteCNValues(self.CNLayer, self.cn_values)
+                except Exception as e:
+                    QgsMessageLog.logMessage(f"Error in CN Task: {str(e)}", "CzLandUseCN", level=Qgis.Warning,
+                                             notifyUser=True)
+                    return
+                self._add_symbology()
             self.taskFinished_CN.emit([self.CNLayer])
         else:
             QgsMessageLog.logMessage("Task of processing layers failed.", "CzLandUseCN", level=Qgis.Warning,
                                      notifyUser=True)
+
+    def _add_symbology(self):
+        """Apply the CN color ramp to the CN layer."""
+        try:
+            add_cn_symbology(self.CNLayer , "CN2",
+                             os.path.join(os.path.dirname(os.path.realpath(__file__)), "colortables",
+                                          "CN_color_ramp.xml"), "CN")
+        except Exception as e:
+            QgsMessageLog.logMessage(f"Error in CN symbology: {str(e)}", "CzLandUseCN", level=Qgis.Warning)
+
     def run(self):
         """Run the task to process Soil layers."""
         try:
 
-            prune_cn_layer_fields(self.IntLayer)
             # Create CN Creator instance
             cn_creator = CNCreator(self.IntLayer, self.CN_table_path)
-            # Create CN layer
 
+            if self.update_in_place:
+                # Only the CN table changed, CN values of the existing CN layer are written in finished()
+                self.cn_values = cn_creator.ComputeCNValues(self._cn_source, self._cn_fields)
+                return True
+
+            prune_cn_layer_fields(self.IntLayer)
+            # Create CN layer
             self.CNLayer = cn_creator.CreateCNLayer()
             self.CNLayer.setName("CN Layer")
-
-            try:
-                add_cn_symbology(self.CNLayer , "CN2",
-                                 os.path.join(os.path.dirname(os.path.realpath(__file__)), "colortables",
-                                              "CN_color_ramp.xml"), "CN")
-            except Exception as e:
-                QgsMessageLog.logMessage(f"Error in CN symbology: {str(e)}", "CzLandUseCN", level=Qgis.Warning)
+            self._add_symbology()
 
             return True
 
@@ -5,33 +5,40 @@ from typing import Optional
 
 
 
+def _reject_cn_row(filepath, line, row, reason):
+    QgsMessageLog.logMessage(f"Invalid CN table {filepath}, line {line} ({reason}): {','.join(row)}", "CzLandUseCN",
+                             level=Qgis.Warning)
+    return False
+
+
 def is_valid_cn_csv(filepath):
-    """Check if the CSV file is valid for CN calculation."""
+    """Check if the CSV file is valid for CN calculation, the first rejected row is logged."""
     import csv
 
     with open(filepath, 'r', encoding='utf-8') as f:
         reader = csv.reader(f)
         next(reader) # Skip header
 
-        for row in reader:  # Skip header
+        for line, row in enumerate(reader, 2):  # Skip header
             # Skip empty lines
             if not row or all(cell.strip() == "" for cell in row):
                 continue
 
             # Check row has exactly 5 values
             if len(row) != 5:
-                return False
+                return _reject_cn_row(filepath, line, row, "5 values expected")
 
             try:
-                # First value should be an integer code
-                int(row[0].strip())
+                # First value should be a non-negative integer code
+                if int(row[0].strip()) < 0:
+                    return _reject_cn_row(filepath, line, row, "negative LandUse code")
 
                 # Next 4 values should be numeric (int or float)
                 for val in row[1:]:
                     float(val.strip())
 
             except ValueError:
-                return False
+                return _reject_cn_row(filepath, line, row, "non-numeric value")
 
     return True
 
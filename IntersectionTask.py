@@ -2,9 +2,8 @@ import os
 from PyQt5.QtCore import pyqtSignal
 
 from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsProject, QgsMapLayerProxyModel
-import processing
 
-from .LayerEditor import clip_larger_layer_to_smaller
+from .LayerEditor import overlay_landuse_hsg
 
 class TASK_Intersection(QgsTask):
     """Task Intersect Soil and LandUse layers."""
@@ -28,32 +27,11 @@ class TASK_Intersection(QgsTask):
             QgsMessageLog.logMessage("Task of processing layers failed.", "CzLandUseCN", level=Qgis.Warning,
 
                                      notifyUser=True)
-    @staticmethod
-    def intersection_cleanup(layer):
-        """
-        Removes all features from the given vector layer whose 'source' attribute is NULL.
-        """
-        layer.startEditing()
-        for feature in layer.getFeatures():
-            if feature['source'] is None:
-                layer.deleteFeature(feature.id())
-        layer.commitChanges()
-        return None
-
     def run(self):
         """Run the task to process Soil layers."""
         try:
-            # Clip the layers to the same extent (smaller layer defines the final AOI if they are not the same size)
-            self.Soil_layer, self.LandUse_layer = clip_larger_layer_to_smaller(self.Soil_layer, self.LandUse_layer)
-
-            # Union the layers
-            self.combined_layer = processing.run("native:union", {
-                'INPUT': self.LandUse_layer,
-                'OVERLAY': self.Soil_layer,
-                'OUTPUT': 'memory:'
-            })['OUTPUT']
-
-            self.intersection_cleanup(self.combined_layer)
+            # Intersect land use polygons with the soil polygons (smaller layer defines the final AOI)
+            self.combined_layer = overlay_landuse_hsg(self.LandUse_layer, self.Soil_layer)
 
             # Set the symbology of the combined layer
             symbology_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "colortables",
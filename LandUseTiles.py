@@ -0,0 +1,155 @@
+import os
+import math
+from typing import List, Tuple, Optional, Set
+
+from PyQt5.QtCore import QVariant
+from qgis.core import (QgsMessageLog, Qgis, QgsVectorLayer, QgsVectorFileWriter, QgsCoordinateTransformContext,
+                       QgsCoordinateReferenceSystem, QgsRectangle, QgsFeature, QgsField, QgsFields,
+                       QgsFeatureRequest, QgsWkbTypes, QgsGeometry)
+
+Tile = Tuple[int, int]
+
+LANDUSE_TABLE = "landuse"
+TILES_TABLE = "tiles"
+# Attributes of the stacked land use layer kept in the tiles
+LANDUSE_FIELDS = (("LandUse_code", QVariant.Int), ("layer", QVariant.String))
+
+
+class LandUseTiles:
+    """
+    GeoPackage with the final (stacked) land use layer precomputed in tiles of a fixed grid in EPSG:5514.
+    Land use polygons clipped to their tile are stored in the 'landuse' table (with spatial index),
+    the 'tiles' table lists the built tiles and the grid size.
+    """
+
+    def __init__(self, path: str, tile_size: float = 5000):
+        self.path = path
+        self.tile_size = float(tile_size)
+        if os.path.exists(path):
+            # The grid of an existing file wins
+            for feature in self._tiles_layer().getFeatures(QgsFeatureRequest().setLimit(1)):
+                self.tile_size = float(feature["tile_size"])
+
+    def _landuse_layer(self) -> QgsVectorLayer:
+        return QgsVectorLayer(f"{self.path}|layername={LANDUSE_TABLE}", LANDUSE_TABLE, "ogr")
+
+    def _tiles_layer(self) -> QgsVectorLayer:
+        return QgsVectorLayer(f"{self.path}|layername={TILES_TABLE}", TILES_TABLE, "ogr")
+
+    def tiles_for_extent(self, extent: QgsRectangle, aoi: Optional[QgsGeometry] = None) -> List[Tile]:
+        """Return the grid tiles covering the extent (only those intersecting the aoi polygon if given)."""
+        tx_min = math.floor(extent.xMinimum() / self.tile_size)
+        tx_max = math.floor(extent.xMaximum() / self.tile_size)
+        ty_min = math.floor(extent.yMinimum() / self.tile_size)
+        ty_max = math.floor(extent.yMaximum() / self.tile_size)
+        tiles = [(tx, ty) for tx in range(tx_min, tx_max + 1) for ty in range(ty_min, ty_max + 1)]
+        if aoi is None:
+            return tiles
+        engine = QgsGeometry.createGeometryEngine(aoi.constGet())
+        engine.prepareGeometry()
+        return [tile for tile in tiles if engine.intersects(QgsGeometry.fromRect(self.tile_rect(tile)).constGet())]
+
+    def tile_rect(self, tile: Tile) -> QgsRectangle:
+        """Return the extent of a grid tile."""
+        tx, ty = tile
+        return QgsRectangle(tx * self.tile_size, ty * self.tile_size,
+                            (tx + 1) * self.tile_size, (ty + 1) * self.tile_size)
+
+    def built_tiles(self) -> Set[Tile]:
+        """Return the tiles stored in the GeoPackage."""
+        if not os.path.exists(self.path):
+            return set()
+        return {(feature["tile_x"], feature["tile_y"]) for feature in self._tiles_layer().getFeatures()}
+
+    def _create(self) -> None:
+        """Create the GeoPackage with empty landuse and tiles tables."""
+        fields = QgsFields()
+        for name, type_ in (("tile_x", QVariant.Int), ("tile_y", QVariant.Int)) + LANDUSE_FIELDS:
+            fields.append(QgsField(name, type_))
+        tile_fields = QgsFields()
+        for name, type_ in (("tile_x", QVariant.Int), ("tile_y", QVariant.Int), ("tile_size", QVariant.Double)):
+            tile_fields.append(QgsField(name, type_))
+
+        for table, table_fields, wkb_type in ((LANDUSE_TABLE, fields, QgsWkbTypes.MultiPolygon),
+                                              (TILES_TABLE, tile_fields, QgsWkbTypes.NoGeometry)):
+            options = QgsVectorFileWriter.SaveVectorOptions()
+            options.driverName = "GPKG"
+            options.layerName = table
+            options.layerOptions = ["SPATIAL_INDEX=YES"] if wkb_type != QgsWkbTypes.NoGeometry else []
+            if os.path.exists(self.path):
+                options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+            writer = QgsVectorFileWriter.create(self.path, table_fields, wkb_type,
+                                                QgsCoordinateReferenceSystem("EPSG:5514"),
+                                                QgsCoordinateTransformContext(), options)
+            if writer.hasError() != QgsVectorFileWriter.NoError:
+                raise IOError(f"Failed to create land use tiles {self.path}: {writer.errorMessage()}")
+            del writer  # flush and close the file
+
+    def write_tile(self, tile: Tile, layer: QgsVectorLayer) -> None:
+        """Store the land use layer (already clipped to the tile), replacing previously built data of the tile."""
+        if not os.path.exists(self.path):
+            self._create()
+
+        landuse, tiles = self._landuse_layer(), self._tiles_layer()
+        tile_filter = f'"tile_x" = {tile[0]} AND "tile_y" = {tile[1]}'
+        for table in (landuse, tiles):
+            request = QgsFeatureRequest().setFilterExpression(tile_filter).setFlags(QgsFeatureRequest.NoGeometry)
+            old = [feature.id() for feature in table.getFeatures(request)]
+            if old:
+                table.dataProvider().deleteFeatures(old)
+
+        source_idx = [layer.fields().indexFromName(name) for name, _ in LANDUSE_FIELDS]
+        features = []
+        for feature in layer.getFeatures():
+            geom = feature.geometry()
+            if geom.isNull() or geom.isEmpty():
+                continue
+            geom.convertToMultiType()
+            tile_feature = QgsFeature(landuse.fields())
+            tile_feature.setGeometry(geom)
+            for name, idx in zip([name for name, _ in LANDUSE_FIELDS], source_idx):
+                if idx != -1:
+                    tile_feature[name] = feature.attribute(idx)
+            tile_feature["tile_x"], tile_feature["tile_y"] = tile
+            features.append(tile_feature)
+
+        tile_feature = QgsFeature(tiles.fields())
+        tile_feature["tile_x"], tile_feature["tile_y"] = tile
+        tile_feature["tile_size"] = self.tile_size
+
+        # The tile is listed only after its land use features are stored
+        if not landuse.dataProvider().addFeatures(features)[0] or \
+                not tiles.dataProvider().addFeatures([tile_feature])[0]:
+            raise IOError(f"Failed to store land use tile {tile} in {self.path}")
+
+    def get_layer(self, extent: QgsRectangle, name: str = "LandUse Layer",
+                  aoi: Optional[QgsGeometry] = None) -> Optional[QgsVectorLayer]:
+        """
+        Return a memory layer with the land use polygons of the tiles covering the extent,
+        None if some of the tiles is not built. With the aoi polygon only the tiles intersecting it are required
+        (the layer still has to be clipped to the aoi).
+        """
+        missing = set(self.tiles_for_extent(extent, aoi)) - self.built_tiles()
+        if missing:
+            QgsMessageLog.logMessage(f"{len(missing)} land use tiles covering the area are missing in {self.path}",
+                                     "CzLandUseCN", level=Qgis.Info)
+            return None
+
+        landuse = self._landuse_layer()
+        layer = QgsVectorLayer(f"MultiPolygon?crs={landuse.crs().authid()}", name, "memory")
+        layer.dataProvider().addAttributes([QgsField(field_name, type_) for field_name, type_ in LANDUSE_FIELDS])
+        layer.updateFields()
+
+        # Spatial filter uses the R-tree index of the GeoPackage
+        request = QgsFeatureRequest().setFilterRect(extent).setSubsetOfAttributes(
+            [field_name for field_name, _ in LANDUSE_FIELDS], landuse.fields())
+        features = []
+        for feature in landuse.getFeatures(request):
+            out_feature = QgsFeature(layer.fields())
+            out_feature.setGeometry(feature.geometry())
+            out_feature.setAttributes([feature[field_name] for field_name, _ in LANDUSE_FIELDS])
+            features.append(out_feature)
+
+        layer.dataProvider().addFeatures(features)
+        layer.updateExtents()
+        return layer
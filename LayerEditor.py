@@ -1,7 +1,8 @@
 import os
+import math
+from concurrent.futures import ThreadPoolExecutor
 import processing
-from typing import Optional, List, Tuple
-import yaml
+from typing import Optional, List, Tuple, Dict, Iterable, Any
 from qgis.analysis import QgsNativeAlgorithms
 
 
@@ -17,9 +18,13 @@ from qgis.core import (
     QgsFields,
     QgsGeometry,
     QgsProcessingFeatureSourceDefinition,
-    QgsWkbTypes
+    QgsWkbTypes,
+    QgsFeatureRequest,
+    QgsExpression,
+    QgsExpressionContext,
+    QgsExpressionContextUtils,
+    QgsSpatialIndex
 )
-from qgis.core import QgsProcessingUtils
 
 
 # Based on the environment, import the WFSdownloader/SoilDownloader module
@@ -31,7 +36,90 @@ try:
     from .SoilDownloader import simple_clip
 except ImportError:
     from SoilDownloader import simple_clip
+try:
+    from .PluginConfig import BufferLayer, load_landuse_matcher, load_lpis_config, load_zabaged_config
+except ImportError:
+    from PluginConfig import BufferLayer, load_landuse_matcher, load_lpis_config, load_zabaged_config
+
+
+
+def change_attribute_values(layer: QgsVectorLayer, attribute_map: Dict[int, Dict[int, Any]]) -> QgsVectorLayer:
+    """
+    Write a {fid: {field_idx: value}} map to the layer in one call.
+    Goes straight to the data provider unless the layer is already in an edit session.
+    """
+    if not attribute_map:
+        return layer
+
+    if layer.isEditable():
+        for fid, values in attribute_map.items():
+            layer.changeAttributeValues(fid, values)
+    elif not layer.dataProvider().changeAttributeValues(attribute_map):
+        raise IOError(f"Failed to update attributes of layer '{layer.name()}'")
+
+    layer.triggerRepaint()
+    return layer
+
+
+def delete_features(layer: QgsVectorLayer, fids: Iterable[int]) -> QgsVectorLayer:
+    """
+    Delete the features with given ids in one call.
+    Goes straight to the data provider unless the layer is already in an edit session.
+    """
+    fids = list(fids)
+    if not fids:
+        return layer
+
+    if layer.isEditable():
+        layer.deleteFeatures(fids)
+    elif not layer.dataProvider().deleteFeatures(fids):
+        raise IOError(f"Failed to delete features of layer '{layer.name()}'")
+
+    layer.updateExtents()
+    layer.triggerRepaint()
+    return layer
+
+
+def set_attribute_value(layer: QgsVectorLayer, field_name: str, value: Any = None,
+                        expression: Optional[str] = None,
+                        request: Optional[QgsFeatureRequest] = None) -> QgsVectorLayer:
+    """
+    Set the field of all features (or features matching request) to a constant value
+    or to the result of a QGIS expression, written in one data provider call.
+    """
+    idx = layer.fields().indexFromName(field_name)
+    if idx == -1:
+        raise ValueError(f"Attribute '{field_name}' not found in layer fields.")
 
+    request = QgsFeatureRequest(request) if request is not None else QgsFeatureRequest()
+
+    if expression is None:
+        # Constant value - no need to fetch geometries or attributes
+        request.setFlags(request.flags() | QgsFeatureRequest.NoGeometry)
+        request.setNoAttributes()
+        attribute_map = {feature.id(): {idx: value} for feature in layer.getFeatures(request)}
+        return change_attribute_values(layer, attribute_map)
+
+    expr = QgsExpression(expression)
+    if expr.hasParserError():
+        raise ValueError(f"Invalid expression '{expression}': {expr.parserErrorString()}")
+
+    context = QgsExpressionContext()
+    context.appendScopes(QgsExpressionContextUtils.globalProjectLayerScopes(layer))
+    expr.prepare(context)
+    if not expr.needsGeometry():
+        request.setFlags(request.flags() | QgsFeatureRequest.NoGeometry)
+    if QgsFeatureRequest.ALL_ATTRIBUTES not in expr.referencedColumns():
+        request.setSubsetOfAttributes(expr.referencedColumns(), layer.fields())
+
+    attribute_map = {}
+    for feature in layer.getFeatures(request):
+        context.setFeature(feature)
+        attribute_map[feature.id()] = {idx: expr.evaluate(context)}
+        if expr.hasEvalError():
+            raise ValueError(f"Failed to evaluate '{expression}': {expr.evalErrorString()}")
+
+    return change_attribute_values(layer, attribute_map)
 
 
 def apply_simple_difference(layer1: QgsVectorLayer, layer2: QgsVectorLayer) -> QgsVectorLayer:
@@ -49,16 +137,25 @@ def apply_simple_difference(layer1: QgsVectorLayer, layer2: QgsVectorLayer) -> Q
     return diff
 
 
+def add_constant_field(layer: QgsVectorLayer, field_name: str, value: Any,
+                       field_type: QVariant.Type = QVariant.Int) -> QgsVectorLayer:
+    """
+    Add a field with the same value for all features as an expression field, no feature is written.
+    The value becomes a real attribute when the features are copied (clip_layer, stack_polygon_layers,
+    processing algorithms such as merge_layers). A field of the data provider is updated instead.
+    """
+    idx = layer.fields().indexFromName(field_name)
+    if idx != -1 and layer.fields().fieldOrigin(idx) != QgsFields.OriginExpression:
+        return set_attribute_value(layer, field_name, value)
+    if idx != -1:
+        layer.removeExpressionField(idx)
+    layer.addExpressionField(QgsExpression.quotedValue(value), QgsField(field_name, field_type))
+    return layer
+
+
 def add_constant_atr(layer, atr_name, atr_value):
     """Add a constant int attribute to the layer."""
-    layer.dataProvider().addAttributes([QgsField(atr_name, QVariant.Int)])
-    layer.updateFields()  # Update fields to reflect the changes
-    layer.startEditing()
-    for feature in layer.getFeatures():
-        feature.setAttribute(atr_name, atr_value)
-        layer.updateFeature(feature)
-    layer.commitChanges()
-    return layer
+    return add_constant_field(layer, atr_name, atr_value, QVariant.Int)
 
 
 def dissolve_polygon(layer: QgsVectorLayer) -> QgsVectorLayer:
@@ -87,11 +184,7 @@ def dissolve_polygon(layer: QgsVectorLayer) -> QgsVectorLayer:
     dissolved_layer.updateFields()
 
     # Set 'ID' value to 1 for all features
-    dissolved_layer.startEditing()
-    for feature in dissolved_layer.getFeatures():
-        feature.setAttribute('ID', 1)
-        dissolved_layer.updateFeature(feature)
-    dissolved_layer.commitChanges()
+    set_attribute_value(dissolved_layer, 'ID', 1)
 
     return dissolved_layer
 
@@ -124,9 +217,7 @@ def resolve_overlaping_buffers(layers: list, config_path: str) -> list:
     :return: New list of QgsVectorLayer with processed buffers
     """
     # Load configuration and extract layer names
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = yaml.safe_load(f)
-        to_process = {item.get('input_layer_name') for item in config.get('buffer_layers', [])}
+    to_process = load_zabaged_config(config_path).buffer_layers
 
     # Build new list, replacing only matching layers
     output_layers = []
@@ -140,39 +231,53 @@ def resolve_overlaping_buffers(layers: list, config_path: str) -> list:
     return output_layers
 
 
-def clip_larger_layer_to_smaller(layer_one: QgsVectorLayer, layer_two: QgsVectorLayer) -> Optional[Tuple[QgsVectorLayer, QgsVectorLayer]]:
-    """" Determine which layer is larger and clip it to the extent of the smaller layer."""
-    dissolved_layer_one = dissolve_polygon(layer_one)
-    dissolved_layer_two = dissolve_polygon(layer_two) # Dissolve both layers
+def _summed_area(layer: QgsVectorLayer) -> float:
+    """Summed area of the layer features (equals the dissolved area for layers without overlaps)."""
+    request = QgsFeatureRequest().setNoAttributes()
+    return sum(feature.geometry().area() for feature in layer.getFeatures(request) if feature.hasGeometry())
 
-    # Get the area of the dissolved layers
-    area_one = sum([feature.geometry().area() for feature in dissolved_layer_one.getFeatures()])
-    area_two = sum([feature.geometry().area() for feature in dissolved_layer_two.getFeatures()])
 
-    try:
-        if area_one > area_two:
-            clipped_layer_one = simple_clip(layer_one, dissolved_layer_two)
-            QgsMessageLog.logMessage("Larger layer was cliped by smaller one.", "CzLandUseCN",
-                                     level=Qgis.Info, notifyUser=False)
-            return clipped_layer_one, layer_two
+def clip_larger_layer_to_smaller(layer_one: QgsVectorLayer, layer_two: QgsVectorLayer) -> Optional[Tuple[QgsVectorLayer, QgsVectorLayer]]:
+    """"
+    Determine which layer is larger and clip it to the smaller layer.
+    The decision uses summed feature areas, no dissolve. The smaller layer is dissolved only if it has
+    more features and does not fill its extent, otherwise the larger layer is clipped by the extent or not at all.
+    """
+    area_one, area_two = _summed_area(layer_one), _summed_area(layer_two)
 
-        elif area_two > area_one:
-            clipped_layer_two = simple_clip(layer_two, dissolved_layer_one)
-            QgsMessageLog.logMessage("Larger layer was cliped by smaller one.", "CzLandUseCN",
+    try:
+        if math.isclose(area_one, area_two, rel_tol=1e-9):
+            QgsMessageLog.logMessage("Layers have the same area, no clipping needed.", "CzLandUseCN",
                                      level=Qgis.Info, notifyUser=False)
-            return layer_one, clipped_layer_two
+            return layer_one, layer_two
 
+        larger, smaller = (layer_one, layer_two) if area_one > area_two else (layer_two, layer_one)
+        smaller_extent = smaller.extent()
+        if math.isclose(min(area_one, area_two), smaller_extent.area(), rel_tol=1e-9):
+            # The smaller layer fills its extent
+            if smaller_extent.contains(larger.extent()):
+                QgsMessageLog.logMessage("Larger layer lies within the smaller one, no clipping needed.",
+                                         "CzLandUseCN", level=Qgis.Info, notifyUser=False)
+                return layer_one, layer_two
+            overlay = get_polygon_from_extent(smaller_extent.yMinimum(), smaller_extent.xMinimum(),
+                                              smaller_extent.yMaximum(), smaller_extent.xMaximum())
+            overlay.setCrs(smaller.crs())
+        elif smaller.featureCount() > 1:
+            overlay = dissolve_polygon(smaller)
         else:
-            QgsMessageLog.logMessage("Layers have the same area, no clipping needed.", "CzLandUseCN",
-                                     level=Qgis.Info, notifyUser=False)
+            overlay = smaller
 
-            return layer_one, layer_two
+        clipped = simple_clip(larger, overlay)
+        QgsMessageLog.logMessage("Larger layer was cliped by smaller one.", "CzLandUseCN",
+                                 level=Qgis.Info, notifyUser=False)
+        return (clipped, layer_two) if larger is layer_one else (layer_one, clipped)
 
     except Exception as e:
         QgsMessageLog.logMessage(f"Failed to clip layers: {e} - They have to overlap each other!",
                                  "CzLandUseCN", level=Qgis.Critical, notifyUser=True)
         return None
 
+
 def get_polygon_from_extent(ymin: int, xmin: int, ymax: int, xmax: int) -> QgsVectorLayer:
     """Get a polygon from the extent."""
     rect = QgsRectangle(xmin, ymin, xmax, ymax)
@@ -196,40 +301,160 @@ def get_polygon_from_extent(ymin: int, xmin: int, ymax: int, xmax: int) -> QgsVe
     layer.updateExtents()
     return layer
 
-def buffer_QgsVectorLayer(input_layer, distance, segments=10):
+# Geometries buffered by one worker task
+BUFFER_CHUNK = 500
+# Layers with fewer features are buffered in the calling thread
+BUFFER_POOL_MIN_FEATURES = 2 * BUFFER_CHUNK
+BUFFER_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def _buffer_segments(geom: QgsGeometry) -> Optional[int]:
+    """Segments of the buffer for point and line geometries, None for other geometry types."""
+    if geom.wkbType() in (QgsWkbTypes.Point, QgsWkbTypes.MultiPoint):
+        return 5
+    if geom.wkbType() in (QgsWkbTypes.LineString, QgsWkbTypes.MultiLineString):
+        return 2
+    return None
+
+
+def _buffer_chunk(geometries: List[QgsGeometry], distance: float, segments: List[int]) -> List[QgsGeometry]:
+    return [geom.buffer(distance, seg) for geom, seg in zip(geometries, segments)]
+
+
+def _buffer_geometries(layer: QgsVectorLayer, default_buffer: float, controlling_atr_name: Optional[str] = None,
+                       value_distances: Optional[Dict[Any, float]] = None, segments: Optional[int] = None,
+                       request: Optional[QgsFeatureRequest] = None) -> Tuple[List[list], List[QgsGeometry]]:
     """
-    Creates a buffered QgsVectorLayer from an input polygon layer.
+    Buffer the features of the layer, return their attributes and buffers in the order of the layer.
+    The distance is looked up by the controlling_atr_name value in value_distances (default_buffer otherwise).
+    Features are grouped by distance and each group is buffered in chunks, on a thread pool for larger layers
+    (GEOS runs with the GIL released). Without segments only point and line features are buffered.
     """
+    value_distances = value_distances or {}
+    atr_idx = layer.fields().indexFromName(controlling_atr_name) if controlling_atr_name else -1
+
+    attributes, geometries, feature_segments = [], [], []
+    groups: Dict[float, List[int]] = {}
+    for feature in layer.getFeatures(request or QgsFeatureRequest()):
+        geom = feature.geometry()
+        seg = segments if segments is not None else _buffer_segments(geom)
+        if seg is None:
+            QgsMessageLog.logMessage(f"Unsupported geometry type for feature ID {feature.id()}", "CzLandUseCN",
+                                     level=Qgis.Warning, notifyUser=True)
+            continue
+        distance = value_distances.get(feature.attribute(atr_idx), default_buffer) if atr_idx != -1 \
+            else default_buffer
+        groups.setdefault(distance, []).append(len(geometries))
+        attributes.append(feature.attributes())
+        geometries.append(geom)
+        feature_segments.append(seg)
+
+    # Chunks of features with the same buffer distance
+    chunks = [(distance, indices[i:i + BUFFER_CHUNK]) for distance, indices in groups.items()
+              for i in range(0, len(indices), BUFFER_CHUNK)]
+    buffers: List[Optional[QgsGeometry]] = [None] * len(geometries)
+
+    def buffer_chunk(distance, indices):
+        return _buffer_chunk([geometries[i] for i in indices], distance, [feature_segments[i] for i in indices])
+
+    if len(geometries) < BUFFER_POOL_MIN_FEATURES or BUFFER_WORKERS <= 1:
+        results = [buffer_chunk(distance, indices) for distance, indices in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=BUFFER_WORKERS) as executor:
+            results = list(executor.map(lambda chunk: buffer_chunk(*chunk), chunks))
+    for (_, indices), chunk_buffers in zip(chunks, results):
+        for i, buffer in zip(indices, chunk_buffers):
+            buffers[i] = buffer
 
-    # Create a memory layer to store buffered features
-    buffer_layer = QgsVectorLayer("Polygon?crs=" + input_layer.crs().authid(),
-                                  "BufferedLayer", "memory")
-    provider = buffer_layer.dataProvider()
+    return attributes, buffers
 
-    # Copy attributes from input layer
-    fields = input_layer.fields()
-    provider.addAttributes(fields)
-    buffer_layer.updateFields()
 
-    # Process features
-    for feature in input_layer.getFeatures():
-        buffered_geom = feature.geometry().buffer(distance, segments)
+def buffer_features(layer: QgsVectorLayer, output_name: str, default_buffer: float,
+                    controlling_atr_name: Optional[str] = None, value_distances: Optional[Dict[Any, float]] = None,
+                    segments: Optional[int] = None, skip_empty: bool = False) -> Optional[QgsVectorLayer]:
+    """
+    Buffer the features of the layer into a new polygon memory layer with the same attributes
+    (see _buffer_geometries). Returns None if the features can not be stored.
+    """
+    attributes, buffers = _buffer_geometries(layer, default_buffer, controlling_atr_name, value_distances, segments)
 
-        if buffered_geom.isEmpty():
-            continue
+    buffer_layer = QgsVectorLayer(f"Polygon?crs={layer.crs().authid()}", output_name, "memory")
+    buffer_layer.dataProvider().addAttributes(layer.fields())
+    buffer_layer.updateFields()
 
-        # Create new feature with the same attributes
+    # Features keep the order of the input layer
+    new_features = []
+    for buffer, feature_attributes in zip(buffers, attributes):
+        if skip_empty and buffer.isEmpty():
+            continue
         new_feature = QgsFeature()
-        new_feature.setGeometry(buffered_geom)
-        new_feature.setAttributes(feature.attributes())
-
-        # Add feature to buffer layer
-        provider.addFeature(new_feature)
+        new_feature.setGeometry(buffer)
+        new_feature.setAttributes(feature_attributes)
+        new_features.append(new_feature)
 
+    if not buffer_layer.dataProvider().addFeatures(new_features)[0]:
+        QgsMessageLog.logMessage(f"Failed to add features to the buffer layer '{output_name}'.", "CzLandUseCN",
+                                 level=Qgis.Warning, notifyUser=True)
+        return None
     buffer_layer.updateExtents()
-
     return buffer_layer
 
+
+def buffer_and_dissolve(layer: QgsVectorLayer, default_buffer: float, controlling_atr_name: Optional[str] = None,
+                        value_distances: Optional[Dict[Any, float]] = None,
+                        clip_geometry: Optional[QgsGeometry] = None,
+                        controlling_attribute: str = "LandUse_code") -> QgsVectorLayer:
+    """
+    Buffer the point/line features of the layer, dissolve the buffers by controlling_attribute and clip them
+    to clip_geometry in one pass (equivalent to buffering, clipping and dissolve_and_resolve_overlaps).
+    Buffers of each value are unioned in chunks and the chunk unions are unioned again (cascaded union).
+    Only features within the largest buffer distance of clip_geometry are buffered.
+    Dissolved features keep the attributes of the first feature of their value.
+    """
+    request = QgsFeatureRequest()
+    if clip_geometry is not None:
+        rect = clip_geometry.boundingBox()
+        rect.grow(max([default_buffer] + list((value_distances or {}).values())))
+        request.setFilterRect(rect)
+    attributes, buffers = _buffer_geometries(layer, default_buffer, controlling_atr_name, value_distances,
+                                             request=request)
+
+    code_idx = layer.fields().indexFromName(controlling_attribute)
+    groups: Dict[Any, List[int]] = {}
+    for i, feature_attributes in enumerate(attributes):
+        groups.setdefault(feature_attributes[code_idx] if code_idx != -1 else None, []).append(i)
+
+    dissolved_layer = QgsVectorLayer(f"MultiPolygon?crs={layer.crs().authid()}", layer.name(), "memory")
+    dissolved_layer.dataProvider().addAttributes(layer.fields())
+    dissolved_layer.updateFields()
+
+    features = []
+    for indices in groups.values():
+        partial_unions = [QgsGeometry.unaryUnion([buffers[i] for i in indices[j:j + BUFFER_CHUNK]])
+                          for j in range(0, len(indices), BUFFER_CHUNK)]
+        geom = partial_unions[0] if len(partial_unions) == 1 else QgsGeometry.unaryUnion(partial_unions)
+        if clip_geometry is not None:
+            geom = geom.intersection(clip_geometry)
+        geom = _valid_polygon(geom)
+        if geom is None:
+            continue
+        geom.convertToMultiType()
+        feature = QgsFeature(dissolved_layer.fields())
+        feature.setGeometry(geom)
+        feature.setAttributes(attributes[indices[0]])
+        features.append(feature)
+
+    dissolved_layer.dataProvider().addFeatures(features)
+    dissolved_layer.updateExtents()
+    return dissolved_layer
+
+
+def buffer_QgsVectorLayer(input_layer, distance, segments=10):
+    """
+    Creates a buffered QgsVectorLayer from an input polygon layer.
+    """
+    return buffer_features(input_layer, "BufferedLayer", distance, segments=segments, skip_empty=True)
+
 def attribute_layer_edit(layer: QgsVectorLayer, base_use_code: int, controlling_attribute: str,
                          value_increments: dict) -> QgsVectorLayer:
     """
@@ -243,27 +468,18 @@ def attribute_layer_edit(layer: QgsVectorLayer, base_use_code: int, controlling_
                                  level=Qgis.Warning)
         raise ValueError(f"Attribute '{controlling_attribute}' not found in layer fields.")
 
-    layer.startEditing()
-    for feature in layer.getFeatures():
-        code = base_use_code
+    code_idx = layer.fields().indexFromName("LandUse_code")
+    request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes([controlling_attribute], layer.fields())
 
-        # Check if the controlling attribute exists in this feature
-        if controlling_attribute in feature.fields().names():
-            value = feature[controlling_attribute]
-            # Look up the increment in the value_increments dictionary
-            increment = value_increments.get(value, 0)  # Default to 0 if value not found
-            code += increment
-            feature["LandUse_code"] = code
+    attribute_map = {}
+    for feature in layer.getFeatures(request):
+        value = feature[controlling_attribute]
+        # Look up the increment in the value_increments dictionary
+        increment = value_increments.get(value, 0)  # Default to 0 if value not found
+        attribute_map[feature.id()] = {code_idx: base_use_code + increment}
 
-            # Update the feature with the new LandUse_code
-            layer.updateFeature(feature)
-        else:
-            QgsMessageLog.logMessage(
-                f"Attribute '{controlling_attribute}' missing for feature ID {feature.id()} in layer '{layer.name()}'.",
-                "CzLandUseCN", level=Qgis.Warning)
-
-    layer.commitChanges()
-    return layer
+    return change_attribute_values(layer, attribute_map)
 
 
 def attribute_layer_buffer(layer: QgsVectorLayer, controlling_atr_name: str, default_buffer: float,
@@ -277,93 +493,25 @@ def attribute_layer_buffer(layer: QgsVectorLayer, controlling_atr_name: str, def
     If the attribute value is not in values, buffer by default_buffer
     """
 
-    # Flatten the values list
-    flat_values = [item for sublist in values for item in sublist]
-
     # Check if the attribute exists in the layer
     if controlling_atr_name not in layer.fields().names():
         QgsMessageLog.logMessage(f"Attribute '{controlling_atr_name}' not found in layer fields.", "CzLandUseCN",
                                  level=Qgis.Warning)
         raise ValueError(f"Attribute '{controlling_atr_name}' not found in layer fields.")
 
-    # Create a new memory layer to store the buffered features
-    buffer_layer = QgsVectorLayer(f"Polygon?crs={layer.crs().authid()}", f"{input_layer_name}", "memory")
-    buffer_layer.startEditing()
-    buffer_layer.dataProvider().addAttributes(layer.fields())
-    buffer_layer.updateFields()
-
-    for feature in layer.getFeatures():
-        value = feature[controlling_atr_name]
-        if value in flat_values:
-            index = flat_values.index(value)
-            buffer_distance = distances[index // len(values[0])]
-        else:
-            buffer_distance = default_buffer
-
-        # Buffer the feature
-        geom = feature.geometry()
-        if geom.wkbType() == 1 or geom.wkbType() == 4:  # 1 = Point, 4 = Multipoint
-            buffer = geom.buffer(buffer_distance, 5)
-        elif geom.wkbType() == 2 or geom.wkbType() == 5:  # 2 = LineString, 5 = MultiLineString
-            buffer = geom.buffer(buffer_distance, 2)
-        else:
-            QgsMessageLog.logMessage(f"Unsupported geometry type for feature ID {feature.id()}",
-                                     level=Qgis.Warning, notifyUser=True)
-            continue
+    # Distance of each attribute value, a value listed in more levels keeps the first one
+    value_distances = {}
+    for level_values, distance in zip(values, distances):
+        for value in level_values:
+            value_distances.setdefault(value, distance)
 
-        # Create a new feature with the buffered geometry and add it to the buffer layer
-        new_feature = QgsFeature()
-        new_feature.setGeometry(buffer)
-        new_feature.setAttributes(feature.attributes())
-        if not buffer_layer.addFeature(new_feature):
-            QgsMessageLog.logMessage(f"Failed to add feature ID {feature.id()} to the buffer layer.",
-                                     level=Qgis.Warning, notifyUser=True)
-
-    # Commit changes to the buffer layer and add it to the project
-    if not buffer_layer.commitChanges():
-        QgsMessageLog.logMessage("Failed to commit changes to the buffer layer.",
-                                 level=Qgis.Warning, notifyUser=True)
-        return None
-    else:
-        return buffer_layer
+    return buffer_features(layer, f"{input_layer_name}", default_buffer, controlling_atr_name, value_distances)
 
 def apply_simple_buffer(layer: QgsVectorLayer, buffer_distance: float) -> QgsVectorLayer:
     """
     Apply a simple buffer to the input layer
     """
-
-    # Create a new memory layer to store the buffered features
-    buffer_layer = QgsVectorLayer(f"Polygon?crs={layer.crs().authid()}", f"{layer.name()}", "memory")
-    buffer_layer.startEditing()
-    buffer_layer.dataProvider().addAttributes(layer.fields())
-    buffer_layer.updateFields()
-
-    for feature in layer.getFeatures():
-        geom = feature.geometry()
-        if geom.wkbType() == 1 or geom.wkbType() == 4:  # 1 = Point, 4 = Multipoint
-            buffer = geom.buffer(buffer_distance, 5)
-        elif geom.wkbType() == 2 or geom.wkbType() == 5:  # 2 = LineString, 5 = MultiLineString
-            buffer = geom.buffer(buffer_distance, 2)
-        else:
-            QgsMessageLog.logMessage(f"Unsupported geometry type for feature ID {feature.id()}",
-                                     level=Qgis.Warning, notifyUser=True)
-            continue
-
-        # Create a new feature with the buffered geometry and add it to the buffer layer
-        new_feature = QgsFeature()
-        new_feature.setGeometry(buffer)
-        new_feature.setAttributes(feature.attributes())
-        if not buffer_layer.addFeature(new_feature):
-            QgsMessageLog.logMessage(f"Failed to add feature ID {feature.id()} to the buffer layer.",
-                                     level=Qgis.Warning, notifyUser=True)
-
-    # Commit changes to the buffer layer and add it to the project
-    if not buffer_layer.commitChanges():
-        QgsMessageLog.logMessage("Failed to commit changes to the buffer layer.",
-                                 level=Qgis.Warning, notifyUser=True)
-        return None
-    else:
-        return buffer_layer
+    return buffer_features(layer, f"{layer.name()}", buffer_distance)
 
 
 def merge_layers(level_layers: List[QgsVectorLayer], output_name: str) -> Optional[QgsVectorLayer]:
@@ -379,6 +527,163 @@ def merge_layers(level_layers: List[QgsVectorLayer], output_name: str) -> Option
     return None
 
 
+def stack_polygon_layers(layers: List[QgsVectorLayer], output_name: str) -> QgsVectorLayer:
+    """
+    Stack polygon layers in a single pass, layers earlier in the list have higher priority.
+    Each feature is reduced by the union of intersecting features of higher priority layers,
+    candidates are looked up in one spatial index built over all features.
+    """
+    # Fields of all layers (first occurrence wins) + layer/path like native:mergevectorlayers
+    fields = QgsFields()
+    for lyr in layers:
+        for field in lyr.fields():
+            if fields.lookupField(field.name()) == -1:
+                fields.append(field)
+    fields.append(QgsField("layer", QVariant.String))
+    fields.append(QgsField("path", QVariant.String))
+
+    index = QgsSpatialIndex()
+    geometries, priorities, attributes = [], [], []
+    for priority, lyr in enumerate(layers):
+        field_map = [fields.lookupField(field.name()) for field in lyr.fields()]
+        for feature in lyr.getFeatures():
+            geom = feature.geometry()
+            if geom.isNull() or geom.isEmpty():
+                continue
+            geom = geom.makeValid()
+            geom.convertGeometryCollectionToSubclass(QgsWkbTypes.PolygonGeometry)
+            if geom.isEmpty():
+                continue
+
+            values = [None] * fields.count()
+            for src_idx, dst_idx in enumerate(field_map):
+                values[dst_idx] = feature.attribute(src_idx)
+            values[-2], values[-1] = lyr.name(), lyr.source()
+
+            index.addFeature(len(geometries), geom.boundingBox())
+            geometries.append(geom)
+            priorities.append(priority)
+            attributes.append(values)
+
+    stacked_features = []
+    for fid, geom in enumerate(geometries):
+        higher = [c for c in index.intersects(geom.boundingBox()) if priorities[c] < priorities[fid]]
+        if higher:
+            engine = QgsGeometry.createGeometryEngine(geom.constGet())
+            engine.prepareGeometry()
+            overlay = [geometries[c] for c in higher if engine.intersects(geometries[c].constGet())]
+            if overlay:
+                geom = geom.difference(QgsGeometry.unaryUnion(overlay))
+                if geom.isNull() or geom.isEmpty():
+                    continue
+                geom.convertGeometryCollectionToSubclass(QgsWkbTypes.PolygonGeometry)
+        geom.convertToMultiType()
+
+        feature = QgsFeature(fields)
+        feature.setGeometry(geom)
+        feature.setAttributes(attributes[fid])
+        stacked_features.append(feature)
+
+    stacked_layer = QgsVectorLayer(f"MultiPolygon?crs={layers[0].crs().authid()}", output_name, "memory")
+    stacked_layer.dataProvider().addAttributes(fields)
+    stacked_layer.updateFields()
+    stacked_layer.dataProvider().addFeatures(stacked_features)
+    stacked_layer.updateExtents()
+    return stacked_layer
+
+
+def _valid_polygon(geom: QgsGeometry) -> Optional[QgsGeometry]:
+    """Return the fixed polygon part of the geometry, None if nothing is left."""
+    if geom.isNull() or geom.isEmpty():
+        return None
+    geom = geom.makeValid()
+    geom.convertGeometryCollectionToSubclass(QgsWkbTypes.PolygonGeometry)
+    if geom.isNull() or geom.isEmpty() or geom.area() <= 0:
+        return None
+    return geom
+
+
+def overlay_landuse_hsg(landuse_layer: QgsVectorLayer, soil_layer: QgsVectorLayer,
+                        output_name: str = "Intersected LandUse and HSG") -> QgsVectorLayer:
+    """
+    Overlay the land use and soil (HSG) layers.
+    Each land use polygon is intersected only with candidate soil polygons from a spatial index,
+    output carries attributes of both layers (soil fields named like in native:union, duplicates get _2 suffix).
+    Parts of land use polygons not covered by the soil layer are kept (without soil attributes) only if the soil
+    layer is not smaller than the land use layer, as the smaller layer defines the area
+    (see clip_larger_layer_to_smaller).
+    """
+    fields = QgsFields()
+    for field in landuse_layer.fields():
+        fields.append(field)
+    soil_offset = fields.count()
+    for field in soil_layer.fields():
+        name, suffix = field.name(), 2
+        while fields.lookupField(name) != -1:
+            name, suffix = f"{field.name()}_{suffix}", suffix + 1
+        soil_field = QgsField(field)
+        soil_field.setName(name)
+        fields.append(soil_field)
+
+    index = QgsSpatialIndex()
+    soil_geometries, soil_attributes = [], []
+    for feature in soil_layer.getFeatures():
+        geom = _valid_polygon(feature.geometry())
+        if geom is None:
+            continue
+        index.addFeature(len(soil_geometries), geom.boundingBox())
+        soil_geometries.append(geom)
+        soil_attributes.append(feature.attributes())
+    soil_area = sum(geom.area() for geom in soil_geometries)
+
+    landuse = []
+    for feature in landuse_layer.getFeatures():
+        geom = _valid_polygon(feature.geometry())
+        if geom is not None:
+            landuse.append((geom, feature.attributes()))
+    keep_uncovered = soil_area >= sum(geom.area() for geom, _ in landuse)
+
+    empty_soil = [None] * (fields.count() - soil_offset)
+    features = []
+
+    def emit(geom, attributes):
+        geom.convertToMultiType()
+        feature = QgsFeature(fields)
+        feature.setGeometry(geom)
+        feature.setAttributes(attributes)
+        features.append(feature)
+
+    for geom, attributes in landuse:
+        engine = QgsGeometry.createGeometryEngine(geom.constGet())
+        engine.prepareGeometry()
+        covering = []
+        for candidate in index.intersects(geom.boundingBox()):
+            soil_geom = soil_geometries[candidate]
+            if not engine.intersects(soil_geom.constGet()):
+                continue
+            covering.append(soil_geom)
+            if engine.contains(soil_geom.constGet()):
+                piece = QgsGeometry(soil_geom)
+            else:
+                piece = _valid_polygon(geom.intersection(soil_geom))
+                if piece is None:
+                    continue
+            emit(piece, attributes + soil_attributes[candidate])
+
+        if keep_uncovered:
+            rest = geom.difference(QgsGeometry.unaryUnion(covering)) if covering else QgsGeometry(geom)
+            rest = _valid_polygon(rest)
+            if rest is not None:
+                emit(rest, attributes + empty_soil)
+
+    overlay_layer = QgsVectorLayer(f"MultiPolygon?crs={landuse_layer.crs().authid()}", output_name, "memory")
+    overlay_layer.dataProvider().addAttributes(fields)
+    overlay_layer.updateFields()
+    overlay_layer.dataProvider().addFeatures(features)
+    overlay_layer.updateExtents()
+    return overlay_layer
+
+
 class LayerEditor:
     """Class to edit layers based on the configuration files. Creates and modifies LandUse_code attribute. Layers are
     buffered and stacked based on the configuration files."""
@@ -397,76 +702,52 @@ class LayerEditor:
     def add_LPIS_LandUse_code(self, layer: QgsVectorLayer) -> None:
         """Add LandUse code to LPIS layer based on its attributes."""
         try:
-            with open(self.LPIS_config_path , 'r') as file:
-                config = yaml.safe_load(file)
-                # Get the LPIS layer configuration from the YAML file
-                lpis_layer_config = next((layer for layer in config['layers'] if layer['name'] == 'LPIS_layer'), None)
-                if not lpis_layer_config:
-                    QgsMessageLog.logMessage("LPIS layer configuration not found in YAML.", "CzLandUseCN",
-                                             level=Qgis.Warning, notifyUser=True)
-                    return
-
-                base_use_code = lpis_layer_config['base_use_code']
-                controlling_attribute = lpis_layer_config['controlling_attribute']
-                value_increments = lpis_layer_config['value_increments']
-
-                # Check if the controlling attribute exists in the layer
-                layer.startEditing()
-                for feature in layer.getFeatures():
-                    # Get the attribute value from the feature
-                    attribute_value = feature[controlling_attribute]
-                    # Look up the increment in the value_increments dictionary
-                    increment = value_increments.get(attribute_value, 0)
-                    # Calculate the LandUse code
-                    feature["LandUse_code"] = base_use_code + increment
-                    layer.updateFeature(feature)
-                layer.commitChanges()
+            # Get the LPIS layer configuration from the YAML file
+            lpis_layer_config = load_lpis_config(self.LPIS_config_path).code_edits.get('LPIS_layer')
+            if not lpis_layer_config:
+                QgsMessageLog.logMessage("LPIS layer configuration not found in YAML.", "CzLandUseCN",
+                                         level=Qgis.Warning, notifyUser=True)
+                return
+
+            attribute_layer_edit(layer, lpis_layer_config.base_use_code, lpis_layer_config.controlling_attribute,
+                                 lpis_layer_config.value_increments)
 
         except Exception as e:
             QgsMessageLog.logMessage(f"Failed to add LandUse code to LPIS layer: {e}", "CzLandUseCN",
                                      level=Qgis.Warning, notifyUser=True)
 
     def add_landuse_attribute(self, layers: list) -> list:
-        """Add LandUse attribute to layers with the common string."""
+        """
+        Add LandUse attribute to layers with the common string.
+        The code of the last keyword rule matching the layer name is written together with the source layer name
+        in one pass (stored fields, LandUse codes of LPIS and of layers in the ZABAGED config are then edited
+        by their attributes).
+        """
         updated_layers = []
+        matcher = load_landuse_matcher(self.attribute_template_path)
 
         for layer in layers:
             layer_name = layer.name()
+            # LPIS layer gets its codes from its attributes
+            code = matcher.match(layer_name) if layer_name != "LPIS_layer" else None
+
             # add source layer name to the layer
-            if layer.fields().indexFromName("source") == -1:
-                layer.dataProvider().addAttributes([QgsField("source", QVariant.String)])
+            new_fields = [QgsField(name, type_) for name, type_ in
+                          (("source", QVariant.String), ("LandUse_code", QVariant.Int))
+                          if layer.fields().indexFromName(name) == -1]
+            if new_fields:
+                layer.dataProvider().addAttributes(new_fields)
                 layer.updateFields()
-            layer.startEditing()
-            for feature in layer.getFeatures():
-                feature["source"] = layer_name
-                layer.updateFeature(feature)
-            layer.commitChanges()
-
-            data_provider = layer.dataProvider()
-            data_provider.addAttributes([QgsField("LandUse_code", QVariant.Int)])
-            layer.updateFields()
+            values = {layer.fields().indexFromName("source"): layer_name}
+            if code is not None:
+                values[layer.fields().indexFromName("LandUse_code")] = code
+            request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setNoAttributes()
+            change_attribute_values(layer, {feature.id(): values for feature in layer.getFeatures(request)})
 
             if layer_name == "LPIS_layer":
-                # Skip LPIS layer
                 self.add_LPIS_LandUse_code(layer)
-                updated_layers.append(layer)
-                continue
-
-            with open(self.attribute_template_path, "r", encoding="utf-8") as file:
-                data = yaml.safe_load(file)  # Load YAML data
-
-                for entry in data["land_use"]:
-                    names = entry["keywords"]  # Get keyword list
-                    code = entry["code"]  # Get land use code
 
-                    if any(name.lower() in layer_name.lower() for name in names):
-                        layer.startEditing()
-                        for feature in layer.getFeatures():
-                            feature["LandUse_code"] = code
-                            layer.updateFeature(feature)
-                        layer.commitChanges()
-
-                updated_layers.append(layer)  # Always append the layer
+            updated_layers.append(layer)  # Always append the layer
 
         return updated_layers
 
@@ -475,74 +756,108 @@ class LayerEditor:
         new_layers = []
 
         try:
-            with open(self.ZABAGED_config_path , 'r') as file:
-                config = yaml.safe_load(file)
-                buffer_layers_config = config.get('buffer_layers', [])
-
-                for layer in layers: # Iterate over all layers
-                    for layer_config in buffer_layers_config:
-                        if layer.name() == layer_config.get('input_layer_name', ''):
-                            if layer_config['controlling_atr_name'] == "NaN" or layer_config['controlling_atr_name'] == "None"  or layer_config['controlling_atr_name'] == "":
-                                buffered_layer = apply_simple_buffer(layer, layer_config['default_buffer'])
-                            else:
-                                buffered_layer = attribute_layer_buffer(
-                                    layer,
-                                    controlling_atr_name=layer_config['controlling_atr_name'],
-                                    default_buffer=layer_config['default_buffer'],
-                                    priorities=[b['priority'] for b in layer_config['buffer_levels']],
-                                    values=[b['values'] for b in layer_config['buffer_levels']],
-                                    distances=[b['distance'] for b in layer_config['buffer_levels']],
-                                    input_layer_name=layer_config['input_layer_name']
-                                ) # Buffer the layer based on the config
-                            if buffered_layer:
-                                QgsMessageLog.logMessage("Successful buffering: " + layer.name(), "CzLandUseCN",
-                                                         level=Qgis.Info, notifyUser=False)
-                                new_layers.append(buffered_layer)
-                            else:
-                                new_layers.append(layer)  # Keep original if buffering fails
-                            break
-                    else:
-                        new_layers.append(layer)  # If no config matches, keep the original
+            buffer_configs = self.buffer_layers_config()
+
+            for layer in layers: # Iterate over all layers
+                layer_config = buffer_configs.get(layer.name())
+                if layer_config is None:
+                    new_layers.append(layer)  # If no config matches, keep the original
+                    continue
+                if layer_config.controlling_atr_name is None:
+                    buffered_layer = apply_simple_buffer(layer, layer_config.default_buffer)
+                else:
+                    buffered_layer = attribute_layer_buffer(
+                        layer,
+                        controlling_atr_name=layer_config.controlling_atr_name,
+                        default_buffer=layer_config.default_buffer,
+                        priorities=layer_config.priorities,
+                        values=layer_config.values,
+                        distances=layer_config.distances,
+                        input_layer_name=layer_config.input_layer_name
+                    ) # Buffer the layer based on the config
+                if buffered_layer:
+                    QgsMessageLog.logMessage("Successful buffering: " + layer.name(), "CzLandUseCN",
+                                             level=Qgis.Info, notifyUser=False)
+                    new_layers.append(buffered_layer)
+                else:
+                    new_layers.append(layer)  # Keep original if buffering fails
 
         except Exception as e:
             QgsMessageLog.logMessage(f"Failed to buffer layers: {e}", "CzLandUseCN", level=Qgis.Warning,
                                      notifyUser=True)
-            new_layers.extend(layers)  # Keep original layers if error occurs
+            new_layers = list(layers)  # Keep original layers if error occurs
+
+        return new_layers
+
+    def buffer_layers_config(self) -> Dict[str, BufferLayer]:
+        """Return the buffer_layers entries of the ZABAGED config by their input layer name."""
+        return load_zabaged_config(self.ZABAGED_config_path).buffer_layers
+
+    def _clip_geometry(self) -> Optional[QgsGeometry]:
+        """Return the area the layers are clipped to (extent or polygon by AreaFlag)."""
+        if not self.AreaFlag:
+            return QgsGeometry.fromRect(QgsRectangle(self.xmin, self.ymin, self.xmax, self.ymax))
+        if not self.polygon:
+            return None
+        return QgsGeometry.unaryUnion([feature.geometry().makeValid() for feature in self.polygon.getFeatures()])
+
+    def buffer_and_dissolve_layers(self, layers: list) -> list:
+        """
+        Buffer the layers listed in buffer_layers of the ZABAGED config, dissolve them by LandUse_code and clip them
+        in one pass (replaces buffer_layers, clip_layers_after_edits and resolve_overlaping_buffers for these
+        layers). Other layers are returned unchanged.
+        """
+        buffer_configs = self.buffer_layers_config()
+        clip_geometry = self._clip_geometry()
+
+        new_layers = []
+        for layer in layers:
+            layer_config = buffer_configs.get(layer.name())
+            if layer_config is None:
+                new_layers.append(layer)
+                continue
+            try:
+                controlling_atr_name = layer_config.controlling_atr_name
+                if controlling_atr_name is not None and controlling_atr_name not in layer.fields().names():
+                    raise ValueError(f"Attribute '{controlling_atr_name}' not found in layer fields.")
+
+                new_layers.append(buffer_and_dissolve(layer, layer_config.default_buffer, controlling_atr_name,
+                                                      layer_config.value_distances, clip_geometry))
+                QgsMessageLog.logMessage("Successful buffering: " + layer.name(), "CzLandUseCN",
+                                         level=Qgis.Info, notifyUser=False)
+            except Exception as e:
+                QgsMessageLog.logMessage(f"Failed to buffer layer {layer.name()}: {e}", "CzLandUseCN",
+                                         level=Qgis.Warning, notifyUser=True)
+                new_layers.extend(self.clip_layers_after_edits([layer]))  # Keep the original layer, clipped
 
         return new_layers
 
     def edit_landuse_code(self, layers: list) -> list:
         """Edit ZABAGED layers LandUse code by its attributes."""
         new_layers = []
+        code_edits = load_zabaged_config(self.ZABAGED_config_path).code_edits
 
         for layer in layers:  # Iterate over all layers
+            layer_config = code_edits.get(layer.name())
+            if layer_config is None:
+                new_layers.append(layer)  # If no match, keep original
+                continue
             try:
-                with open(self.ZABAGED_config_path, 'r') as ATRfile:
-                    ATRconfig = yaml.safe_load(ATRfile)
-
-                    matched = False
-                    for layer_config in ATRconfig['layers']:  # Iterate over all layers in the config
-                        if layer.name() == layer_config.get('name', ''):
-                            edited_layer = attribute_layer_edit(
-                                layer,
-                                base_use_code=layer_config['base_use_code'],
-                                controlling_attribute=layer_config['controlling_attribute'],
-                                value_increments=layer_config['value_increments']
-                            )  # Edit the layer based on the config
-                            if edited_layer:
-                                new_layers.append(edited_layer)
-                                QgsMessageLog.logMessage("LandUse code attribute edit at: " + layer.name(),
-                                                         "CzLandUseCN",
-                                                         level=Qgis.Info, notifyUser=False)
-                            else:
-                                new_layers.append(layer)  # Keep original if editing fails
-                                QgsMessageLog.logMessage(f"/ERROR/ Layer {layer.name()} trashed.", "CzLandUseCN",
-                                                         level=Qgis.Warning, notifyUser=True)
-                            matched = True
-                            break
-
-                    if not matched:
-                        new_layers.append(layer)  # If no match, keep original
+                edited_layer = attribute_layer_edit(
+                    layer,
+                    base_use_code=layer_config.base_use_code,
+                    controlling_attribute=layer_config.controlling_attribute,
+                    value_increments=layer_config.value_increments
+                )  # Edit the layer based on the config
+                if edited_layer:
+                    new_layers.append(edited_layer)
+                    QgsMessageLog.logMessage("LandUse code attribute edit at: " + layer.name(),
+                                             "CzLandUseCN",
+                                             level=Qgis.Info, notifyUser=False)
+                else:
+                    new_layers.append(layer)  # Keep original if editing fails
+                    QgsMessageLog.logMessage(f"/ERROR/ Layer {layer.name()} trashed.", "CzLandUseCN",
+                                             level=Qgis.Warning, notifyUser=True)
 
             except Exception as e:
                 QgsMessageLog.logMessage(f"Failed to edit layer {layer.name()}: {e}", "CzLandUseCN", level=Qgis.Warning,
@@ -552,10 +867,11 @@ class LayerEditor:
         return new_layers
 
 
-    def clip_layers_after_edits(self, layers: list) -> list:
+    def clip_layers_after_edits(self, layers: list, skip_names: Iterable[str] = ()) -> list:
         """
         Clip all layers in list to the given extent or polygon.
         Ensures the number of layers in the output matches the input.
+        Layers named in skip_names (already clipped) are kept as they are.
         (Used mainly after buffering)
         """
 
@@ -565,6 +881,9 @@ class LayerEditor:
 
         for layer in layers:
             layer_name = layer.name()
+            if layer_name in skip_names:
+                clipped_layers.append(layer)
+                continue
             clipped_layer = None
 
             if not self.AreaFlag:  # Clip by extent
@@ -602,8 +921,8 @@ class LayerEditor:
     def stack_layers(self, layers: List[QgsVectorLayer]) -> Optional[QgsVectorLayer]:
         """
         Stack polygon layers by priority, clipping overlaps.
-        Before each union, remove null/empty geometries, fix invalid ones,
-        and (optionally) check validity to avoid 'Could not write feature' errors.
+        Geometries are fixed and each feature is clipped by overlapping features
+        of higher priority layers (see stack_polygon_layers).
         """
 
         # 1) Read stacking order
@@ -628,120 +947,10 @@ class LayerEditor:
                                      "CzLandUseCN", level=Qgis.Critical)
             return None
 
-        processed = []
-        accum_union = None
-
-        for idx, lyr in enumerate(ordered):
-            fixed_lyr_gpkg = processing.run(
-                "native:fixgeometries",
-                {'INPUT': lyr,
-                 # 'OUTPUT': 'memory:fixed'
-                 'OUTPUT': QgsProcessingUtils.generateTempFilename(f'fixed_{lyr.name()}.gpkg')
-                 }
-            )['OUTPUT']
-            fixed_lyr = QgsVectorLayer(fixed_lyr_gpkg, "fixed", "ogr")
-
-            # A) First layer: clone to avoid altering source
-            if idx == 0:
-                clipped = fixed_lyr.clone()
-            else:
-                # B) Subtract higher-priority areas
-                clipped_gpkg = processing.run(
-                    "native:difference",
-                    {
-                        'INPUT': fixed_lyr,
-                        'OVERLAY': accum_union,
-                        # 'OUTPUT': 'memory:clipped'
-                        'OUTPUT': QgsProcessingUtils.generateTempFilename(f'diff_{lyr.name()}.gpkg')
-                    }
-                )['OUTPUT']
-                clipped = QgsVectorLayer(clipped_gpkg, "clipped", "ogr")
-
-            # C) Remove null & empty geometries (essential!)
-            clipped_gpkg = processing.run(
-                "native:removenullgeometries",
-                {
-                    'INPUT': clipped,
-                    # 'OUTPUT': 'memory:clean_clipped'
-                    'OUTPUT': QgsProcessingUtils.generateTempFilename(f'clean_clipped_{lyr.name()}.gpkg')
-                }
-            )['OUTPUT']
-
-            clipped = QgsVectorLayer(clipped_gpkg, "clipped", "ogr")
-
-            # E) Append for later merging (post-clean)
-            processed.append(clipped)
-
-            # F) Build/update running union
-            if accum_union is None:
-                accum_union = clipped.clone()
-            else:
-                # 1) Fix geometries on both sides
-                fixed_acc_gpkg = processing.run(
-                    "native:fixgeometries",
-                    {'INPUT': accum_union,
-                     # 'OUTPUT': 'memory:fixed_acc'
-                     'OUTPUT': QgsProcessingUtils.generateTempFilename(f'fixed_acc_{lyr.name()}.gpkg')
-                    }
-                )['OUTPUT']
-                fixed_acc = QgsVectorLayer(fixed_acc_gpkg, "fixed_acc", "ogr")
-
-                fixed_clip_gpkg = processing.run(
-                    "native:fixgeometries",
-                    {'INPUT': clipped,
-                     # 'OUTPUT': 'memory:fixed_clip'
-                     'OUTPUT': QgsProcessingUtils.generateTempFilename(f'fixed_clip_{lyr.name()}.gpkg')
-                    }
-                )['OUTPUT']
-                fixed_clip = QgsVectorLayer(fixed_clip_gpkg, "fixed_clip", "ogr")
-
-                # 2) Finally union the clean, valid inputs
-                try:
-                    accum_union_gpkg = processing.run(
-                        "native:union",
-                        {
-                            'INPUT': fixed_acc,
-                            'OVERLAY': fixed_clip,
-                            # https://github.com/qgis/QGIS/issues/57279
-                            'OUTPUT': QgsProcessingUtils.generateTempFilename(f'accum_union_{lyr.name()}.gpkg')
-                            # 'OUTPUT': 'memory:accum_union'
-                        }
-                    )['OUTPUT']
-                    del fixed_acc
-                    del fixed_clip
-                    accum_union_tmp = QgsVectorLayer(accum_union_gpkg, "accum_union", "ogr")
-
-                    fixed_accum_union = processing.run(
-                        "native:fixgeometries",
-                        {'INPUT': accum_union_tmp,
-                         # 'OUTPUT': 'memory:fixed'
-                         'OUTPUT': QgsProcessingUtils.generateTempFilename(f'fixed_accum_union_{lyr.name()}.gpkg')
-                         }
-                    )['OUTPUT']
-                    accum_union = QgsVectorLayer(fixed_lyr_gpkg, "fixed_accum_union", "ogr")
-                except:
-                    continue
-
-            QgsMessageLog.logMessage(
-                f"Layer '{lyr.name()}' processed ({idx + 1}/{len(ordered)})",
-                "CzLandUseCN", level=Qgis.Info
-            )
-
-        del accum_union
-
-        # 4) Merge all non-overlapping pieces
-        final_gpkg = processing.run(
-            "native:mergevectorlayers",
-            {
-                'LAYERS': processed,
-                'CRS': processed[0].crs().toWkt(),
-                #'OUTPUT': 'memory:Stacked_NoOverlap'
-                'OUTPUT': QgsProcessingUtils.generateTempFilename(f'stacked_nooverlap.gpkg')
-            }
-        )['OUTPUT']
-        final = QgsVectorLayer(final_gpkg, "final", "ogr")
+        # 3) Clip overlaps in one pass
+        final = stack_polygon_layers(ordered, "LandUse Layer")
 
-        # 5) Style & add to project
+        # 4) Style & add to project
         final = self.apply_symbology(final)
         final.setName("LandUse Layer")
         final.triggerRepaint()
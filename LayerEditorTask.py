@@ -1,7 +1,8 @@
 from qgis.PyQt.QtCore import pyqtSignal
-from qgis.core import QgsTask, QgsMessageLog, Qgis
+from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsRectangle
 
-from .LayerEditor import LayerEditor, resolve_overlaping_buffers
+from .LayerEditor import LayerEditor
+from .WFSdownloader import WFSDownloader
 
 class TASK_edit_layers(QgsTask):
     """Task to process WFS layers."""
@@ -12,7 +13,7 @@ class TASK_edit_layers(QgsTask):
 
     def __init__(self, attribute_template_path, LPIS_config_path, ZABAGED_config_path, stacking_template_path,
                  symbology_path, AreaFlag, polygon, ymin, xmin, ymax, xmax, progress_bar, abortButtton,
-                 LandUseLayers):
+                 LandUseLayers, pretiled=None):
 
         super().__init__("Edit WFS Layers", QgsTask.CanCancel)
         self.attribute_template_path = attribute_template_path
@@ -28,6 +29,7 @@ class TASK_edit_layers(QgsTask):
         self.LandUseLayers = LandUseLayers
         self._is_canceled = False
         self.merged_layer = None
+        self.pretiled = pretiled  # optional GeoPackage of precomputed land use tiles (see LandUseTiles)
         if self.abortButton is not None:
             self.abortButton.clicked.connect(self.cancel)
 
@@ -52,6 +54,20 @@ class TASK_edit_layers(QgsTask):
                                        self.symbology_path, self.AreaFlag, self.polygon, self.ymin, self.xmin, self.ymax,
                                        self.xmax)
 
+            if self.pretiled:
+                # Clip the precomputed land use tiles instead of editing and stacking the layers
+                wfs_downloader = WFSDownloader(self.stacking_template_path, self.AreaFlag, self.polygon, False)
+                pretiled_layer = wfs_downloader.load_pretiled_layer(
+                    self.pretiled, QgsRectangle(self.xmin, self.ymin, self.xmax, self.ymax))
+                if pretiled_layer is not None:
+                    pretiled_layer.setName("LandUse Layer")
+                    self.merged_layer = layer_editor.apply_symbology(pretiled_layer)
+                    return True
+                if not self.LandUseLayers:
+                    QgsMessageLog.logMessage("Land use tiles do not cover the area and no layers were downloaded.",
+                                             "CzLandUseCN", level=Qgis.Warning, notifyUser=True)
+                    return False
+
             self._update_progress_bar(10)
 
             # Add LandUse attribute to all layers in list
@@ -63,20 +79,17 @@ class TASK_edit_layers(QgsTask):
 
             self._update_progress_bar(20)
 
-            # Add buffer line features to all layers in list
-            self.LandUseLayers = layer_editor.buffer_layers(self.LandUseLayers)
-
-            self._update_progress_bar(40)
             # Update LandUse code based on its attributes
             self.LandUseLayers = layer_editor.edit_landuse_code(self.LandUseLayers)
 
-            self._update_progress_bar(60)
-            # Clip all layer to the polygon or extent by AreaFlag (Used as clip after buffering)
-            self.LandUseLayers = layer_editor.clip_layers_after_edits(self.LandUseLayers)
+            self._update_progress_bar(40)
+            # Buffer line features, dissolve the buffers by LandUse code and clip them in one pass
+            self.LandUseLayers = layer_editor.buffer_and_dissolve_layers(self.LandUseLayers)
 
-            self._update_progress_bar(80)
-            # Resolve overlaping buffered lines
-            self.LandUseLayers = resolve_overlaping_buffers(self.LandUseLayers, self.ZABAGED_config_path)
+            self._update_progress_bar(60)
+            # Clip the other layers to the polygon or extent by AreaFlag
+            self.LandUseLayers = layer_editor.clip_layers_after_edits(self.LandUseLayers,
+                                                                      layer_editor.buffer_layers_config())
 
             self._update_progress_bar(90)
             # Store the merged layer as an instance attribute to keep it in scope
@@ -0,0 +1,236 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import yaml
+
+
+class LandUseRule(NamedTuple):
+    """Entry of land_use in zabaged_to_LandUseCode_table.yaml."""
+    keywords: Tuple[str, ...]  # lower case, matched as substrings of the layer name
+    code: int
+
+
+class LandUseMatcher:
+    """
+    Keyword rules compiled into one regular expression resolving a layer name to its LandUse code.
+    A later rule wins over an earlier one when keywords of several rules occur in the name.
+    """
+
+    def __init__(self, rules: Tuple[LandUseRule, ...]):
+        # One group per rule, the last rule first: at every position of the name the lookahead matches the group
+        # of the last rule with a keyword starting there, the highest rule index over all positions wins
+        indexed = [(i, rule) for i, rule in enumerate(rules) if rule.keywords][::-1]
+        self._rule_index = [i for i, _ in indexed]
+        self._codes = [rule.code for rule in rules]
+        alternatives = ["(" + "|".join(re.escape(keyword) for keyword in rule.keywords) + ")" for _, rule in indexed]
+        self._pattern = re.compile("(?=" + "|".join(alternatives) + ")") if alternatives else None
+
+    def match(self, layer_name: str) -> Optional[int]:
+        """Return the LandUse code of the layer name, None if no keyword occurs in it."""
+        if self._pattern is None:
+            return None
+        matched = [self._rule_index[match.lastindex - 1] for match in self._pattern.finditer(layer_name.lower())]
+        return self._codes[max(matched)] if matched else None
+
+
+class CodeEdit(NamedTuple):
+    """Entry of layers in ZABAGED.yaml / LPIS.yaml, LandUse_code = base_use_code + increment of the attribute value."""
+    name: str
+    base_use_code: int
+    controlling_attribute: str
+    value_increments: Dict[Any, int]
+
+
+class BufferLayer(NamedTuple):
+    """Entry of buffer_layers in ZABAGED.yaml."""
+    input_layer_name: str
+    controlling_atr_name: Optional[str]  # None for a simple buffer by default_buffer
+    default_buffer: float
+    priorities: List[str]
+    values: List[list]
+    distances: List[float]
+    value_distances: Dict[Any, float]  # a value listed in more levels keeps the first distance
+
+
+class ZabagedConfig(NamedTuple):
+    uri: Optional[str]
+    download_workers: int
+    buffer_layers: Dict[str, BufferLayer]
+    code_edits: Dict[str, CodeEdit]
+
+
+class LPISConfig(NamedTuple):
+    uri: Optional[str]
+    layer_name: Optional[str]
+    code_edits: Dict[str, CodeEdit]
+
+
+class WPSConfig(NamedTuple):
+    """Soil.yaml / WPS_config.yaml"""
+    url: Optional[str]
+    process_identifier: Optional[str]
+
+
+# Parsed configs by (absolute path, parser), reused until the file is modified
+_configs: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+_configs_lock = threading.Lock()
+
+
+def _cached(path: str, parser: Callable[[str, dict], Any]) -> Any:
+    path = os.path.abspath(path)
+    key = (path, parser.__name__)
+    mtime = os.path.getmtime(path)
+    with _configs_lock:
+        cached = _configs.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+    with open(path, 'r', encoding='utf-8') as file:
+        data = yaml.safe_load(file) or {}
+    if not isinstance(data, dict):
+        raise ValueError(f"Config {path} is not a YAML mapping")
+    config = parser(path, data)
+    with _configs_lock:
+        _configs[key] = (mtime, config)
+    return config
+
+
+def _raw(path: str, data: dict) -> dict:
+    return data
+
+
+def _require(path: str, entry: dict, keys: Tuple[str, ...], section: str) -> None:
+    missing = [key for key in keys if key not in entry]
+    if missing:
+        raise ValueError(f"Config {path}: {section} entry {entry} is missing {', '.join(missing)}")
+
+
+def _code_edits(path: str, data: dict) -> Dict[str, CodeEdit]:
+    code_edits = {}
+    for entry in data.get('layers') or []:
+        _require(path, entry, ('name', 'base_use_code', 'controlling_attribute', 'value_increments'), "layers")
+        # A layer listed more times keeps its first entry
+        code_edits.setdefault(entry['name'], CodeEdit(entry['name'], int(entry['base_use_code']),
+                                                      entry['controlling_attribute'],
+                                                      dict(entry['value_increments'] or {})))
+    return code_edits
+
+
+def _buffer_layer(path: str, entry: dict) -> BufferLayer:
+    _require(path, entry, ('input_layer_name', 'controlling_atr_name', 'default_buffer'), "buffer_layers")
+    controlling_atr_name = entry['controlling_atr_name']
+    if controlling_atr_name in ("NaN", "None", "", None):
+        controlling_atr_name = None
+    levels = entry.get('buffer_levels') or []
+    if controlling_atr_name is not None and not levels:
+        raise ValueError(f"Config {path}: buffer_levels of {entry['input_layer_name']} are missing")
+    for level in levels:
+        _require(path, level, ('values', 'distance'), "buffer_levels")
+
+    value_distances = {}
+    for level in levels:
+        for value in level['values']:
+            value_distances.setdefault(value, float(level['distance']))
+    return BufferLayer(entry['input_layer_name'], controlling_atr_name, float(entry['default_buffer']),
+                       [level.get('priority') for level in levels], [level['values'] for level in levels],
+                       [level['distance'] for level in levels], value_distances)
+
+
+def _zabaged_config(path: str, data: dict) -> ZabagedConfig:
+    buffer_layers = {}
+    for entry in data.get('buffer_layers') or []:
+        buffer_layer = _buffer_layer(path, entry)
+        buffer_layers.setdefault(buffer_layer.input_layer_name, buffer_layer)  # first entry wins
+    return ZabagedConfig(data.get('URI'), int(data.get('download_workers') or 1), buffer_layers,
+                         _code_edits(path, data))
+
+
+def _lpis_config(path: str, data: dict) -> LPISConfig:
+    return LPISConfig(data.get('URI'), data.get('layer_name'), _code_edits(path, data))
+
+
+def _wps_config(path: str, data: dict) -> WPSConfig:
+    return WPSConfig(data.get('URL', data.get('URI')), data.get('process_identifier'))
+
+
+def _landuse_rules(path: str, data: dict) -> Tuple[LandUseRule, ...]:
+    if 'land_use' not in data:
+        raise ValueError(f"Config {path} has no land_use list")
+    rules = []
+    for entry in data['land_use']:
+        _require(path, entry, ('keywords', 'code'), "land_use")
+        keywords = tuple(dict.fromkeys(str(keyword).lower() for keyword in entry['keywords']))
+        rules.append(LandUseRule(keywords, int(entry['code'])))
+    return tuple(rules)
+
+
+def _landuse_matcher(path: str, data: dict) -> LandUseMatcher:
+    return LandUseMatcher(_landuse_rules(path, data))
+
+
+def load_yaml(path: str) -> dict:
+    """Return the parsed YAML file (shared, do not modify)."""
+    return _cached(path, _raw)
+
+
+def load_zabaged_config(path: str) -> ZabagedConfig:
+    """Return the validated ZABAGED.yaml (download, buffer and LandUse code edit settings)."""
+    return _cached(path, _zabaged_config)
+
+
+def load_lpis_config(path: str) -> LPISConfig:
+    """Return the validated LPIS.yaml."""
+    return _cached(path, _lpis_config)
+
+
+def load_wps_config(path: str) -> WPSConfig:
+    """Return the WPS service settings (Soil.yaml, WPS_config.yaml)."""
+    return _cached(path, _wps_config)
+
+
+def load_landuse_rules(path: str) -> Tuple[LandUseRule, ...]:
+    """Return the land use keyword rules of zabaged_to_LandUseCode_table.yaml in the file order."""
+    return _cached(path, _landuse_rules)
+
+
+def load_landuse_matcher(path: str) -> LandUseMatcher:
+    """Return the land use keyword rules of zabaged_to_LandUseCode_table.yaml compiled into a LandUseMatcher."""
+    return _cached(path, _landuse_matcher)
+
+
+def required_attributes(zabaged: ZabagedConfig, lpis: Optional[LPISConfig] = None) -> Dict[str, Tuple[str, ...]]:
+    """
+    Return the attributes read from each typename during the LandUse processing (controlling attributes of
+    buffer_layers and LandUse code edits). Typenames missing in the result are used by their geometry only.
+    """
+    attributes: Dict[str, Dict[str, None]] = {}  # dict keeps the config order without duplicates
+    for buffer_layer in zabaged.buffer_layers.values():
+        if buffer_layer.controlling_atr_name is not None:
+            attributes.setdefault(buffer_layer.input_layer_name, {})[buffer_layer.controlling_atr_name] = None
+    for code_edit in zabaged.code_edits.values():
+        attributes.setdefault(code_edit.name, {})[code_edit.controlling_attribute] = None
+    if lpis is not None and lpis.layer_name:
+        # LPIS edits refer to the downloaded layer by its name in the stack (LPIS_layer)
+        for code_edit in lpis.code_edits.values():
+            attributes.setdefault(lpis.layer_name, {})[code_edit.controlling_attribute] = None
+    return {name: tuple(names) for name, names in attributes.items()}
+
+
+# Loaders of the config files by file name
+CONFIG_LOADERS = {
+    'ZABAGED.yaml': load_zabaged_config,
+    'LPIS.yaml': load_lpis_config,
+    'Soil.yaml': load_wps_config,
+    'WPS_config.yaml': load_wps_config,
+    'zabaged_to_LandUseCode_table.yaml': load_landuse_matcher,
+}
+
+
+def preload_configs(config_dir: str) -> None:
+    """Load and validate the configs present in the config directory (raises ValueError/IOError if invalid)."""
+    for file_name, loader in CONFIG_LOADERS.items():
+        path = os.path.join(config_dir, file_name)
+        if os.path.exists(path):
+            loader(path)
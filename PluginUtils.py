@@ -1,14 +1,17 @@
 from qgis.core import QgsMessageLog, Qgis
-import yaml
 from typing import Optional
 
+# Based on the environment, import the PluginConfig module
+try:
+    from .PluginConfig import load_yaml
+except ImportError:
+    from PluginConfig import load_yaml
+
 
 def get_string_from_yaml(path: str, key: str) -> Optional[str]:
-    """ Get a string from a YAML file"""
+    """ Get a string from a YAML file (parsed once until the file is modified)"""
     try:
-        with open(path, 'r') as file:
-            config = yaml.safe_load(file)
-            return config.get(key)
+        return load_yaml(path).get(key)
     except Exception as e:
         QgsMessageLog.logMessage(f"Failed to load {key} from {path}: {e}", "CzLandUseCN", level=Qgis.Warning, notifyUser=True)
         return None
\ No newline at end of file
@@ -1,10 +1,12 @@
 import csv
 
+import numpy as np
 from PyQt5.QtCore import QVariant
-from qgis.core import QgsMessageLog, Qgis, QgsField, edit, QgsVectorLayer, QgsProject, QgsVectorFileWriter
+from qgis.core import (QgsMessageLog, Qgis, QgsField, edit, QgsVectorLayer, QgsProject, QgsVectorFileWriter,
+                       QgsFeatureRequest)
 from qgis.utils import iface
 from string import Template
-from typing import List, Optional, Union, Dict, Tuple
+from typing import List, Optional, Union, Dict, Tuple, NamedTuple
 import os
 import requests
 import tempfile
@@ -14,11 +16,38 @@ import processing
 
 from osgeo import ogr as osgeo_ogr
 try:
-    from .PluginUtils import get_string_from_yaml
+    from .PluginConfig import load_wps_config
     from .LayerEditor import dissolve_polygon, buffer_QgsVectorLayer
 except ImportError:
-    from PluginUtils import get_string_from_yaml
+    from PluginConfig import load_wps_config
     from LayerEditor import dissolve_polygon, buffer_QgsVectorLayer
+
+# Rainfall distribution shapes (hyetographs) returned by the WPS service
+HYETOGRAPH_SHAPES = ("A", "B", "C", "D", "E", "F")
+
+
+def _to_float_array(values: list) -> np.ndarray:
+    """Convert attribute values to a float array, NULL and non-numeric values become NaN."""
+    out = np.full(len(values), np.nan, dtype=float)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+class RunOffCoefficients(NamedTuple):
+    """P_/QAPI_ coefficients parsed from the first row of the WPS output table."""
+    p_shape: Dict[str, np.ndarray]  # reoccurrence -> P_<reoccurrence>tvar<shape>_% for every shape
+    p_cn2: np.ndarray  # QAPI_tvar<shape> for every shape (CN2 part, CN3 part is 1 - QAPI)
+
+    def weights(self, reoccurrence: str) -> Tuple[float, float]:
+        """Return the summed CN2 and CN3 volume weights for the given reoccurrence interval."""
+        p_shape = self.p_shape[reoccurrence]
+        return float(np.sum(self.p_cn2 * p_shape)), float(np.sum((1 - self.p_cn2) * p_shape))
+
+
 class RunOffComputer:
     """
     Class to compute runoff volume and height based on curve numbers (CN2, CN3) and rainfall depth.
@@ -157,22 +186,10 @@ class RunOffComputer:
 
         return CN2_h, CN3_h, CN2_vol, CN3_vol
 
-    def calculate_base_runoffs(self) -> None:
+    def _get_base_runoff_targets(self) -> List[Tuple[float, Tuple[str, str, str, str]]]:
         """
-        Calculate the base runoff values for CN2 and CN3.
-
-        This method computes runoff heights and volumes for each feature in the runoff layer
-        based on CN2, CN3, area, and rainfall depth. The results are stored in the corresponding
-        fields of the layer.
+        Return the rainfall depths with the names of their CN2/CN3 runoff height and volume fields.
         """
-
-        # Validate that the layer is properly loaded
-        if not self.runoff_layer.isValid():
-            raise ValueError("Layer is not valid")
-
-        # Start editing the layer to allow modifications
-        self.runoff_layer.startEditing()
-
         # Decide on the list of rainfall heights and their occurrences
         heights: List[float] = self.user_defined_height if self.RunOffFlag else list(self._get_height_dict().values())
         occurrences = (
@@ -181,22 +198,95 @@ class RunOffComputer:
             else self._get_height_dict().keys()
         )
 
-        # Iterate over each height and occurrence
-        for idx, occurrence in zip(heights, occurrences):
+        targets = []
+        for height, occurrence in zip(heights, occurrences):
             # Build the field names for runoff height and volume
             if len(heights) > 1:
-                fn_h2 = f"CN2_{occurrence}_runoff_height_mm"
-                fn_h3 = f"CN3_{occurrence}_runoff_height_mm"
-                fn_v2 = f"CN2_{occurrence}_runoff_volume_m3"
-                fn_v3 = f"CN3_{occurrence}_runoff_volume_m3"
+                names = (f"CN2_{occurrence}_runoff_height_mm", f"CN3_{occurrence}_runoff_height_mm",
+                         f"CN2_{occurrence}_runoff_volume_m3", f"CN3_{occurrence}_runoff_volume_m3")
             else:
-                fn_h2, fn_h3, fn_v2, fn_v3 = (
-                    "CN2_runoff_height_mm",
-                    "CN3_runoff_height_mm",
-                    "CN2_runoff_volume_m3",
-                    "CN3_runoff_volume_m3",
-                )
+                names = ("CN2_runoff_height_mm", "CN3_runoff_height_mm",
+                         "CN2_runoff_volume_m3", "CN3_runoff_volume_m3")
+            targets.append((float(height), names))
+        return targets
 
+    def calculate_base_runoffs(self) -> None:
+        """
+        Calculate the base runoff values for CN2 and CN3.
+
+        CN2, CN3 and SHAPE_Area are read into arrays once, runoff heights and volumes are computed
+        for all features and rainfall depths in one broadcast and the results are written back
+        with a single data provider call.
+        """
+
+        # Validate that the layer is properly loaded
+        if not self.runoff_layer.isValid():
+            raise ValueError("Layer is not valid")
+
+        targets = self._get_base_runoff_targets()
+        if not targets:
+            return
+
+        fields = self.runoff_layer.fields()
+        target_idx = []
+        for _, names in targets:
+            for name in names:
+                if fields.indexFromName(name) == -1:
+                    raise ValueError(f"Field '{name}' not found in layer")
+            target_idx.append([fields.indexFromName(name) for name in names])
+
+        # Pull the input columns in one pass without geometries
+        source_idx = [fields.indexFromName(name) for name in ("CN2", "CN3", "SHAPE_Area")]
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(source_idx)
+        fids, columns = [], ([], [], [])
+        for feat in self.runoff_layer.getFeatures(request):
+            fids.append(feat.id())
+            attrs = feat.attributes()
+            for values, idx in zip(columns, source_idx):
+                values.append(attrs[idx])
+        cn2, cn3, area = (_to_float_array(values) for values in columns)
+
+        # Skip features with invalid CN values
+        valid = (cn2 > 0) & (cn3 > 0)
+        for i in np.flatnonzero(~valid).tolist():
+            QgsMessageLog.logMessage(
+                f"Invalid CN at feature {fids[i]}", "CzLandUseCN", Qgis.Warning
+            )
+        valid_rows = np.flatnonzero(valid)
+        if valid_rows.size == 0:
+            return
+
+        # Compute every height/volume for all rainfall depths at once, shape (depths, features)
+        rainfall = np.array([height for height, _ in targets], dtype=float)[:, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            results = self._calculate_runoff_volume(cn2[valid_rows], cn3[valid_rows], area[valid_rows], rainfall)
+
+        valid_fids = [fids[i] for i in valid_rows.tolist()]
+        attribute_map: Dict[int, Dict[int, float]] = {fid: {} for fid in valid_fids}
+        for row, indices in enumerate(target_idx):
+            for idx, values in zip(indices, results):
+                for fid, value in zip(valid_fids, values[row].tolist()):
+                    attribute_map[fid][idx] = value
+
+        if not self.runoff_layer.dataProvider().changeAttributeValues(attribute_map):
+            raise IOError("Failed to write base runoff values")
+        self.runoff_layer.triggerRepaint()
+
+    def _calculate_base_runoffs_per_feature(self) -> None:
+        """
+        Reference (per-feature) implementation of calculate_base_runoffs, kept to verify the columnar one.
+        """
+
+        # Validate that the layer is properly loaded
+        if not self.runoff_layer.isValid():
+            raise ValueError("Layer is not valid")
+
+        # Start editing the layer to allow modifications
+        self.runoff_layer.startEditing()
+
+        # Iterate over each height and its field names
+        for idx, (fn_h2, fn_h3, fn_v2, fn_v3) in self._get_base_runoff_targets():
             # Process each feature in the layer
             for feat in self.runoff_layer.getFeatures():
                 # Safely extract numeric values for CN2 and CN3
@@ -461,13 +551,84 @@ class RunOffComputer:
 
         return height_dict
 
+    def _get_coefficient_table(self) -> RunOffCoefficients:
+        """
+        Parse the P_/QAPI_ coefficients from the first row of the first CSV in `self.csv_list` once.
+        """
+        with open(self.csv_list[0], newline='', encoding='utf-8') as csvfile:
+            reader = csv.DictReader(csvfile)
+            first_row = next(reader)  # Read only the first data row
+
+        def _column(attribute_name: str) -> float:
+            if attribute_name not in first_row:
+                raise ValueError(f"Attribute '{attribute_name}' not found in CSV.")
+            return float(first_row[attribute_name])
+
+        p_cn2 = np.array([_column(f"QAPI_tvar{shape}") for shape in HYETOGRAPH_SHAPES], dtype=float)
+        p_shape = {
+            reoccurrence: np.array([_column(f"P_{reoccurrence}tvar{shape}_%") for shape in HYETOGRAPH_SHAPES],
+                                   dtype=float)
+            for reoccurrence in self.reoccurence_intervals
+        }
+        return RunOffCoefficients(p_shape, p_cn2)
+
     def calculate_weighted_runoffs(self) -> None:
         """
         Calculate weighted runoff volumes for each reoccurrence interval.
 
-        This method computes the weighted runoff volume for each feature in the runoff layer
-        based on CN2 and CN3 volumes, shape probabilities, and other parameters retrieved
-        from the CSV files. The results are stored in the corresponding fields of the layer.
+        The coefficients are parsed from the CSV once and the weighted volume is computed for all
+        features and reoccurrence intervals at once from the CN2 and CN3 volume columns.
+        Features with invalid or missing CN2/CN3 volumes are left untouched.
+        The results are written to the layer with a single data provider call.
+        """
+        coefficients = self._get_coefficient_table()
+        fields = self.runoff_layer.fields()
+
+        # Resolve all field indices up front
+        columns = {}
+        for reoccurrence in self.reoccurence_intervals:
+            field_name = f"V_{reoccurrence}_m3"
+            for name in (f"CN2_{reoccurrence}_runoff_volume_m3", f"CN3_{reoccurrence}_runoff_volume_m3", field_name):
+                if fields.indexFromName(name) == -1:
+                    raise ValueError(f"Field '{name}' not found in layer")
+            columns[reoccurrence] = (fields.indexFromName(f"CN2_{reoccurrence}_runoff_volume_m3"),
+                                     fields.indexFromName(f"CN3_{reoccurrence}_runoff_volume_m3"),
+                                     fields.indexFromName(field_name))
+
+        # Read all volume columns in one pass without geometries
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([idx for cols in columns.values() for idx in cols[:2]])
+        fids = []
+        raw_values = {idx: [] for cols in columns.values() for idx in cols[:2]}
+        for feat in self.runoff_layer.getFeatures(request):
+            fids.append(feat.id())
+            attrs = feat.attributes()
+            for idx, values in raw_values.items():
+                values.append(attrs[idx])
+
+        attribute_map: Dict[int, Dict[int, float]] = {}
+        for reoccurrence, (idx_cn2, idx_cn3, idx_v) in columns.items():
+            cn2_volume = _to_float_array(raw_values[idx_cn2])
+            cn3_volume = _to_float_array(raw_values[idx_cn3])
+
+            # Skip features with invalid or missing CN2/CN3 volumes
+            valid = ~np.isnan(cn2_volume) & ~np.isnan(cn3_volume) & (cn2_volume >= 0) & (cn3_volume >= 0)
+
+            w_cn2, w_cn3 = coefficients.weights(reoccurrence)
+            volume = (w_cn2 * cn2_volume + w_cn3 * cn3_volume) / 100
+
+            for i in np.flatnonzero(valid).tolist():
+                attribute_map.setdefault(fids[i], {})[idx_v] = float(volume[i])
+
+        if attribute_map and not self.runoff_layer.dataProvider().changeAttributeValues(attribute_map):
+            raise IOError("Failed to write weighted runoff volumes")
+        self.runoff_layer.triggerRepaint()
+
+    def _calculate_weighted_runoffs_per_feature(self) -> None:
+        """
+        Reference (per-feature) implementation of calculate_weighted_runoffs.
+
+        Re-reads the CSV for every feature and shape, kept only to verify the batch implementation.
         """
 
         self.runoff_layer.startEditing()
@@ -512,11 +673,13 @@ class RunOffComputer:
         - Adding the calculated values to the layer.
         """
 
-        self.url = get_string_from_yaml(self.urlPath, "URL")
-        self.process_identifier = get_string_from_yaml(self.urlPath, "process_identifier")
         self.runoff_layer = self.cn_layer.clone()
 
         try:
+            if not self.RunOffFlag:
+                wps_config = load_wps_config(self.urlPath)
+                self.url, self.process_identifier = wps_config.url, wps_config.process_identifier
+
             # Update the shape area for the runoff layer
             self.update_shape_area(self.runoff_layer)
 
@@ -14,10 +14,14 @@ from qgis.core import (
 )
 
 from PyQt5.QtCore import QVariant, QMessageLogContext
+from qgis.core import QgsGeometry, QgsFeature, QgsWkbTypes, QgsRectangle
+
+import math
+import threading
+import numpy as np
+from osgeo import gdal, gdal_array, ogr, osr
 
 import processing
-import tempfile
-import os
 
 
 def simple_clip(input_layer, clip_by_layer):
@@ -40,39 +44,122 @@ def simple_clip(input_layer, clip_by_layer):
 
 
 
-def polygonize_raster(raster_layer: QgsRasterLayer) -> str:
-    """Convert a QgsRasterLayer into a temporary .gpkg file, separating different pixel values into polygons."""
+# Open local raster datasets per thread, see open_local_raster
+_raster_handles = threading.local()
 
-    if not raster_layer.isValid():
-        raise ValueError("Invalid raster layer")
 
-    try:
-        raster_path = raster_layer.source()
-        QgsMessageLog.logMessage(f"Raster source path: {raster_path}", "CzLandUseCN", level=Qgis.Info)
+def _ogr_memory_datasource():
+    """Create an in-memory OGR datasource (Memory driver was merged into MEM in GDAL 3.11)."""
+    driver = ogr.GetDriverByName("Memory") or ogr.GetDriverByName("MEM")
+    return driver.CreateDataSource("")
 
-        feedback = QgsProcessingFeedback()  # Add feedback for processing
-        temp_dir = tempfile.mkdtemp()
-        output_path = os.path.join(temp_dir, "polygonized.gpkg")
-        try:
-            result = processing.run("gdal:polygonize", {
-                'INPUT': raster_path,
-                'BAND': 1,
-                'FIELD': 'HSG',
-                'EIGHT_CONNECTEDNESS': False,
-                'OUTPUT': output_path
-            }, feedback=feedback)  # Include feedback in processing.run
 
-        except QgsProcessingException as e:
-            QgsMessageLog.logMessage(f"Processing error: {str(e)}", "CzLandUseCN", level=Qgis.Critical)
-            raise ValueError("Failed to polygonize raster layer due to processing error")
+def open_local_raster(path: str):
+    """
+    Open a local raster file read-only. The dataset handle is kept open and reused by later calls
+    from the same thread (GDAL datasets must not be shared between threads), e.g. for all AOIs of a batch run,
+    until close_local_rasters is called.
+    """
+    handles = _raster_handles.__dict__.setdefault('datasets', {})
+    dataset = handles.get(path)
+    if dataset is None:
+        dataset = gdal.Open(path, gdal.GA_ReadOnly)
+        if dataset is None:
+            raise IOError(f"Failed to open raster: {path}")
+        handles[path] = dataset
+    return dataset
 
 
-    except Exception as e:
-        QgsMessageLog.logMessage(str(e), "CzLandUseCN", level=Qgis.Critical)
-        raise ValueError("Failed to polygonize raster layer")
+def close_local_rasters() -> None:
+    """Close the raster datasets opened by open_local_raster in this thread, releasing the files."""
+    _raster_handles.__dict__.pop('datasets', {}).clear()
 
 
-    return result['OUTPUT']
+def raster_window(dataset, extent: QgsRectangle):
+    """Return the pixel window (xoff, yoff, xsize, ysize) of the dataset covering extent, None if outside."""
+    x0, px, _, y0, _, py = dataset.GetGeoTransform()
+    xoff = max(int(math.floor((extent.xMinimum() - x0) / px)), 0)
+    xend = min(int(math.ceil((extent.xMaximum() - x0) / px)), dataset.RasterXSize)
+    yoff = max(int(math.floor((extent.yMaximum() - y0) / py)), 0)
+    yend = min(int(math.ceil((extent.yMinimum() - y0) / py)), dataset.RasterYSize)
+    if xoff >= xend or yoff >= yend:
+        return None
+    return xoff, yoff, xend - xoff, yend - yoff
+
+
+def read_raster_block(dataset, xoff: int, yoff: int, xsize: int, ysize: int):
+    """Read a pixel block of the first band directly into Int32 NumPy arrays of values and validity (nodata mask)."""
+    band = dataset.GetRasterBand(1)
+    data = band.ReadAsArray(xoff, yoff, xsize, ysize, buf_type=gdal.GDT_Int32)
+    valid = band.GetMaskBand().ReadAsArray(xoff, yoff, xsize, ysize) > 0
+    return data, valid
+
+
+def vectorize_soil_raster(raster, polygon_layer: QgsVectorLayer) -> QgsVectorLayer:
+    """
+    Polygonize the HSG raster (path or gdal.Dataset) only under the polygons of polygon_layer.
+    The raster window under the polygons is read into a NumPy array and polygonized in one pass (nodata pixels
+    masked, no raster is written), polygons are clipped by the polygons as by native:clip.
+    Returns memory layer 'Soil Layer' with fid (order of the polygonized features) and HSG attributes.
+    """
+    dataset = gdal.Open(raster) if isinstance(raster, str) else raster
+    if dataset is None:
+        raise ValueError(f"Failed to open soil raster: {raster}")
+
+    aoi = QgsGeometry.unaryUnion([feature.geometry() for feature in polygon_layer.getFeatures()])
+    if aoi.isNull() or aoi.isEmpty():
+        raise ValueError("Invalid clip by layer")
+
+    soil_layer = QgsVectorLayer(f"MultiPolygon?crs={polygon_layer.crs().authid()}", "Soil Layer", "memory")
+    soil_layer.dataProvider().addAttributes([QgsField("fid", QVariant.LongLong), QgsField("HSG", QVariant.Int)])
+    soil_layer.updateFields()
+
+    # Pixel window covering the polygons
+    window = raster_window(dataset, aoi.boundingBox())
+    if window is None:
+        return soil_layer
+    xoff, yoff, xsize, ysize = window
+    x0, px, _, y0, _, py = dataset.GetGeoTransform()
+    projection = dataset.GetProjection()
+    data, valid = read_raster_block(dataset, xoff, yoff, xsize, ysize)
+
+    # MEM datasets wrapping the arrays without copying them
+    values_ds = gdal_array.OpenArray(data)
+    values_ds.SetGeoTransform((x0 + xoff * px, px, 0, y0 + yoff * py, 0, py))
+    values_ds.SetProjection(projection)
+    mask_ds = gdal_array.OpenArray(valid.astype(np.uint8))
+
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(projection)
+    ogr_ds = _ogr_memory_datasource()
+    polygons = ogr_ds.CreateLayer("polygonized", srs, ogr.wkbPolygon)
+    polygons.CreateField(ogr.FieldDefn("HSG", ogr.OFTInteger))
+    gdal.Polygonize(values_ds.GetRasterBand(1), mask_ds.GetRasterBand(1), polygons, 0, [])
+
+    engine = QgsGeometry.createGeometryEngine(aoi.constGet())
+    engine.prepareGeometry()
+    features = []
+    for fid, polygon in enumerate(polygons, 1):
+        geom = QgsGeometry()
+        geom.fromWkb(bytes(polygon.GetGeometryRef().ExportToWkb()))
+        if not engine.intersects(geom.constGet()):
+            continue
+        if not engine.contains(geom.constGet()):
+            # Boundary polygon, clip by the polygons
+            geom = geom.intersection(aoi)
+            if geom.isNull() or geom.isEmpty():
+                continue
+            geom.convertGeometryCollectionToSubclass(QgsWkbTypes.PolygonGeometry)
+        geom.convertToMultiType()
+        feature = QgsFeature(soil_layer.fields())
+        feature.setGeometry(geom)
+        feature.setAttributes([fid, polygon.GetField(0)])
+        features.append(feature)
+    soil_layer.dataProvider().addFeatures(features)
+    values_ds = mask_ds = None
+
+    soil_layer.updateExtents()
+    return soil_layer
 
 
 def load_tiff_from_zip(path_to_zip):
@@ -98,24 +185,6 @@ def load_tiff_from_zip(path_to_zip):
                     return None
     return None
 
-def clip_raster_by_extent(filepath, extent):
-    clip_raster = processing.run(
-        "gdal:cliprasterbyextent",
-        {
-            "INPUT": filepath,
-            "PROJWIN": ','.join(map(str, [extent.xMinimum(), extent.xMaximum(), extent.yMinimum(), extent.yMaximum()])) + ' [EPSG:5514]',
-            "OUTPUT": 'TEMPORARY_OUTPUT'
-        }
-    )['OUTPUT']
-
-    raster_layer = QgsRasterLayer(clip_raster, os.path.basename(filepath))
-
-    if raster_layer.isValid():
-        return raster_layer
-    else:
-        QgsMessageLog.logMessage(f"Failed to clip raster layer: {filepath}", "CzLandUseCN", level=Qgis.Critical)
-        return None
-
 class SoilDownloader:
     """Class to download soil data using a WPS service."""
     def __init__(self, uri, xml_template,process_identifier, polygon_Soil, ymin_s, xmin_s, ymax_s, xmax_s):
@@ -10,8 +10,8 @@ from qgis.PyQt.QtCore import pyqtSignal
 from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsVectorLayer, QgsFeature, QgsFeatureRequest, QgsWkbTypes, QgsGeometry, QgsRasterLayer, QgsProject, QgsApplication, QgsVectorLayer
 
 from .WFSdownloader import WFSDownloader
-from .PluginUtils import get_string_from_yaml
-from .SoilDownloader import SoilDownloader, load_tiff_from_zip, polygonize_raster, clip_raster_by_extent, simple_clip
+from .PluginConfig import load_wps_config
+from .SoilDownloader import SoilDownloader, load_tiff_from_zip, open_local_raster, vectorize_soil_raster, close_local_rasters
 from .LayerEditor import buffer_QgsVectorLayer, add_constant_atr, merge_layers, apply_simple_difference
 
 class TASK_process_soil_layer(QgsTask):
@@ -21,7 +21,8 @@ class TASK_process_soil_layer(QgsTask):
     taskError_Soil = pyqtSignal(str)
     taskFinished_Soil = pyqtSignal(list)
 
-    def __init__(self, polygon_Soil, ymin_s, xmin_s, ymax_s, xmax_s, extent, label_Soil, progressBar_Soil, runButton_Soil, abortButton_Soil, config_path=None):
+    def __init__(self, polygon_Soil, ymin_s, xmin_s, ymax_s, xmax_s, extent, label_Soil, progressBar_Soil, runButton_Soil, abortButton_Soil, config_path=None,
+                 keep_raster_open=False):
         super().__init__("Process Soil Layer", QgsTask.CanCancel)
         self.polygon_Soil = polygon_Soil
         self.ymin_s, self.xmin_s, self.ymax_s, self.xmax_s = ymin_s, xmin_s, ymax_s, xmax_s
@@ -31,6 +32,8 @@ class TASK_process_soil_layer(QgsTask):
         self.not_buffered_plg = None
         self.clipped_soil_layer = None
         self._is_canceled = False
+        # Keep the local raster open for following tasks in the same thread (batch runs), closed at the end otherwise
+        self.keep_raster_open = keep_raster_open
         if self.abortButton_Soil:
             self.abortButton_Soil.clicked.connect(self.cancel)
         if config_path is not None:
@@ -57,17 +60,17 @@ class TASK_process_soil_layer(QgsTask):
         self._update_progress_bar(10)
         not_buffered_plg = self.polygon_Soil
         try:
-            URI = get_string_from_yaml(os.path.join(self.config_path, 'Soil.yaml'), "URI")
+            soil_config = load_wps_config(os.path.join(self.config_path, 'Soil.yaml'))
+            URI = soil_config.url
 
             self._update_progress_bar(20)
             if URI.startswith('file://'):
-                # grow the extent by 25m (to avoid missing edges)
-                self.extent.grow(25)
-                soil_raster = clip_raster_by_extent(URI[len('file://'):], self.extent)
+                # Only the window under the polygon is read from the (national) raster, the handle is reused
+                soil_raster = open_local_raster(URI[len('file://'):])
             else:
                 # buffer the polygon by 25m (to avoid missing edges)
                 self.polygon_Soil = buffer_QgsVectorLayer(self.polygon_Soil, 25)
-                process_identifier = get_string_from_yaml(os.path.join(self.config_path, 'Soil.yaml'), "process_identifier")
+                process_identifier = soil_config.process_identifier
 
                 XML_template = os.path.join(os.path.dirname(__file__), 'config', 'Soil_template.xml')
                 soil_downloader = SoilDownloader(URI, XML_template, process_identifier, self.polygon_Soil, self.ymin_s, self.xmin_s, self.ymax_s, self.xmax_s)
@@ -89,16 +92,14 @@ class TASK_process_soil_layer(QgsTask):
                     return False
 
             self._update_progress_bar(70)
-            # Polygonize the raster
-            polygoniziedLayer_Path  = polygonize_raster(soil_raster)
+            # Polygonize the raster only under the polygon that is not buffered
+            if isinstance(soil_raster, QgsRasterLayer):
+                soil_raster = soil_raster.source()
+            self.clipped_soil_layer = vectorize_soil_raster(soil_raster, not_buffered_plg)
 
-            SoilLayer = QgsVectorLayer(polygoniziedLayer_Path, "Soil Layer", "ogr")
-
-            # Clip the layer by polygon that is not buffered
-            self.clipped_soil_layer = simple_clip(SoilLayer, not_buffered_plg)
-
-            # Add HSG attribute to the area defining polygon and use it as underline layer for water bodies
-            not_buffered_plg = add_constant_atr(not_buffered_plg, "HSG", 0)
+            # Add HSG attribute to a memory copy of the area defining polygon (the layer may be the user's AOI layer)
+            # and use it as underline layer for water bodies
+            not_buffered_plg = add_constant_atr(not_buffered_plg.materialize(QgsFeatureRequest()), "HSG", 0)
 
             # Clip the water bodies layer to the polygon by the soil layer
             not_buffered_plg = apply_simple_difference(not_buffered_plg, self.clipped_soil_layer)
@@ -119,6 +120,10 @@ class TASK_process_soil_layer(QgsTask):
             self.cancel()
             return False
 
+        finally:
+            if not self.keep_raster_open:
+                close_local_rasters()
+
     def cancel(self):
         """Cancel the task."""
         super().cancel()
@@ -0,0 +1,285 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Optional, List, Tuple, Dict, Callable, Iterator
+
+import yaml
+from PyQt5.QtCore import QVariant, Qt
+from qgis.core import (QgsMessageLog, Qgis, QgsVectorLayer, QgsRectangle, QgsGeometry, QgsFeature, QgsField,
+                       QgsWkbTypes, QgsApplication)
+
+Tile = Tuple[int, int]
+
+
+def _json_value(value):
+    """Convert an attribute value to a JSON serializable value."""
+    if value is None or (isinstance(value, QVariant) and value.isNull()):
+        return None
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, 'toString'):  # QDate, QDateTime, QTime
+        return value.toString(Qt.ISODate)
+    return str(value)
+
+
+class WFSTileCache:
+    """
+    Persistent on-disk cache of WFS GetFeature responses.
+    Features are stored per tile of a fixed grid in EPSG:5514, keyed by data source and typename.
+    Tiles older than `ttl` seconds are downloaded again, least recently used tiles are evicted
+    when the cache grows over `max_size` bytes.
+    """
+
+    def __init__(self, path: str, tile_size: float = 5000, ttl: float = 7 * 86400, max_size: int = 2 * 1024 ** 3):
+        self.path = path
+        self.tile_size = float(tile_size)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS tiles (source TEXT, typename TEXT, tx INTEGER, ty INTEGER, "
+                         "fetched_at REAL, last_used REAL, size INTEGER, fields TEXT, wkb_type INTEGER, crs TEXT, "
+                         "PRIMARY KEY (source, typename, tx, ty))")
+            conn.execute("CREATE TABLE IF NOT EXISTS features (source TEXT, typename TEXT, tx INTEGER, ty INTEGER, "
+                         "feature_key TEXT, wkb BLOB, attributes TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS features_tile ON features (source, typename, tx, ty)")
+
+    @classmethod
+    def from_config(cls, config_path: str) -> Optional["WFSTileCache"]:
+        """Create the cache from WFS_cache.yaml, returns None if the cache is disabled or not configured."""
+        try:
+            with open(config_path, 'r', encoding='utf-8') as file:
+                config = yaml.safe_load(file) or {}
+        except Exception as e:
+            QgsMessageLog.logMessage(f"WFS cache disabled, failed to load {config_path}: {e}", "CzLandUseCN",
+                                     level=Qgis.Warning)
+            return None
+
+        if not config.get('enabled', False):
+            return None
+
+        path = config.get('path') or os.path.join(QgsApplication.qgisSettingsDirPath(), "czech_lu_cn_analyzer",
+                                                  "wfs_cache.sqlite")
+        return cls(path,
+                   tile_size=config.get('tile_size', 5000),
+                   ttl=config.get('ttl_days', 7) * 86400,
+                   max_size=int(config.get('max_size_mb', 2048) * 1024 ** 2))
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # New connection per call - the cache is used from several download threads
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            with conn:  # commit or rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counts of tile lookups."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def tiles_for_extent(self, extent: QgsRectangle, aoi: Optional[QgsGeometry] = None) -> List[Tile]:
+        """Return the grid tiles covering the extent (only those intersecting the aoi polygon if given)."""
+        tx_min = math.floor(extent.xMinimum() / self.tile_size)
+        tx_max = math.floor(extent.xMaximum() / self.tile_size)
+        ty_min = math.floor(extent.yMinimum() / self.tile_size)
+        ty_max = math.floor(extent.yMaximum() / self.tile_size)
+        tiles = [(tx, ty) for tx in range(tx_min, tx_max + 1) for ty in range(ty_min, ty_max + 1)]
+        if aoi is None or len(tiles) == 1:
+            return tiles
+        engine = QgsGeometry.createGeometryEngine(aoi.constGet())
+        engine.prepareGeometry()
+        return [tile for tile in tiles if engine.intersects(QgsGeometry.fromRect(self.tile_rect(tile)).constGet())]
+
+    @staticmethod
+    def _tile_runs(tiles: List[Tile]) -> List[List[Tile]]:
+        """Split tiles into runs of horizontally adjacent tiles."""
+        runs = []
+        for tile in sorted(tiles, key=lambda tile: (tile[1], tile[0])):
+            if runs and runs[-1][-1][1] == tile[1] and runs[-1][-1][0] + 1 == tile[0]:
+                runs[-1].append(tile)
+            else:
+                runs.append([tile])
+        return runs
+
+    def tile_rect(self, tile: Tile) -> QgsRectangle:
+        """Return the extent of a grid tile."""
+        tx, ty = tile
+        return QgsRectangle(tx * self.tile_size, ty * self.tile_size,
+                            (tx + 1) * self.tile_size, (ty + 1) * self.tile_size)
+
+    def _fresh_tiles(self, conn: sqlite3.Connection, source: str, typename: str, tiles: List[Tile]) -> set:
+        """Return the tiles stored in the cache and not older than ttl."""
+        min_time = time.time() - self.ttl
+        rows = conn.execute("SELECT tx, ty FROM tiles WHERE source = ? AND typename = ? AND fetched_at >= ?",
+                            (source, typename, min_time)).fetchall()
+        return set(rows) & set(tiles)
+
+    def _store_tiles(self, conn: sqlite3.Connection, source: str, typename: str, tiles: List[Tile],
+                     layer: QgsVectorLayer) -> None:
+        """Split features of a downloaded layer to the given tiles and store them."""
+        fields = json.dumps([(f.name(), f.type(), f.typeName(), f.length(), f.precision()) for f in layer.fields()])
+        rects = {tile: self.tile_rect(tile) for tile in tiles}
+        rows = {tile: [] for tile in tiles}
+
+        for feature in layer.getFeatures():
+            geom = feature.geometry()
+            if geom.isNull():
+                continue
+            wkb = bytes(geom.asWkb())
+            attributes = json.dumps([_json_value(value) for value in feature.attributes()])
+            key = hashlib.sha1(wkb + attributes.encode('utf-8')).hexdigest()
+            bbox = geom.boundingBox()
+            for tile, rect in rects.items():
+                if bbox.intersects(rect):
+                    rows[tile].append((source, typename, tile[0], tile[1], key, wkb, attributes))
+
+        now = time.time()
+        for tile, tile_rows in rows.items():
+            conn.execute("DELETE FROM features WHERE source = ? AND typename = ? AND tx = ? AND ty = ?",
+                         (source, typename, tile[0], tile[1]))
+            conn.executemany("INSERT INTO features VALUES (?, ?, ?, ?, ?, ?, ?)", tile_rows)
+            size = sum(len(row[5]) + len(row[6]) for row in tile_rows)
+            conn.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (source, typename, tile[0], tile[1], now, now, size, fields, int(layer.wkbType()),
+                          layer.crs().authid()))
+
+    def _evict(self, conn: sqlite3.Connection, keep: set) -> None:
+        """
+        Remove least recently used tiles until the cache fits into max_size.
+        Tiles in keep ((source, typename, tx, ty) tuples) are never removed.
+        """
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for source, typename, tx, ty, size in conn.execute(
+                "SELECT source, typename, tx, ty, size FROM tiles ORDER BY last_used").fetchall():
+            if total <= self.max_size:
+                break
+            if (source, typename, tx, ty) in keep:
+                continue
+            conn.execute("DELETE FROM features WHERE source = ? AND typename = ? AND tx = ? AND ty = ?",
+                         (source, typename, tx, ty))
+            conn.execute("DELETE FROM tiles WHERE source = ? AND typename = ? AND tx = ? AND ty = ?",
+                         (source, typename, tx, ty))
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def warm(self, typename: str, source: str, extent: QgsRectangle,
+             fetch: Callable[[QgsRectangle], Optional[QgsVectorLayer]], aoi: Optional[QgsGeometry] = None) -> bool:
+        """
+        Make sure all tiles covering the extent (and intersecting the aoi polygon if given) are cached.
+        Missing or stale tiles are downloaded with a single fetch of their bounding rectangle, or with one fetch
+        per run of adjacent tiles if the aoi is given (the bounding rectangle of an elongated aoi is mostly empty).
+        """
+        tiles = self.tiles_for_extent(extent, aoi)
+        with self._connect() as conn:
+            cached = self._fresh_tiles(conn, source, typename, tiles)
+        missing = [tile for tile in tiles if tile not in cached]
+
+        with self._lock:
+            self.hits += len(cached)
+            self.misses += len(missing)
+
+        if not missing:
+            return True
+
+        for group in ([missing] if aoi is None else self._tile_runs(missing)):
+            rect = self.tile_rect(group[0])
+            for tile in group[1:]:
+                rect.combineExtentWith(self.tile_rect(tile))
+
+            layer = fetch(rect)
+            if layer is None or not layer.isValid():
+                QgsMessageLog.logMessage(f"Failed to download tiles of {typename} for the cache", "CzLandUseCN",
+                                         level=Qgis.Warning)
+                return False
+
+            with self._connect() as conn:
+                self._store_tiles(conn, source, typename, group, layer)
+
+        with self._connect() as conn:
+            # Tiles of the current request are still needed
+            self._evict(conn, {(source, typename, tx, ty) for tx, ty in tiles})
+        return True
+
+    def get_layer(self, typename: str, source: str, extent: QgsRectangle,
+                  fetch: Callable[[QgsRectangle], Optional[QgsVectorLayer]],
+                  aoi: Optional[QgsGeometry] = None) -> Optional[QgsVectorLayer]:
+        """
+        Return a memory layer with all features of the typename intersecting the extent tiles
+        (tiles intersecting the aoi polygon if given). Only tiles missing in the cache are downloaded.
+        """
+        if not self.warm(typename, source, extent, fetch, aoi):
+            return None
+
+        tiles = self.tiles_for_extent(extent, aoi)
+        with self._connect() as conn:
+            now = time.time()
+            conn.executemany("UPDATE tiles SET last_used = ? WHERE source = ? AND typename = ? AND tx = ? AND ty = ?",
+                             [(now, source, typename, tx, ty) for tx, ty in tiles])
+            schemas = {}
+            for tx, ty in tiles:
+                schema = conn.execute("SELECT fields, wkb_type, crs FROM tiles WHERE source = ? AND typename = ? "
+                                      "AND tx = ? AND ty = ?", (source, typename, tx, ty)).fetchone()
+                if schema is not None:
+                    schemas[(tx, ty)] = (json.loads(schema[0]), schema[1], schema[2])
+            if not schemas:
+                return None
+
+            # Tiles fetched without any feature may have no geometry type, prefer the geometry type of another tile
+            wkb_type, crs = next(((wkb_type, crs) for _, wkb_type, crs in schemas.values()
+                                  if wkb_type != QgsWkbTypes.NoGeometry), next(iter(schemas.values()))[1:])
+            if wkb_type != QgsWkbTypes.NoGeometry:
+                # Tiles may differ in single/multi geometries
+                wkb_type = QgsWkbTypes.multiType(wkb_type)
+            layer = QgsVectorLayer(f"{QgsWkbTypes.displayString(wkb_type)}?crs={crs}", typename, "memory")
+            # Tiles downloaded at different times may differ in field order and fields, keep all of them by name
+            definitions = {}
+            for tile_fields, _, _ in schemas.values():
+                for definition in tile_fields:
+                    definitions.setdefault(definition[0], definition)
+            layer.dataProvider().addAttributes([QgsField(name, QVariant.Type(type_), type_name, length, precision)
+                                                for name, type_, type_name, length, precision
+                                                in definitions.values()])
+            layer.updateFields()
+            fields = layer.fields()
+
+            # Features crossing tile borders are stored in every tile, keep them only once
+            seen = set()
+            features = []
+            for tile, (tile_fields, _, _) in schemas.items():
+                tile_names = [definition[0] for definition in tile_fields]
+                tile_indexes = [tile_names.index(name) if name in tile_names else -1 for name in fields.names()]
+                for key, wkb, attributes in conn.execute(
+                        "SELECT feature_key, wkb, attributes FROM features WHERE source = ? AND typename = ? "
+                        "AND tx = ? AND ty = ?", (source, typename, tile[0], tile[1])):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    geom = QgsGeometry()
+                    geom.fromWkb(wkb)
+                    geom.convertToMultiType()
+                    values = json.loads(attributes)
+                    feature = QgsFeature(fields)
+                    feature.setGeometry(geom)
+                    feature.setAttributes([values[i] if i >= 0 else None for i in tile_indexes])
+                    features.append(feature)
+
+        layer.dataProvider().addFeatures(features)
+        layer.updateExtents()
+        return layer
@@ -1,23 +1,345 @@
 from qgis.core import QgsMessageLog, Qgis, QgsVectorLayer, QgsRectangle, QgsGeometry, QgsFeature, QgsFeatureRequest, \
-    QgsWkbTypes
+    QgsWkbTypes, QgsFields, QgsCoordinateTransform, QgsProject
 
 from qgis.utils import iface
 import processing
-from typing import Optional, List
+import hashlib
+import math
+import re
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, List, Callable, Dict, NamedTuple, Tuple
+from urllib.parse import quote
+from xml.sax.saxutils import escape, quoteattr
+
+import requests
+from osgeo import gdal
+
+# Based on the environment, import the LandUseTiles module
+try:
+    from .LandUseTiles import LandUseTiles
+except ImportError:
+    from LandUseTiles import LandUseTiles
 
 
 class WFSDownloaderError(Exception):
     pass
 
 
+# Features requested per GetFeature page, lowered to the CountDefault announced by the server
+WFS_PAGE_SIZE = 5000
+WFS_TIMEOUT = 120  # seconds per request
+
+# Vertices of the simplified AOI polygon sent in a GetFeature Intersects filter
+FILTER_MAX_VERTICES = 200
+# Longest URL encoded filter sent by GET to services without POST GetFeature (IIS limits query strings to 2048)
+FILTER_MAX_GET_LENGTH = 2000
+# Sub-bboxes covering the AOI for services without spatial filters, used if they save at least a quarter of the area
+AOI_MAX_BOXES = 16
+AOI_MAX_BOXES_AREA = 0.75
+
+OWS_NS = "{http://www.opengis.net/ows/1.1}"
+WFS_NS_URI = "http://www.opengis.net/wfs/2.0"
+XSD_NS = "{http://www.w3.org/2001/XMLSchema}"
+FES_NS = "{http://www.opengis.net/fes/2.0}"
+SRS_NAME = "urn:ogc:def:crs:EPSG::5514"
+# Fields of the WFS feature identifier (gml:id, GeoJSON id) in layers read by OGR
+FEATURE_ID_FIELDS = ('gml_id', 'id')
+# Feature identifier properties the pages are sorted by (stable startIndex order) if the service implements sorting
+SORT_PROPERTIES = ('OBJECTID', 'FID', 'fid_zbg')
+
+# Attributes kept in the CN layer besides the computed ones (see prune_cn_layer_fields), downloaded if present
+PASSTHROUGH_ATTRIBUTES = ('OBJECTID', 'FID', 'fid_zbg', 'Shape_Area', 'SHAPE_Area', 'Shape_Length')
+
+
+class WFSCapabilities(NamedTuple):
+    paging: bool  # ImplementsResultPaging
+    count_default: Optional[int]  # maximum features per GetFeature response
+    geojson_format: Optional[str]  # GetFeature outputFormat value of GeoJSON, None if not offered
+    intersects: bool  # fes:Intersects spatial operator
+    post: bool  # GetFeature accepts XML requests by HTTP POST
+    sorting: bool = False  # ImplementsSorting (sortBy)
+
+
+# Capabilities by service URL, None for services without usable capabilities
+_capabilities: Dict[str, Optional[WFSCapabilities]] = {}
+# DescribeFeatureType schemas by (service URL, typename), used to read GML pages with the right field types
+_schemas: Dict[Tuple[str, str], Optional[bytes]] = {}
+_cache_lock = threading.Lock()
+
+
+def _parse_capabilities(content: bytes) -> WFSCapabilities:
+    root = ET.fromstring(content)
+    constraints = {}
+    for constraint in root.iter(f"{OWS_NS}Constraint"):
+        value = constraint.find(f"{OWS_NS}DefaultValue")
+        if value is not None and value.text:
+            constraints[constraint.get("name")] = value.text.strip()
+
+    geojson_format = None
+    post = False
+    for operation in root.iter(f"{OWS_NS}Operation"):
+        if operation.get("name") != "GetFeature":
+            continue
+        post = post or next(operation.iter(f"{OWS_NS}Post"), None) is not None
+        for parameter in operation.iter(f"{OWS_NS}Parameter"):
+            if parameter.get("name") != "outputFormat":
+                continue
+            for value in parameter.iter(f"{OWS_NS}Value"):
+                if value.text and "json" in value.text.lower():
+                    geojson_format = value.text.strip()
+                    break
+
+    spatial_operators = {operator.get("name") for operator in root.iter(f"{FES_NS}SpatialOperator")}
+    for constraint in root.iter(f"{FES_NS}Constraint"):
+        value = constraint.find(f"{OWS_NS}DefaultValue")
+        if value is not None and value.text:
+            constraints[constraint.get("name")] = value.text.strip()
+
+    count_default = constraints.get("CountDefault")
+    return WFSCapabilities(constraints.get("ImplementsResultPaging", "").upper() == "TRUE",
+                           int(count_default) if count_default and count_default.isdigit() else None,
+                           geojson_format, "Intersects" in spatial_operators, post,
+                           constraints.get("ImplementsSorting", "").upper() == "TRUE")
+
+
+def wfs_capabilities(URI: str) -> Optional[WFSCapabilities]:
+    """Return the paging and output format capabilities of the WFS 2.0 service, None if unavailable."""
+    with _cache_lock:
+        if URI in _capabilities:
+            return _capabilities[URI]
+    try:
+        response = requests.get(URI, params={"service": "WFS", "version": "2.0.0", "request": "GetCapabilities"},
+                                timeout=WFS_TIMEOUT)
+        response.raise_for_status()
+        capabilities = _parse_capabilities(response.content)
+    except (requests.RequestException, ET.ParseError, ValueError) as e:
+        QgsMessageLog.logMessage(f"WFS capabilities of {URI} unavailable, paging disabled: {e}", "CzLandUseCN",
+                                 level=Qgis.Warning)
+        capabilities = None
+    with _cache_lock:
+        _capabilities[URI] = capabilities
+    return capabilities
+
+
+def _feature_schema(session: requests.Session, URI: str, layer_name: str) -> Optional[bytes]:
+    with _cache_lock:
+        if (URI, layer_name) in _schemas:
+            return _schemas[(URI, layer_name)]
+    try:
+        response = session.get(URI, params={"service": "WFS", "version": "2.0.0", "request": "DescribeFeatureType",
+                                            "typenames": layer_name}, timeout=WFS_TIMEOUT)
+        response.raise_for_status()
+        schema = response.content
+    except requests.RequestException:
+        schema = None  # OGR guesses the field types
+    with _cache_lock:
+        _schemas[(URI, layer_name)] = schema
+    return schema
+
+
+def _schema_properties(schema: Optional[bytes]) -> Optional[List[Tuple[str, bool]]]:
+    """Return (name, is geometry) of the feature type properties in the schema order, None if the schema is unknown"""
+    if schema is None:
+        return None
+    try:
+        root = ET.fromstring(schema)
+    except ET.ParseError:
+        return None
+    properties = []
+    for complex_type in root.iter(f"{XSD_NS}complexType"):
+        for element in complex_type.iter(f"{XSD_NS}element"):
+            name, type_ = element.get("name"), element.get("type", "")
+            if name and all(name != known for known, _ in properties):
+                # gml:PointPropertyType, gml:MultiSurfacePropertyType, ...
+                properties.append((name, type_.split(":")[-1].endswith("PropertyType")))
+    return properties
+
+
+def _property_names(schema: Optional[bytes], attributes: List[str]) -> Optional[List[str]]:
+    """
+    Return the propertyName projection of the feature type: geometry properties and the wanted attributes
+    (matched case-insensitively) in the schema order. None if the schema is unknown.
+    """
+    properties = _schema_properties(schema)
+    if not properties or not any(is_geometry for _, is_geometry in properties):
+        return None
+    wanted = {name.lower() for name in attributes}
+    return [name for name, is_geometry in properties if is_geometry or name.lower() in wanted]
+
+
+def _geometry_property(schema: Optional[bytes]) -> Optional[str]:
+    return next((name for name, is_geometry in _schema_properties(schema) or [] if is_geometry), None)
+
+
+def _sort_property(schema: Optional[bytes]) -> Optional[str]:
+    """Return the feature identifier property (SORT_PROPERTIES, case-insensitive) of the schema, None if unknown"""
+    names = {name.lower(): name for name, is_geometry in _schema_properties(schema) or [] if not is_geometry}
+    return next((names[name.lower()] for name in SORT_PROPERTIES if name.lower() in names), None)
+
+
+def _schema_namespace(schema: Optional[bytes]) -> Optional[str]:
+    try:
+        return ET.fromstring(schema).get("targetNamespace") if schema else None
+    except ET.ParseError:
+        return None
+
+
+def filter_polygon(aoi: QgsGeometry, max_vertices: int = FILTER_MAX_VERTICES) -> QgsGeometry:
+    """Return a polygon covering the AOI without holes, simplified to at most max_vertices vertices."""
+    geometry = aoi.removeInteriorRings()
+    extent = geometry.boundingBox()
+    tolerance = max(extent.width(), extent.height()) / 1000
+    simplified = geometry
+    for _ in range(20):
+        if simplified.constGet().nCoordinates() <= max_vertices:
+            return simplified
+        # The buffer keeps the simplified boundary outside of the AOI
+        simplified = geometry.buffer(tolerance, 2).simplify(tolerance)
+        tolerance *= 2
+    return QgsGeometry.fromRect(extent)
+
+
+def _intersects_filter(geometry_property: str, polygon: QgsGeometry) -> str:
+    """Return the FES 2.0 filter of features intersecting the polygon (EPSG:5514)."""
+    polygons = polygon.asMultiPolygon() if polygon.isMultipart() else [polygon.asPolygon()]
+    surfaces = []
+    for i, rings in enumerate(polygons):
+        pos_list = " ".join(f"{point.x():.3f} {point.y():.3f}" for point in rings[0])
+        surfaces.append(f'<gml:Polygon gml:id="aoi.{i}" srsName="{SRS_NAME}"><gml:exterior><gml:LinearRing>'
+                        f'<gml:posList>{pos_list}</gml:posList></gml:LinearRing></gml:exterior></gml:Polygon>')
+    if len(surfaces) == 1:
+        geometry = surfaces[0]
+    else:
+        members = "".join(f"<gml:surfaceMember>{surface}</gml:surfaceMember>" for surface in surfaces)
+        geometry = f'<gml:MultiSurface gml:id="aoi" srsName="{SRS_NAME}">{members}</gml:MultiSurface>'
+    return ('<fes:Filter xmlns:fes="http://www.opengis.net/fes/2.0" xmlns:gml="http://www.opengis.net/gml/3.2">'
+            f'<fes:Intersects><fes:ValueReference>{geometry_property}</fes:ValueReference>{geometry}'
+            '</fes:Intersects></fes:Filter>')
+
+
+def _get_feature_xml(params: Dict[str, str], fes_filter: str, namespace: Optional[str]) -> bytes:
+    """
+    Return the GetFeature request of the GET params (typenames, count, startIndex, outputFormat, srsName,
+    propertyName, sortBy) with the filter as an XML document for HTTP POST. namespace is bound to the typename prefix.
+    """
+    typename = params["typenames"]
+    prefix = typename.split(":")[0] if ":" in typename else None
+    declaration = f" xmlns:{prefix}={quoteattr(namespace)}" if prefix and namespace else ""
+    attributes = "".join(f" {name}={quoteattr(str(params[name]))}"
+                         for name in ("count", "startIndex", "outputFormat") if name in params)
+    srs_name = f" srsName={quoteattr(params['srsName'])}" if "srsName" in params else ""
+    properties = "".join(f"<wfs:PropertyName>{escape(name)}</wfs:PropertyName>"
+                         for name in params["propertyName"].split(",")) if "propertyName" in params else ""
+    sort_by = ""
+    if "sortBy" in params:
+        name, order = params["sortBy"].split(" ")
+        sort_by = (f'<fes:SortBy xmlns:fes="http://www.opengis.net/fes/2.0"><fes:SortProperty>'
+                   f'<fes:ValueReference>{escape(name)}</fes:ValueReference><fes:SortOrder>{order}</fes:SortOrder>'
+                   '</fes:SortProperty></fes:SortBy>')
+    return (f'<wfs:GetFeature xmlns:wfs="{WFS_NS_URI}"{declaration} service="WFS" version="2.0.0"{attributes}>'
+            f'<wfs:Query typeNames={quoteattr(typename)}{srs_name}>{properties}{fes_filter}{sort_by}</wfs:Query>'
+            '</wfs:GetFeature>').encode("utf-8")
+
+
+def covering_bboxes(aoi: QgsGeometry, extent: QgsRectangle, max_boxes: int = AOI_MAX_BOXES) -> List[QgsRectangle]:
+    """
+    Return rectangles covering the AOI within the extent: bounding boxes of the AOI parts in the cells of
+    a grid of about max_boxes cells. Returns [extent] if the boxes do not save at least a quarter of its area.
+    """
+    width, height = extent.width(), extent.height()
+    if width <= 0 or height <= 0:
+        return [extent]
+    cols = max(1, min(max_boxes, round(math.sqrt(max_boxes * width / height))))
+    rows = max(1, max_boxes // cols)
+
+    engine = QgsGeometry.createGeometryEngine(aoi.constGet())
+    engine.prepareGeometry()
+    boxes = []
+    for i in range(cols):
+        for j in range(rows):
+            cell = QgsRectangle(extent.xMinimum() + i * width / cols, extent.yMinimum() + j * height / rows,
+                                extent.xMinimum() + (i + 1) * width / cols, extent.yMinimum() + (j + 1) * height / rows)
+            cell_geom = QgsGeometry.fromRect(cell)
+            if not engine.intersects(cell_geom.constGet()):
+                continue
+            if engine.contains(cell_geom.constGet()):
+                boxes.append(cell)
+                continue
+            part = aoi.intersection(cell_geom)
+            if not part.isEmpty() and part.area() > 0:
+                boxes.append(part.boundingBox())
+
+    if not boxes or sum(box.area() for box in boxes) > AOI_MAX_BOXES_AREA * extent.area():
+        return [extent]
+    return boxes
+
+
+def _number_matched(content: bytes, geojson: bool, name: str = "numberMatched") -> Optional[int]:
+    # numberMatched (numberReturned) is in the FeatureCollection header (GML) or a top level member (GeoJSON),
+    # numberMatched may be "unknown"
+    pattern = rb'"%s"\s*:\s*(\d+)' % name.encode() if geojson else rb'%s="(\d+)"' % name.encode()
+    match = re.search(pattern, content if geojson else content[:4096])
+    return int(match.group(1)) if match else None
+
+
+def _is_feature_collection(content: bytes, geojson: bool) -> bool:
+    """Return True if the GetFeature response is a complete FeatureCollection (not an ExceptionReport or a
+    HTML error page returned with status 200, nor a truncated body)"""
+    body = content.strip()
+    if geojson:
+        return body.startswith(b"{") and body.endswith(b"}") and \
+            re.search(rb'"type"\s*:\s*"FeatureCollection"', body) is not None
+    # Root element after the XML declaration and comments
+    head = re.sub(rb"<\?.*?\?>|<!--.*?-->", b"", body[:4096], flags=re.S)
+    root = re.search(rb"<(?:[\w.-]+:)?(\w+)[\s/>]", head)
+    return root is not None and root.group(1) == b"FeatureCollection" and body.endswith(b"FeatureCollection>")
+
+
 class WFSDownloader:
     """ Class to download and clip WFS layers, used before and during WFStask """
 
-    def __init__(self, conf_path, area_flag, polygon, SoilFlag):
+    def __init__(self, conf_path, area_flag, polygon, SoilFlag, cache=None, attributes=None):
         self.config_path = conf_path
         self.AreaFlag = area_flag
         self.polygon = polygon
         self.SoilFlag = SoilFlag
+        self.cache = cache  # optional WFSTileCache for WFS sources
+        # Attributes read from each typename (see PluginConfig.required_attributes), None keeps all of them
+        self.attributes = attributes
+        self._aoi = None
+
+    def aoi_geometry(self) -> Optional[QgsGeometry]:
+        """Return the AOI polygon (union of the polygon layer) if processing inside the polygon, None otherwise"""
+        if not self.AreaFlag or not self.polygon or not self.polygon.isValid():
+            return None
+        if self._aoi is None:
+            geometries = [feature.geometry() for feature in self.polygon.getFeatures() if feature.hasGeometry()]
+            if not geometries:
+                return None
+            self._aoi = QgsGeometry.unaryUnion(geometries)
+        return self._aoi
+
+    def layer_attributes(self, layer_name: str) -> Optional[List[str]]:
+        """Return the attributes to download for the typename, None for all of them"""
+        if self.attributes is None:
+            return None
+        required = [name for name in self.attributes.get(layer_name, ()) if name not in PASSTHROUGH_ATTRIBUTES]
+        return list(PASSTHROUGH_ATTRIBUTES) + required
+
+    def cache_source(self, layer_name: str, URI: str) -> str:
+        """
+        Return the WFSTileCache source of the typename: the service URL and the requested attribute set,
+        so downloads of other attribute sets (or of all attributes) are cached apart.
+        """
+        attributes = self.layer_attributes(layer_name)
+        if attributes is None:
+            return f"{URI}#propertyName=*"
+        # Attributes are matched case-insensitively
+        return f"{URI}#propertyName={','.join(sorted({name.lower() for name in attributes}))}"
 
     def get_ZABAGED_layers_list(self) -> List[str]:
         """ Load WFS layers from the configuration file"""
@@ -32,8 +354,12 @@ class WFSDownloader:
                                      level=Qgis.Critical, notifyUser=True)
             return []
 
-    def clip_layer(self, layer: QgsVectorLayer, extent: QgsRectangle, layer_name: str) -> QgsVectorLayer:
-        """ Clip the layer to the given extent"""
+    def clip_layer(self, layer: QgsVectorLayer, extent: QgsRectangle, layer_name: str,
+                   attributes: Optional[List[str]] = None, aoi: Optional[QgsGeometry] = None) -> QgsVectorLayer:
+        """
+        Clip the layer to the given extent, keeping only the given attributes (case-insensitive) if set.
+        Features not intersecting the aoi polygon are dropped (they are not clipped to it).
+        """
         extent_geom = QgsGeometry.fromRect(extent)
         clipped_layer = QgsVectorLayer(
             f"{QgsWkbTypes.displayString(layer.wkbType())}?crs={layer.crs().authid()}",
@@ -41,18 +367,55 @@ class WFSDownloader:
             "memory"
         )
 
-        clipped_layer.dataProvider().addAttributes(layer.fields())
+        request = QgsFeatureRequest().setFilterRect(extent)
+        if attributes is None:
+            indexes = None
+            fields = layer.fields()
+        else:
+            wanted = {name.lower() for name in attributes}
+            indexes = [i for i, field in enumerate(layer.fields()) if field.name().lower() in wanted]
+            fields = QgsFields()
+            for i in indexes:
+                fields.append(layer.fields().at(i))
+            # Data providers (OGR for file:// sources) read only the kept attributes
+            request.setSubsetOfAttributes(indexes)
+
+        clipped_layer.dataProvider().addAttributes(fields)
         clipped_layer.updateFields()
 
-        for feature in layer.getFeatures(QgsFeatureRequest().setFilterRect(extent)):
+        # Prepared extent speeds up the intersects tests of boundary features
+        engine = QgsGeometry.createGeometryEngine(extent_geom.constGet())
+        engine.prepareGeometry()
+        aoi_engine = None
+        if aoi is not None:
+            aoi_engine = QgsGeometry.createGeometryEngine(aoi.constGet())
+            aoi_engine.prepareGeometry()
+
+        clipped_features = []
+        for feature in layer.getFeatures(request):
             geom = feature.geometry()
-            if geom.intersects(extent_geom):
-                clipped_feature = QgsFeature()
-                clipped_feature.setGeometry(geom.intersection(extent_geom))
+            if geom.isNull():
+                continue
+            if aoi_engine is not None and not aoi_engine.intersects(geom.constGet()):
+                continue
+            if extent.contains(geom.boundingBox()):
+                # Feature is fully inside the extent, no need to intersect
+                clipped_geom = geom
+            elif engine.intersects(geom.constGet()):
+                clipped_geom = geom.intersection(extent_geom)
+            else:
+                continue
+            clipped_feature = QgsFeature()
+            clipped_feature.setGeometry(clipped_geom)
+            if indexes is None:
                 clipped_feature.setAttributes(feature.attributes())
-                clipped_layer.dataProvider().addFeature(clipped_feature)
+            else:
+                feature_attributes = feature.attributes()
+                clipped_feature.setAttributes([feature_attributes[i] for i in indexes])
+            clipped_features.append(clipped_feature)
 
-        clipped_layer.commitChanges()
+        clipped_layer.dataProvider().addFeatures(clipped_features)
+        clipped_layer.updateExtents()
 
         return clipped_layer
 
@@ -74,33 +437,336 @@ class WFSDownloader:
 
     def process_wfs_layer(self, layer_name: str, ymin: float, xmin: float, ymax: float, xmax: float,
                           extent: QgsGeometry, URI: str) -> Optional[QgsVectorLayer]:
-        """ Load and clip a WFS layer to the given extent"""
+        """
+        Load and clip a WFS layer to the given extent.
+        In the polygon mode only features intersecting the AOI polygon are loaded (or kept for file:// sources).
+        """
+        aoi = self.aoi_geometry()
         if URI.startswith('file://'):
             uri = f"{URI[len('file://'):]}|layername={layer_name}"
-            data_provider = "ogr"
+            vlayer = QgsVectorLayer(uri, f"Layer: {layer_name}", "ogr")
+        elif self.cache is not None:
+            # Only tiles missing in the cache are downloaded, cached tiles are complete (not filtered by the AOI)
+            vlayer = self.cache.get_layer(layer_name, self.cache_source(layer_name, URI),
+                                          QgsRectangle(xmin, ymin, xmax, ymax),
+                                          lambda rect: self.load_wfs_layer(layer_name, rect, URI), aoi)
         else:
-            # WFS
-            uri = (
-                f"{URI}?"
-                f"version=2.0.0&request=GetFeature"
-                f"&typename={layer_name}"
-                f"&bbox={xmin},{ymin},{xmax},{ymax},EPSG:5514"
-            )
-            data_provider = "wfs"
-
-        vlayer = QgsVectorLayer(uri, f"Layer: {layer_name}", data_provider)
-        if not vlayer.isValid() or not vlayer.featureCount() or vlayer is None:
+            vlayer = self.load_wfs_layer(layer_name, QgsRectangle(xmin, ymin, xmax, ymax), URI, aoi)
+
+        if vlayer is None or not vlayer.isValid() or not vlayer.featureCount():
             QgsMessageLog.logMessage(f"Failed to load or empty layer: {layer_name}", "CzLandUseCN",
                                      level=Qgis.Critical, notifyUser=True)
             return None
 
-        clipped_layer = self.clip_layer(vlayer, extent, layer_name)
+        # The OGR provider reads the extent by its spatial index, the AOI test drops the rest
+        clipped_layer = self.clip_layer(vlayer, extent, layer_name, self.layer_attributes(layer_name), aoi)
         del vlayer # release data source
 
         if clipped_layer.isValid():
             return clipped_layer
         return None
 
+    def load_pretiled_layer(self, tiles_path: str, extent: QgsRectangle) -> Optional[QgsVectorLayer]:
+        """
+        Load the precomputed land use layer from the tiled GeoPackage (see LandUseTiles) and clip it
+        to the polygon or extent by AreaFlag. Returns None if the tiles do not cover the polygon (extent).
+        """
+        layer = LandUseTiles(tiles_path).get_layer(extent, aoi=self.aoi_geometry())
+        if layer is None:
+            return None
+        if self.AreaFlag and self.polygon:
+            return self.ClipByPolygon(layer)
+        return self.clip_layer(layer, extent, layer.name())
+
+    def load_wfs_layer(self, layer_name: str, bbox: QgsRectangle, URI: str,
+                       aoi: Optional[QgsGeometry] = None) -> Optional[QgsVectorLayer]:
+        """
+        Load WFS layer features intersecting the bbox (and the aoi polygon if given).
+        Services implementing result paging are read page by page into a memory layer, others by the WFS provider
+        (all attributes, the projection is applied by clip_layer).
+        The aoi is sent as an Intersects filter if the service supports it (by POST, or by GET if the filter
+        is short enough), otherwise the features are downloaded by sub-bboxes covering the aoi.
+        """
+        capabilities = wfs_capabilities(URI)
+        paging = capabilities is not None and capabilities.paging
+        use_filter = paging and capabilities.intersects and aoi is not None and (
+            capabilities.post or
+            len(quote(_intersects_filter("geometry", filter_polygon(aoi)))) <= FILTER_MAX_GET_LENGTH)
+        if aoi is not None and not use_filter:
+            boxes = covering_bboxes(aoi, bbox)
+            if len(boxes) > 1:
+                return self.load_wfs_layer_boxes(layer_name, boxes, URI)
+            aoi = None
+        if paging:
+            return self.load_wfs_layer_paged(layer_name, bbox, URI, capabilities, aoi)
+
+        uri = (
+            f"{URI}?"
+            f"version=2.0.0&request=GetFeature"
+            f"&typename={layer_name}"
+            f"&bbox={bbox.xMinimum()},{bbox.yMinimum()},{bbox.xMaximum()},{bbox.yMaximum()},EPSG:5514"
+        )
+        return QgsVectorLayer(uri, f"Layer: {layer_name}", "wfs")
+
+    def load_wfs_layer_boxes(self, layer_name: str, boxes: List[QgsRectangle], URI: str) -> Optional[QgsVectorLayer]:
+        """
+        Load WFS layer features intersecting any of the boxes into one memory layer.
+        Features found in more boxes are added once, identified by the WFS feature identifier (gml_id or id field,
+        else the identifier property, which layer_attributes keep in the propertyName projection).
+        Layers without any identifier (WFS provider) fall back to comparing geometry and attributes.
+        Returns None if any box fails.
+        """
+        layer = None
+        seen = set()
+        for box in boxes:
+            part = self.load_wfs_layer(layer_name, box, URI)
+            if part is None or not part.isValid():
+                return None
+            if not part.featureCount():
+                continue
+            if layer is None:
+                layer = QgsVectorLayer(
+                    f"{QgsWkbTypes.displayString(QgsWkbTypes.multiType(part.wkbType()))}?crs=EPSG:5514",
+                    f"Layer: {layer_name}", "memory")
+                layer.dataProvider().addAttributes(part.fields())
+                layer.updateFields()
+
+            id_index = next((part.fields().lookupField(name) for name in FEATURE_ID_FIELDS + SORT_PROPERTIES
+                             if part.fields().lookupField(name) >= 0), -1)
+            features = []
+            for part_feature in part.getFeatures():
+                geom = part_feature.geometry()
+                feature_id = part_feature.attribute(id_index) if id_index >= 0 else None
+                if feature_id is not None and str(feature_id) not in ("", "NULL"):
+                    key = str(feature_id)
+                else:
+                    key = hashlib.sha1(bytes(geom.asWkb()) + repr(part_feature.attributes()).encode('utf-8')).digest()
+                if key in seen:
+                    continue
+                seen.add(key)
+                if not geom.isNull():
+                    geom.convertToMultiType()
+                feature = QgsFeature(layer.fields())
+                feature.setGeometry(geom)
+                feature.setAttributes(part_feature.attributes())
+                features.append(feature)
+            layer.dataProvider().addFeatures(features)
+
+        QgsMessageLog.logMessage(f"{layer_name}: {len(seen)} features in {len(boxes)} boxes covering the AOI",
+                                 "CzLandUseCN", level=Qgis.Info)
+        if layer is None:
+            return QgsVectorLayer("None?crs=EPSG:5514", f"Layer: {layer_name}", "memory")
+        layer.updateExtents()
+        return layer
+
+    def load_wfs_layer_paged(self, layer_name: str, bbox: QgsRectangle, URI: str, capabilities: WFSCapabilities,
+                             aoi: Optional[QgsGeometry] = None) -> Optional[QgsVectorLayer]:
+        """
+        Load WFS layer features intersecting the bbox by GetFeature pages of count/startIndex.
+        With the aoi the features are selected by an Intersects filter of its simplified polygon instead,
+        sent as an XML GetFeature request by POST if the service accepts it.
+        Each page is added to the memory layer as it arrives, GeoJSON is requested if the service offers it.
+        Only geometry and layer_attributes are requested (propertyName) if the feature type schema is known.
+        Features are requested in EPSG:5514 (srsName) and sorted by their identifier property if the service
+        implements sorting, so that startIndex pages do not skip or repeat features.
+        Returns None if a request fails or a page is not a valid FeatureCollection, a layer without geometry
+        if nothing is found.
+        """
+        page_size = min(WFS_PAGE_SIZE, capabilities.count_default or WFS_PAGE_SIZE)
+        geojson = capabilities.geojson_format is not None
+        params = {
+            "service": "WFS", "version": "2.0.0", "request": "GetFeature", "typenames": layer_name,
+            "bbox": f"{bbox.xMinimum()},{bbox.yMinimum()},{bbox.xMaximum()},{bbox.yMaximum()},EPSG:5514",
+            "count": page_size, "srsName": SRS_NAME,
+        }
+        if geojson:
+            params["outputFormat"] = capabilities.geojson_format
+
+        layer = None
+        start_index = 0
+        page = 0
+        download_start = time.perf_counter()
+        with requests.Session() as session:
+            session.headers["Accept-Encoding"] = "gzip"
+            attributes = self.layer_attributes(layer_name)
+            schema_needed = not geojson or attributes is not None or aoi is not None or capabilities.sorting
+            schema = _feature_schema(session, URI, layer_name) if schema_needed else None
+            property_names = _property_names(schema, attributes) if attributes is not None else None
+            if property_names:
+                params["propertyName"] = ",".join(property_names)
+            sort_property = _sort_property(schema) if capabilities.sorting else None
+            if sort_property is not None:
+                params["sortBy"] = f"{sort_property} ASC"
+            geometry_property = _geometry_property(schema) if aoi is not None else None
+            fes_filter = None
+            if geometry_property is not None:
+                # bbox and filter are mutually exclusive
+                del params["bbox"]
+                fes_filter = _intersects_filter(geometry_property, filter_polygon(aoi))
+                if not capabilities.post:
+                    params["filter"] = fes_filter
+            namespace = _schema_namespace(schema) if fes_filter is not None and capabilities.post else None
+            if geojson:
+                schema = None  # only GML pages are read with the schema
+            while True:
+                page_start = time.perf_counter()
+                try:
+                    if fes_filter is not None and capabilities.post:
+                        response = session.post(URI, data=_get_feature_xml(dict(params, startIndex=start_index),
+                                                                           fes_filter, namespace),
+                                                headers={"Content-Type": "text/xml"}, timeout=WFS_TIMEOUT)
+                    else:
+                        response = session.get(URI, params=dict(params, startIndex=start_index),
+                                               timeout=WFS_TIMEOUT)
+                    response.raise_for_status()
+                except requests.RequestException as e:
+                    QgsMessageLog.logMessage(f"Failed to download page {page} of {layer_name}: {e}", "CzLandUseCN",
+                                             level=Qgis.Warning)
+                    return None
+                download_time = time.perf_counter() - page_start
+
+                layer, returned = self._add_page(layer, layer_name, response.content, geojson, schema)
+                if returned is None:
+                    QgsMessageLog.logMessage(f"Invalid response to page {page} of {layer_name}: "
+                                             f"{response.content[:200]!r}", "CzLandUseCN", level=Qgis.Warning)
+                    return None
+                matched = _number_matched(response.content, geojson)
+                QgsMessageLog.logMessage(
+                    f"{layer_name} page {page}: {returned} features, {len(response.content)} bytes "
+                    f"({response.headers.get('Content-Encoding', 'identity')}), "
+                    f"downloaded in {download_time:.2f}s, loaded in {time.perf_counter() - page_start - download_time:.2f}s",
+                    "CzLandUseCN", level=Qgis.Info)
+
+                start_index += returned
+                page += 1
+                # The server may return less than count (its own limit), numberMatched tells if more pages follow,
+                # without it (or "unknown") pages are read until an empty one
+                if not returned or (matched is not None and start_index >= matched):
+                    break
+
+        QgsMessageLog.logMessage(f"{layer_name}: {start_index} features in {page} pages "
+                                 f"({'AOI filter' if fes_filter is not None else 'bbox'}), "
+                                 f"{time.perf_counter() - download_start:.2f}s", "CzLandUseCN", level=Qgis.Info)
+        if layer is None:
+            return QgsVectorLayer("None?crs=EPSG:5514", f"Layer: {layer_name}", "memory")
+        return layer
+
+    def _add_page(self, layer: Optional[QgsVectorLayer], layer_name: str, content: bytes, geojson: bool,
+                  schema: Optional[bytes]) -> Tuple[Optional[QgsVectorLayer], Optional[int]]:
+        """
+        Read one GetFeature response by OGR and append its features to the memory layer (created on first page).
+        Returns the layer and the number of added features, None instead of the number if the response
+        is not a valid FeatureCollection or OGR does not read all of its numberReturned features.
+        """
+        if not _is_feature_collection(content, geojson):
+            return layer, None
+        number_returned = _number_matched(content, geojson, "numberReturned")
+        base = f"/vsimem/wfs_page_{uuid.uuid4().hex}"
+        path = f"{base}.json" if geojson else f"{base}.gml"
+        gdal.FileFromMemBuffer(path, content)
+        if schema is not None:
+            gdal.FileFromMemBuffer(f"{base}.xsd", schema)  # picked up by the GML driver next to the .gml
+        try:
+            # gml_id identifies the features of overlapping requests (see load_wfs_layer_boxes)
+            page_layer = QgsVectorLayer(path if geojson else f"{path}|option:EXPOSE_GML_ID=YES", layer_name, "ogr")
+            if not page_layer.isValid() or not page_layer.featureCount():
+                # OGR does not open empty collections
+                return layer, None if number_returned else 0
+
+            if layer is None:
+                layer = QgsVectorLayer(
+                    f"{QgsWkbTypes.displayString(QgsWkbTypes.multiType(page_layer.wkbType()))}?crs=EPSG:5514",
+                    f"Layer: {layer_name}", "memory")
+                layer.dataProvider().addAttributes(page_layer.fields())
+                layer.updateFields()
+
+            # Services ignoring srsName answer in their default CRS (GeoJSON without crs member is read as WGS 84,
+            # its coordinates are in the requested CRS unless they are in the longitude/latitude range)
+            transform = None
+            page_crs = page_layer.crs()
+            if page_crs.isValid() and page_crs.authid() != "EPSG:5514" and not (
+                    geojson and page_crs.authid() == "EPSG:4326" and
+                    not QgsRectangle(-180, -90, 180, 90).contains(page_layer.extent())):
+                transform = QgsCoordinateTransform(page_crs, layer.crs(), QgsProject.instance())
+
+            # Pages may differ in field order and single/multi geometries
+            fields = layer.fields()
+            page_indexes = [page_layer.fields().indexOf(field.name()) for field in fields]
+            features = []
+            for page_feature in page_layer.getFeatures():
+                feature = QgsFeature(fields)
+                geom = page_feature.geometry()
+                if not geom.isNull():
+                    if transform is not None:
+                        geom.transform(transform)
+                    geom.convertToMultiType()
+                feature.setGeometry(geom)
+                attributes = page_feature.attributes()
+                feature.setAttributes([attributes[i] if i >= 0 else None for i in page_indexes])
+                features.append(feature)
+            if number_returned is not None and len(features) != number_returned:
+                return layer, None
+            layer.dataProvider().addFeatures(features)
+            layer.updateExtents()
+            return layer, len(features)
+        finally:
+            page_layer = None
+            gdal.Unlink(path)
+            if schema is not None:
+                gdal.Unlink(f"{base}.xsd")
+
+    def process_wfs_layers(self, layer_names: List[str], ymin: float, xmin: float, ymax: float, xmax: float,
+                           extent: QgsGeometry, URI: str, workers: int = 1,
+                           is_canceled: Optional[Callable[[], bool]] = None,
+                           layer_done: Optional[Callable[[str, Optional[QgsVectorLayer]], None]] = None
+                           ) -> List[Optional[QgsVectorLayer]]:
+        """
+        Load and clip several layers, up to `workers` of them at once.
+        Only paged services (requests and OGR) and file:// sources are loaded by the thread pool, layers of services
+        without paging are created by the QGIS WFS provider and loaded one by one in the calling thread.
+        The result keeps the order of layer_names (None for failed, skipped or canceled layers).
+        layer_done is called in the calling thread after each finished layer.
+        """
+        results: List[Optional[QgsVectorLayer]] = [None] * len(layer_names)
+        if is_canceled is None:
+            is_canceled = lambda: False
+
+        def download(layer_name: str) -> Optional[QgsVectorLayer]:
+            if is_canceled():
+                return None
+            return self.process_wfs_layer(layer_name, ymin, xmin, ymax, xmax, extent, URI)
+
+        # Polygon layer is read in the calling thread only
+        self.aoi_geometry()
+
+        capabilities = None if URI.startswith('file://') else wfs_capabilities(URI)
+        wfs_provider = not URI.startswith('file://') and (capabilities is None or not capabilities.paging)
+        if workers <= 1 or wfs_provider:
+            for i, layer_name in enumerate(layer_names):
+                if is_canceled():
+                    break
+                results[i] = download(layer_name)
+                if layer_done is not None:
+                    layer_done(layer_name, results[i])
+            return results
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(download, layer_name): i for i, layer_name in enumerate(layer_names)}
+            try:
+                for future in as_completed(futures):
+                    i = futures[future]
+                    results[i] = future.result()
+                    if layer_done is not None:
+                        layer_done(layer_names[i], results[i])
+                    if is_canceled():
+                        break
+            finally:
+                # Drop layers that have not started yet (canceled or failed run)
+                for future in futures:
+                    future.cancel()
+
+        return results
+
     def ClipByPolygon(self, layer: QgsVectorLayer) -> QgsVectorLayer:
         """ Clip the layer to the polygon extent"""
         fixed_input = processing.run(
@@ -136,7 +802,8 @@ class WFSDownloader:
     def GetLPISLayer(self, LPISURI: str, layer_name: str, LPISconfigpath: str, ymin: float, xmin: float, ymax: float,
                      xmax: float, current_extent: QgsGeometry, LayerList: list) -> list:
         """ Get the LPIS layer from the WFS service"""
-        wfs_downloader = WFSDownloader(LPISconfigpath, self.AreaFlag, self.polygon, self.SoilFlag)
+        wfs_downloader = WFSDownloader(LPISconfigpath, self.AreaFlag, self.polygon, self.SoilFlag, self.cache,
+                                       self.attributes)
         LPISlayer = wfs_downloader.process_wfs_layer(layer_name, ymin, xmin, ymax, xmax, current_extent, LPISURI)
         if LPISlayer is None:
             QgsMessageLog.logMessage("Unavailable LPIS Layer", "CzLandUseCN", level=Qgis.Critical,
@@ -4,7 +4,8 @@ from qgis.PyQt.QtCore import pyqtSignal
 from qgis.core import QgsTask, QgsMessageLog, Qgis
 
 from .WFSdownloader import WFSDownloader
-from .PluginUtils import get_string_from_yaml
+from .WFScache import WFSTileCache
+from .PluginConfig import load_lpis_config, load_zabaged_config, required_attributes
 
 
 class TASK_process_wfs_layer(QgsTask):
@@ -54,31 +55,48 @@ class TASK_process_wfs_layer(QgsTask):
         QgsMessageLog.logMessage("WFS task started.", "CzLandUseCN",
                                  level=Qgis.Info, notifyUser=False)
 
-        wfs_downloader = WFSDownloader(os.path.join(os.path.dirname(__file__), 'config', 'layers_merging_order.csv'),
-                                       self.AreaFlag, self.polygon, False)
+        cache = WFSTileCache.from_config(os.path.join(os.path.dirname(__file__), 'config', 'WFS_cache.yaml'))
 
         self._update_progress_bar()
-        LPISconfigpath = os.path.join(self.config_path, 'LPIS.yaml')
-        LPISURI = get_string_from_yaml(LPISconfigpath, "URI")
-        LPISlayername = get_string_from_yaml(LPISconfigpath, "layer_name")
-        self.LandUseLayers = wfs_downloader.GetLPISLayer(LPISURI, LPISlayername, LPISconfigpath, self.ymin, self.xmin,
-                                                         self.ymax, self.xmax, self.current_extent, self.LandUseLayers)
-
         try:
-            zabaged_URL = get_string_from_yaml(os.path.join(self.config_path, 'ZABAGED.yaml'),
-                                               "URI")
+            LPISconfigpath = os.path.join(self.config_path, 'LPIS.yaml')
+            lpis_config = load_lpis_config(LPISconfigpath)
+            zabaged_config = load_zabaged_config(os.path.join(self.config_path, 'ZABAGED.yaml'))
+            # Only attributes used by the LandUse processing are downloaded
+            wfs_downloader = WFSDownloader(
+                os.path.join(os.path.dirname(__file__), 'config', 'layers_merging_order.csv'),
+                self.AreaFlag, self.polygon, False, cache, required_attributes(zabaged_config, lpis_config))
+
+            self.LandUseLayers = wfs_downloader.GetLPISLayer(lpis_config.uri, lpis_config.layer_name, LPISconfigpath,
+                                                             self.ymin, self.xmin, self.ymax, self.xmax,
+                                                             self.current_extent, self.LandUseLayers)
+
+            zabaged_URL = zabaged_config.uri
+            workers = zabaged_config.download_workers
 
-            i = 1
-            for self.layer in self.wfs_layers:
+            def layer_done(layer_name, layer):
+                self._update_progress_bar()
+                QgsMessageLog.logMessage(f"Layer downloaded: {layer_name}", "CzLandUseCN",
+                                         level=Qgis.Info, notifyUser=False)
+
+            # Download the layers concurrently, results keep the stacking order of wfs_layers
+            wfs_layers = wfs_downloader.process_wfs_layers(self.wfs_layers, self.ymin, self.xmin, self.ymax,
+                                                           self.xmax, self.current_extent, zabaged_URL,
+                                                           workers=workers,
+                                                           is_canceled=lambda: self._is_canceled,
+                                                           layer_done=layer_done)
+            if self._is_canceled:
+                return False
+            if cache is not None:
+                stats = cache.stats()
+                QgsMessageLog.logMessage(f"WFS cache: {stats['hits']} tiles cached, {stats['misses']} downloaded, "
+                                         f"{stats['evictions']} evicted", "CzLandUseCN",
+                                         level=Qgis.Info, notifyUser=False)
+
+            for self.layer, wfsLayer in zip(self.wfs_layers, wfs_layers):
                 if self._is_canceled:
                     return False
-                if i > 1:
-                    self._update_progress_bar()
-                i += 1
-
-                wfsLayer = wfs_downloader.process_wfs_layer(self.layer, self.ymin, self.xmin, self.ymax, self.xmax,
-                                                            self.current_extent, zabaged_URL)
-                if wfsLayer.featureCount() == 0:
+                if wfsLayer is None or wfsLayer.featureCount() == 0:
                     continue
                 if self.AreaFlag and self.polygon:
                     clippedLayer = wfs_downloader.ClipByPolygon(wfsLayer)
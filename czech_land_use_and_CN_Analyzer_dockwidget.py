@@ -36,6 +36,7 @@ from qgis.utils import iface
 
 from .RunOffTask import TASK_RunOff
 from .CNtask import TASK_CN
+from .CNCreator import cn_inputs_match
 from .IntersectionTask import TASK_Intersection
 from .SoilTask import TASK_process_soil_layer
 from .UIupdater import UIUpdater, get_checked_return_periods
@@ -43,7 +44,6 @@ from .WFSdownloader import WFSDownloader
 from .InputChecker import InputChecker, overlap_check, is_valid_cn_csv
 from .WFStask import TASK_process_wfs_layer
 from .LayerEditor import (LayerEditor, get_polygon_from_extent, dissolve_polygon,
-                          clip_larger_layer_to_smaller,
                           resolve_overlaping_buffers)
 from .LayerEditorTask import TASK_edit_layers
 
@@ -89,6 +89,7 @@ class czech_land_use_and_CN_AnalyzerDockWidget(QtWidgets.QDockWidget, FORM_CLASS
         self.DownloadFlag = 0 # 0 == LandUse and Soil, 1 == only LandUse, 2 == only Soil
 
         self.LandUseLayers = LandUseLayers# List of LandUse layers for merge in the end
+        self.CN_layers = {}  # intersection layer id -> id of the CN layer created from it
 
         self.extentButton.setChecked(True)
         self.LUandSoilSelectButton.setChecked(True)
@@ -510,14 +511,21 @@ class czech_land_use_and_CN_AnalyzerDockWidget(QtWidgets.QDockWidget, FORM_CLASS
             self.ui_updater.ErrorMsg(f"Error occurred: {e}")
             QgsMessageLog.logMessage(f"Error in RunIntersection: {str(e)}", "CzLandUseCN", level=Qgis.Critical)
 
-    def taskFinished_CN(self, layerlist):
+    def taskFinished_CN(self, layerlist, IntLayer_id=None):
         """Handle task completion for CN layer."""
         layer = layerlist[0]
 
         self.CNButton.setEnabled(True)
         iface.messageBar().clearWidgets()
 
-        self.mMapLayerComboBox_CN.setLayer(QgsProject.instance().addMapLayer(layer))
+        if QgsProject.instance().mapLayer(layer.id()) is None:
+            layer = QgsProject.instance().addMapLayer(layer)
+        else:
+            # CN values updated in place
+            layer.triggerRepaint()
+        if IntLayer_id is not None:
+            self.CN_layers[IntLayer_id] = layer.id()
+        self.mMapLayerComboBox_CN.setLayer(layer)
         iface.messageBar().pushMessage("Success", "Task completed successfully", level=Qgis.Success, duration=5)
 
 
@@ -556,8 +564,14 @@ class czech_land_use_and_CN_AnalyzerDockWidget(QtWidgets.QDockWidget, FORM_CLASS
 
         try:
             # Create a task to process the intersection of Soil and Land Use layers
-            task = TASK_CN(IntLayer, CN_table_path)
-            task.taskFinished_CN.connect(self.taskFinished_CN)
+            # Reuse the CN layer created from the same intersection layer if only the CN table may have changed,
+            # edits of LandUse_code or HSG in the intersection layer need a new CN layer
+            CNLayer = QgsProject.instance().mapLayer(self.CN_layers.get(IntLayer.id(), ""))
+            if CNLayer is not None and not cn_inputs_match(IntLayer, CNLayer):
+                CNLayer = None
+            task = TASK_CN(IntLayer, CN_table_path, CNLayer)
+            task.taskFinished_CN.connect(lambda layerlist, IntLayer_id=IntLayer.id():
+                                         self.taskFinished_CN(layerlist, IntLayer_id))
 
             # Add task to manager and retry if it fails
             self.task_manager.addTask(task)
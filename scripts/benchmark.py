@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+
+"""Micro benchmarks of the plugin processing steps.
+
+Example usage:
+    python3 scripts/benchmark.py weighted_runoff --sizes 1000 10000 50000
+    python3 scripts/benchmark.py batch_scaling --sizes 1 2 4 8
+"""
+
+import os
+import sys
+import csv
+import time
+import types
+import tempfile
+import argparse
+import subprocess
+from pathlib import Path
+
+import yaml
+
+os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+
+PLUGIN_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def message(msg):
+    print(msg, file=sys.stderr)
+
+
+def timed(func, *args, **kwargs):
+    """Run func and return (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def report(name, size, reference, optimized):
+    speedup = reference / optimized if optimized > 0 else float('inf')
+    print(f"{name:<24} n={size:<8} reference={reference:9.3f}s  optimized={optimized:9.3f}s  speedup={speedup:7.1f}x")
+
+
+def bench_weighted_runoff(sizes):
+    """RunOffComputer.calculate_weighted_runoffs vs. the per-feature reference loop."""
+    reoccurrences = ["N2", "N5", "N10", "N20", "N50", "N100"]
+    shapes = ["A", "B", "C", "D", "E", "F"]
+
+    csv_path = os.path.join(tempfile.mkdtemp(prefix='bench_wps_'), 'output.csv')
+    row = {f"QAPI_tvar{shape}": 0.1 * (i + 1) for i, shape in enumerate(shapes)}
+    for rec in reoccurrences:
+        row.update({f"P_{rec}tvar{shape}_%": 10.0 + i for i, shape in enumerate(shapes)})
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(row.keys()))
+        writer.writeheader()
+        writer.writerow(row)
+
+    def build_layer(size):
+        layer = QgsVectorLayer("Polygon?crs=EPSG:5514", "runoff", "memory")
+        fields = [QgsField(f"V_{rec}_m3", QVariant.Double) for rec in reoccurrences]
+        for rec in reoccurrences:
+            fields += [QgsField(f"CN2_{rec}_runoff_volume_m3", QVariant.Double),
+                       QgsField(f"CN3_{rec}_runoff_volume_m3", QVariant.Double)]
+        layer.dataProvider().addAttributes(fields)
+        layer.updateFields()
+        features = []
+        for i in range(size):
+            feat = QgsFeature(layer.fields())
+            for rec in reoccurrences:
+                feat[f"CN2_{rec}_runoff_volume_m3"] = 1.5 * i
+                feat[f"CN3_{rec}_runoff_volume_m3"] = 2.0 * i
+            features.append(feat)
+        layer.dataProvider().addFeatures(features)
+        return layer
+
+    for size in sizes:
+        computers = []
+        for _ in range(2):
+            roc = RunOffComputer(None, reoccurrences, False, [], 0.2, None, None)
+            roc.csv_list = [csv_path]
+            roc.runoff_layer = build_layer(size)
+            computers.append(roc)
+        _, t_ref = timed(computers[0]._calculate_weighted_runoffs_per_feature)
+        _, t_opt = timed(computers[1].calculate_weighted_runoffs)
+        report("weighted_runoff", size, t_ref, t_opt)
+
+
+def bench_base_runoff(sizes):
+    """RunOffComputer.calculate_base_runoffs vs. the per-feature reference loop."""
+    heights = [10.0, 20.0, 30.0, 40.0, 50.0, 60.0]
+
+    def build_computer(size):
+        roc = RunOffComputer(None, None, True, heights, 0.2, None, None)
+        layer = QgsVectorLayer("Polygon?crs=EPSG:5514", "runoff", "memory")
+        layer.dataProvider().addAttributes([QgsField("CN2", QVariant.Double), QgsField("CN3", QVariant.Double),
+                                            QgsField("SHAPE_Area", QVariant.Double)])
+        layer.updateFields()
+        features = []
+        for i in range(size):
+            feat = QgsFeature(layer.fields())
+            feat.setAttributes([60.0 + i % 30, 75.0 + i % 20, 100.0 + i])
+            features.append(feat)
+        layer.dataProvider().addFeatures(features)
+        roc.runoff_layer = roc.create_new_fields(layer)
+        return roc
+
+    for size in sizes:
+        reference, columnar = build_computer(size), build_computer(size)
+        _, t_ref = timed(reference._calculate_base_runoffs_per_feature)
+        _, t_opt = timed(columnar.calculate_base_runoffs)
+        report("base_runoff", size, t_ref, t_opt)
+
+
+def fixture_layer(name, size):
+    """Load a test fixture into a memory layer, repeating its features up to size."""
+    path = os.path.join(PLUGIN_ROOT, "tests", "input_files", "testing_LayerEditor_data", f"{name}.gpkg")
+    source = QgsVectorLayer(f"{path}|layername={name}", name, "ogr")
+    layer = QgsVectorLayer(f"{QgsWkbTypes.displayString(source.wkbType())}?crs={source.crs().authid()}",
+                           name, "memory")
+    layer.dataProvider().addAttributes(source.fields())
+    layer.updateFields()
+    originals = list(source.getFeatures())
+    features = []
+    for i in range(size):
+        feat = QgsFeature(layer.fields())
+        feat.setGeometry(originals[i % len(originals)].geometry())
+        feat.setAttributes(originals[i % len(originals)].attributes())
+        features.append(feat)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def bench_bulk_attributes(sizes):
+    """Edit buffer updateFeature loop vs. set_attribute_value on the LayerEditor test fixtures."""
+
+    def edit_buffer_loop(layer, field_name, value):
+        layer.startEditing()
+        for feature in layer.getFeatures():
+            feature[field_name] = value
+            layer.updateFeature(feature)
+        layer.commitChanges()
+
+    for name in ("low", "mid", "top"):
+        for size in sizes:
+            layers = []
+            for _ in range(2):
+                layer = fixture_layer(name, size)
+                layer.dataProvider().addAttributes([QgsField("LandUse_code", QVariant.Int)])
+                layer.updateFields()
+                layers.append(layer)
+            _, t_ref = timed(edit_buffer_loop, layers[0], "LandUse_code", 44100)
+            _, t_opt = timed(set_attribute_value, layers[1], "LandUse_code", 44100)
+            report(f"bulk_attributes[{name}]", size, t_ref, t_opt)
+
+
+def bench_buffer(sizes):
+    """Per-feature buffer and addFeature vs. attribute_layer_buffer grouped by distance on the top test fixture."""
+    values, distances = [["fat", "also_fat"], ["full-figured"], ["thin", "even_thiner"]], [3, 2, 1]
+
+    def per_feature_loop(layer):
+        buffer_layer = QgsVectorLayer(f"Polygon?crs={layer.crs().authid()}", "top", "memory")
+        buffer_layer.startEditing()
+        buffer_layer.dataProvider().addAttributes(layer.fields())
+        buffer_layer.updateFields()
+        flat_values = [item for sublist in values for item in sublist]
+        for feature in layer.getFeatures():
+            value = feature["buf_atr"]
+            distance = distances[flat_values.index(value) // len(values[0])] if value in flat_values else 1
+            new_feature = QgsFeature()
+            new_feature.setGeometry(feature.geometry().buffer(distance, 2))
+            new_feature.setAttributes(feature.attributes())
+            buffer_layer.addFeature(new_feature)
+        buffer_layer.commitChanges()
+
+    for size in sizes:
+        layer = fixture_layer("top", size)
+        _, t_ref = timed(per_feature_loop, layer)
+        _, t_opt = timed(attribute_layer_buffer, layer, "buf_atr", 1, ["1", "2", "3"], values, distances, "top")
+        report("buffer", size, t_ref, t_opt)
+
+
+def bench_buffer_dissolve(sizes):
+    """Buffer, clip_layer and native:dissolve by LandUse_code vs. fused buffer_and_dissolve on the top test fixture."""
+    values, distances = [["fat", "also_fat"], ["full-figured"], ["thin", "even_thiner"]], [3, 2, 1]
+    value_distances = {value: distance for level, distance in zip(values, distances) for value in level}
+
+    def pipeline(layer, extent):
+        buffered = attribute_layer_buffer(layer, "buf_atr", 1, ["1", "2", "3"], values, distances, "top")
+        clipped = WFSDownloader(None, False, None, False).clip_layer(buffered, extent, "top")
+        return dissolve_and_resolve_overlaps(clipped, "LandUse_code")
+
+    for size in sizes:
+        layer = fixture_layer("top", size)
+        layer.dataProvider().addAttributes([QgsField("LandUse_code", QVariant.Int)])
+        layer.updateFields()
+        set_attribute_value(layer, "LandUse_code", 30000)
+        extent = layer.extent()
+        extent.scale(0.5)
+        _, t_ref = timed(pipeline, layer, extent)
+        _, t_opt = timed(buffer_and_dissolve, layer, 1, "buf_atr", value_distances, QgsGeometry.fromRect(extent))
+        report("buffer_dissolve", size, t_ref, t_opt)
+
+
+def bench_constant_fields(sizes):
+    """set_attribute_value of a provider field vs. add_constant_field expression field on the test fixtures."""
+    for name in ("low", "mid", "top"):
+        for size in sizes:
+            written, virtual = fixture_layer(name, size), fixture_layer(name, size)
+            written.dataProvider().addAttributes([QgsField("source", QVariant.String)])
+            written.updateFields()
+            _, t_ref = timed(set_attribute_value, written, "source", name)
+            _, t_opt = timed(add_constant_field, virtual, "source", name, QVariant.String)
+            report(f"constant_fields[{name}]", size, t_ref, t_opt)
+
+
+def bench_clip_layer(sizes):
+    """Per-feature intersection and addFeature vs. WFSDownloader.clip_layer on the LayerEditor test fixtures."""
+
+    def per_feature_clip(layer, extent):
+        extent_geom = QgsGeometry.fromRect(extent)
+        clipped_layer = QgsVectorLayer(f"{QgsWkbTypes.displayString(layer.wkbType())}?crs={layer.crs().authid()}",
+                                       "clipped", "memory")
+        clipped_layer.dataProvider().addAttributes(layer.fields())
+        clipped_layer.updateFields()
+        for feature in layer.getFeatures(QgsFeatureRequest().setFilterRect(extent)):
+            geom = feature.geometry()
+            if geom.intersects(extent_geom):
+                clipped_feature = QgsFeature()
+                clipped_feature.setGeometry(geom.intersection(extent_geom))
+                clipped_feature.setAttributes(feature.attributes())
+                clipped_layer.dataProvider().addFeature(clipped_feature)
+        return clipped_layer
+
+    wfs_downloader = WFSDownloader(None, False, None, False)
+    for name in ("low", "mid", "top"):
+        for size in sizes:
+            layer = fixture_layer(name, size)
+            extent = layer.extent()
+            extent.scale(0.8)
+            _, t_ref = timed(per_feature_clip, layer, extent)
+            _, t_opt = timed(wfs_downloader.clip_layer, layer, extent, "clipped")
+            report(f"clip_layer[{name}]", size, t_ref, t_opt)
+
+
+def bench_stack_layers(sizes):
+    """Processing difference/union loop vs. single pass stack_polygon_layers on the LayerEditor test fixtures."""
+    for size in sizes:
+        # size features per layer, ordered by priority
+        layers = [fixture_layer(name, size) for name in ("top", "mid", "low")]
+        _, t_ref = timed(stack_layers_union, layers)
+        _, t_opt = timed(stack_polygon_layers, layers, "LandUse Layer")
+        report("stack_layers", size, t_ref, t_opt)
+
+
+def bench_cn_layer(sizes):
+    """Per-feature CN dictionary lookup and addFeature vs. vectorized CNCreator.CreateCNLayer."""
+    cn_table = os.path.join(PLUGIN_ROOT, "config", "CN_table.csv")
+    with open(cn_table, encoding="utf-8") as f:
+        codes = [int(row[0]) for row in csv.reader(f) if row and row[0].isdigit()]
+
+    for size in sizes:
+        layer = QgsVectorLayer("Polygon?crs=EPSG:5514", "intersection", "memory")
+        layer.dataProvider().addAttributes([QgsField("LandUse_code", QVariant.Int), QgsField("HSG", QVariant.Int)])
+        layer.updateFields()
+        features = []
+        for i in range(size):
+            feat = QgsFeature(layer.fields())
+            feat.setGeometry(QgsGeometry.fromWkt(f"POLYGON(({i} 0, {i + 1} 0, {i + 1} 1, {i} 0))"))
+            feat.setAttributes([codes[i % len(codes)], i % 5])
+            features.append(feat)
+        layer.dataProvider().addFeatures(features)
+
+        cn_creator = CNCreator(layer, cn_table)
+
+        def reference():
+            cn_layer = cn_creator._create_memory_layer()
+            cn_creator._copy_features_with_cn_per_feature(cn_layer, cn_creator._load_cn_table())
+
+        _, t_ref = timed(reference)
+        _, t_opt = timed(cn_creator.CreateCNLayer)
+        report("cn_layer", size, t_ref, t_opt)
+
+
+def bench_intersection(sizes):
+    """Clip, native:union and NULL cleanup vs. overlay_landuse_hsg with a 20x20 grid soil layer."""
+    for size in sizes:
+        landuse = stack_polygon_layers([fixture_layer(name, size) for name in ("top", "mid", "low")], "LandUse Layer")
+        extent = landuse.extent()
+        soil = QgsVectorLayer(f"MultiPolygon?crs={landuse.crs().authid()}", "Soil Layer HSG", "memory")
+        soil.dataProvider().addAttributes([QgsField("HSG", QVariant.Int), QgsField("layer", QVariant.String)])
+        soil.updateFields()
+        step_x, step_y = extent.width() / 20, extent.height() / 20
+        features = []
+        for i in range(20):
+            for j in range(20):
+                feat = QgsFeature(soil.fields())
+                x, y = extent.xMinimum() + i * step_x, extent.yMinimum() + j * step_y
+                feat.setGeometry(QgsGeometry.fromRect(QgsRectangle(x, y, x + step_x, y + step_y)))
+                feat.setAttributes([(i + j) % 5, "output"])
+                features.append(feat)
+        soil.dataProvider().addFeatures(features)
+
+        def reference():
+            clipped_soil, clipped_landuse = clip_larger_layer_to_smaller(soil, landuse)
+            combined = processing.run("native:union", {"INPUT": clipped_landuse, "OVERLAY": clipped_soil,
+                                                       "OUTPUT": "memory:"})["OUTPUT"]
+            request = QgsFeatureRequest().setFilterExpression('"layer" IS NULL')
+            combined.dataProvider().deleteFeatures([feat.id() for feat in combined.getFeatures(request)])
+
+        _, t_ref = timed(reference)
+        _, t_opt = timed(overlay_landuse_hsg, landuse, soil)
+        report("intersection", size, t_ref, t_opt)
+
+
+def bench_soil_vectorize(sizes):
+    """gdal:polygonize of the whole soil raster and native:clip vs. vectorize_soil_raster of the window, --sizes runs."""
+    raster_path = os.path.join(PLUGIN_ROOT, "tests", "reference", "soil_reference.tif")
+    plg_path = os.path.join(PLUGIN_ROOT, "tests", "input_files", "testing_LayerEditor_data", "low.gpkg")
+    polygon = QgsVectorLayer(f"{plg_path}|layername=low", "low", "ogr")
+
+    def reference():
+        polygonized = processing.run("gdal:polygonize", {"INPUT": raster_path, "BAND": 1, "FIELD": "HSG",
+                                                         "EIGHT_CONNECTEDNESS": False,
+                                                         "OUTPUT": "TEMPORARY_OUTPUT"})["OUTPUT"]
+        return simple_clip(QgsVectorLayer(polygonized, "Soil Layer", "ogr"), polygon)
+
+    def repeated(func, runs, *args):
+        for _ in range(runs):
+            func(*args)
+
+    for runs in sizes:
+        _, t_ref = timed(repeated, reference, runs)
+        _, t_opt = timed(repeated, vectorize_soil_raster, runs, raster_path, polygon)
+        report("soil_vectorize", runs, t_ref, t_opt)
+
+
+def bench_aoi_filter(sizes):
+    """Stub WFS download of the AOI extent vs. Intersects filter of an elongated AOI, --sizes grid cells per side."""
+    x0, y0 = -700000, -1100000
+    for size in sizes:
+        side = size * 10.0  # 10 m squares
+        features = grid_features(x0, y0, size, size)
+        # diagonal strip 25 m wide
+        strip = [(1.5, 0.5), (25.5, 0.5), (side - 1.5, side - 24.5), (side - 1.5, side - 0.5), (side - 25.5, side - 0.5),
+                 (1.5, 24.5)]
+        aoi = QgsGeometry.fromPolygonXY([[QgsPointXY(x0 + x, y0 + y) for x, y in strip]])
+        bbox = aoi.boundingBox()
+        wfs_downloader = WFSDownloader(None, False, None, False)
+        with StubWFSServer({"Grid": features}, page_limit=5000, spatial_filter="intersects", post=True) as server:
+            by_extent, t_ref = timed(wfs_downloader.load_wfs_layer, "stub:Grid", bbox, server.url)
+            by_filter, t_opt = timed(wfs_downloader.load_wfs_layer, "stub:Grid", bbox, server.url, aoi)
+        report("aoi_filter", size * size, t_ref, t_opt)
+        message(f"    features: extent={by_extent.featureCount()}  AOI filter={by_filter.featureCount()}")
+
+
+def bench_config(sizes):
+    """Parsing the YAML configs for every layer vs. the cached PluginConfig loaders, --sizes layers per AOI."""
+    config_dir = os.path.join(PLUGIN_ROOT, "config")
+    paths = [os.path.join(config_dir, name) for name in ("ZABAGED.yaml", "zabaged_to_LandUseCode_table.yaml")]
+
+    def parse_per_layer(layers):
+        for _ in range(layers):
+            for path in paths:
+                with open(path, "r", encoding="utf-8") as file:
+                    yaml.safe_load(file)
+
+    def cached(layers):
+        for _ in range(layers):
+            load_zabaged_config(paths[0])
+            load_landuse_matcher(paths[1])
+
+    for size in sizes:
+        _, t_ref = timed(parse_per_layer, size)
+        _, t_opt = timed(cached, size)
+        report("config", size, t_ref, t_opt)
+
+
+def bench_batch_scaling(sizes):
+    """run_batch.py throughput for numbers of worker processes given by --sizes (local_data configs)."""
+    with open(os.path.join(PLUGIN_ROOT, "tests", "batch.yaml"), encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config["download"]["aoi"] = os.path.join(PLUGIN_ROOT, "tests", "input_files", "testing_polygons_multi.gpkg")
+    config["download"]["local_data"] = True
+
+    baseline = None
+    for workers in sizes:
+        run_dir = tempfile.mkdtemp(prefix=f"bench_batch_{workers}_")
+        config["output"]["path"] = os.path.join(run_dir, "output")
+        config["settings"]["workers"] = workers
+        config_file = os.path.join(run_dir, "batch.yaml")
+        with open(config_file, "w", encoding="utf-8") as f:
+            yaml.safe_dump(config, f)
+
+        result, elapsed = timed(subprocess.run, [sys.executable, os.path.join(PLUGIN_ROOT, "scripts", "run_batch.py"),
+                                                 config_file], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if result.returncode != 0:
+            message(f"run_batch.py with {workers} workers failed, see {config_file}")
+        baseline = baseline or elapsed
+        report("batch_scaling[workers]", workers, baseline, elapsed)
+
+
+BENCHMARKS = {
+    "weighted_runoff": bench_weighted_runoff,
+    "base_runoff": bench_base_runoff,
+    "bulk_attributes": bench_bulk_attributes,
+    "buffer": bench_buffer,
+    "buffer_dissolve": bench_buffer_dissolve,
+    "constant_fields": bench_constant_fields,
+    "clip_layer": bench_clip_layer,
+    "stack_layers": bench_stack_layers,
+    "soil_vectorize": bench_soil_vectorize,
+    "cn_layer": bench_cn_layer,
+    "intersection": bench_intersection,
+    "aoi_filter": bench_aoi_filter,
+    "config": bench_config,
+    "batch_scaling": bench_batch_scaling,
+}
+
+# --sizes defaults for benchmarks not measured in number of features
+DEFAULT_SIZES = {
+    "aoi_filter": [40, 80, 160],
+    "soil_vectorize": [1, 5, 20],
+    "config": [10, 40, 160],
+    "batch_scaling": [1, 2, 4, 8],
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run plugin micro benchmarks.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"], help="benchmark to run")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        help="number of features to benchmark with (default 1000 5000 20000)")
+    args = parser.parse_args()
+
+    if os.environ.get("QGIS_PATH"):
+        qgis_path = os.environ.get("QGIS_PATH")
+        sys.path.insert(0, str(Path(qgis_path, "python")))
+        sys.path.insert(0, str(Path(qgis_path, "python", "plugins")))
+    else:
+        # Linux expected
+        qgis_path = "/usr"
+        sys.path.insert(0, str(Path(qgis_path, "share", "qgis", "python", "plugins")))
+    from PyQt5.QtCore import QVariant
+    from qgis.core import (QgsApplication, QgsVectorLayer, QgsField, QgsFeature, QgsWkbTypes, QgsGeometry,
+                           QgsFeatureRequest, QgsRectangle, QgsPointXY)
+    from processing.core.Processing import Processing
+    import processing
+
+    # root dir contains hyphens...
+    pkg_name = "qgis_plugin"
+    package = types.ModuleType(pkg_name)
+    package.__path__ = [str(PLUGIN_ROOT)]
+    sys.modules[pkg_name] = package
+
+    sys.path.insert(0, PLUGIN_ROOT)
+    from qgis_plugin.RunOffComputer import RunOffComputer
+    from qgis_plugin.LayerEditor import (set_attribute_value, stack_polygon_layers, overlay_landuse_hsg,
+                                         attribute_layer_buffer, buffer_and_dissolve, dissolve_and_resolve_overlaps,
+                                         add_constant_field, clip_larger_layer_to_smaller)
+    from qgis_plugin.WFSdownloader import WFSDownloader
+    from qgis_plugin.PluginConfig import load_zabaged_config, load_landuse_matcher
+    from qgis_plugin.CNCreator import CNCreator
+    from qgis_plugin.SoilDownloader import simple_clip, vectorize_soil_raster
+    sys.path.insert(0, os.path.join(PLUGIN_ROOT, "tests"))
+    from wfs_stub_server import StubWFSServer, grid_features
+    from stack_layers_reference import stack_layers_union
+
+    # initialize QGIS application in the main thread
+    QgsApplication.setPrefixPath(qgis_path, True)
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    Processing.initialize()
+
+    selected = BENCHMARKS if args.benchmark == "all" else [args.benchmark]
+    for name in selected:
+        message(BENCHMARKS[name].__doc__)
+        BENCHMARKS[name](args.sizes or DEFAULT_SIZES.get(name, [1000, 5000, 20000]))
+
+    # exit QGIS application
+    qgs.exitQgis()
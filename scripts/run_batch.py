@@ -6,7 +6,14 @@ import argparse
 import requests
 import yaml
 import types
+import time
+import json
+import hashlib
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 os.environ['QT_QPA_PLATFORM'] = 'offscreen'
 from PyQt5.QtCore import QVariant
@@ -63,14 +70,163 @@ def save_layer(layer, output_path):
         uiFileContent=""
     )
 
-def process_aoi(polygon_layer, output_path):
-    message("Downloading ZABAGED and LPIS data...")
+    return gpkg_path, name
+
+STAGES = ("landuse", "soil", "intersection", "cn", "runoff")
+
+class StageError(Exception):
+    """Invalid input or output of a processing stage, fails the AOI."""
+
+# Data around a land use tile used when building it (widest line buffers in ZABAGED.yaml are 150 m)
+TILE_MARGIN = 200
+
+def file_digest(path):
+    if not os.path.exists(path):
+        return "missing"
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def stage_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def read_manifest(manifest_path):
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)["stages"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def write_manifest(manifest_path, stages):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"stages": stages}, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def wfs_freshness():
+    """
+    Freshness of downloaded WFS data for the land use hash: the cache tile size and ttl and the current ttl period,
+    so the land use checkpoint expires with the cached tiles. None for local data or without the cache,
+    downloaded data (also WPS) is then not tracked and checkpoints are reused until --restart.
+    """
+    if args_config["download"]["local_data"] is True:
+        return None
+    try:
+        cache_config = read_config(os.path.join(plugin_root, "config", "WFS_cache.yaml")) or {}
+    except (OSError, yaml.YAMLError):
+        return None
+    if not cache_config.get("enabled", False):
+        return None
+    ttl = cache_config.get("ttl_days", 7) * 86400
+    return cache_config.get("tile_size", 5000), ttl, int(time.time() // ttl) if ttl > 0 else time.time()
+
+def stage_inputs(polygon_layer):
+    """Hashes of stage inputs, each stage includes the hash of the stages it depends on."""
+    aoi = stage_hash(file_digest(os.path.join(plugin_root, "metadata.txt")),
+                     args_config["download"]["aoi_per_feature"],
+                     *(bytes(feat.geometry().asWkb()) for feat in polygon_layer.getFeatures()))
+    tiles_path = args_config["download"].get("pretiled")
+    tiles_mtime = os.path.getmtime(tiles_path) if tiles_path and os.path.exists(tiles_path) else None
+    hashes = {
+        "landuse": stage_hash(aoi, *(file_digest(path) for path in
+                                     (ZABAGED_config, LPIS_config, stacking_template, attribute_template)),
+                              tiles_path, tiles_mtime, wfs_freshness()),
+        "soil": stage_hash(aoi, file_digest(os.path.join(config_path, "Soil.yaml"))),
+    }
+    hashes["intersection"] = stage_hash(hashes["landuse"], hashes["soil"])
+    hashes["cn"] = stage_hash(hashes["intersection"], file_digest(CN_table))
+    hashes["runoff"] = stage_hash(hashes["cn"], file_digest(WPS_config),
+                                  json.dumps(args_config["runoff"], sort_keys=True))
+    return hashes
+
+def load_stage_layer(output_path, entry):
+    """Load a stage output stored by save_layer into a memory layer."""
+    gpkg_layer = QgsVectorLayer(f"{os.path.join(output_path, entry['file'])}|layername={entry['layer']}",
+                                entry["name"], "ogr")
+    if not gpkg_layer.isValid():
+        raise IOError(f"Failed to load checkpoint {entry['file']}")
+    layer = gpkg_layer.materialize(QgsFeatureRequest())
+    # drop FID column exposed as attribute, it is created again by save_layer
+    fid_idx = layer.fields().indexFromName("ogc_fid")
+    if fid_idx != -1:
+        layer.dataProvider().deleteAttributes([fid_idx])
+        layer.updateFields()
+    layer.setName(entry["name"])
+    layer.setRenderer(gpkg_layer.renderer().clone())
+    return layer
+
+def process_aoi(polygon_layer, output_path, restart=False):
+    """
+    Run all stages for the AOI. Completed stages are recorded with their input hashes in
+    checkpoint.json, a rerun starts at the first incomplete or stale stage.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    manifest_path = os.path.join(output_path, "checkpoint.json")
+    manifest = {} if restart else read_manifest(manifest_path)
+    hashes = stage_inputs(polygon_layer)
+
+    def is_done(stage):
+        entry = manifest.get(stage)
+        return entry is not None and entry["input_hash"] == hashes[stage] and \
+            os.path.exists(os.path.join(output_path, entry["file"]))
+
+    first = next((i for i, stage in enumerate(STAGES) if not is_done(stage)), None)
+    if first is None:
+        message(f"All stages of {output_path} are up to date, skipping.")
+        return
+    if first > 0:
+        message(f"Resuming {output_path} at stage '{STAGES[first]}'.")
+
+    layers = {}
+    def stage_layer(stage):
+        if stage not in layers:
+            layers[stage] = load_stage_layer(output_path, manifest[stage])
+        return layers[stage]
+
     wfs_downloader = WFSDownloader(stacking_template,
                                    True, polygon_layer, True)
     wfs_layers = wfs_downloader.get_ZABAGED_layers_list()
 
     ymin, xmin, ymax, xmax, extent = wfs_downloader.get_wfs_info(wfs_layers)
 
+    for stage in STAGES[first:]:
+        if stage == "landuse":
+            layers[stage] = run_landuse(polygon_layer, wfs_layers, ymin, xmin, ymax, xmax, extent)
+        elif stage == "soil":
+            layers[stage] = run_soil(polygon_layer, ymin, xmin, ymax, xmax, extent)
+        elif stage == "intersection":
+            layers[stage] = run_intersection(stage_layer("soil"), stage_layer("landuse"))
+        elif stage == "cn":
+            layers[stage] = run_cn(stage_layer("intersection"))
+        else:
+            layers[stage] = run_runoff(stage_layer("cn"))
+        if layers[stage] is None:
+            raise StageError(f"Stage '{stage}' did not produce a layer")
+
+        gpkg_path, name = save_layer(layers[stage], output_path)
+        manifest[stage] = {"input_hash": hashes[stage], "file": os.path.basename(gpkg_path),
+                           "layer": name, "name": layers[stage].name()}
+        write_manifest(manifest_path, manifest)
+
+    del polygon_layer
+
+def run_landuse(polygon_layer, wfs_layers, ymin, xmin, ymax, xmax, extent, use_tiles=True):
+    landuse_symbology = str(Path(__file__).parent.parent / "colortables" / "landuse.qml")
+    tiles_path = args_config["download"].get("pretiled")
+    if use_tiles and tiles_path:
+        message("Loading precomputed land use tiles...")
+        task_edit = TASK_edit_layers(attribute_template, LPIS_config, ZABAGED_config, stacking_template,
+                                     landuse_symbology, True, polygon_layer, ymin, xmin, ymax, xmax,
+                                     None, None, [], pretiled=tiles_path)
+        task_edit.run()
+        if task_edit.merged_layer is not None:
+            return task_edit.merged_layer
+        message("Land use tiles do not cover the AOI, processing downloaded data.")
+
+    message("Downloading ZABAGED and LPIS data...")
     LandUseLayers = []
     task_wfs = TASK_process_wfs_layer(wfs_layers, ymin, xmin, ymax, xmax, extent,
                                       polygon_layer, True,
@@ -78,45 +234,49 @@ def process_aoi(polygon_layer, output_path):
                                       LandUseLayers, config_path)
     task_wfs.run()
 
-    message("Processing downloaded data...")   
+    message("Processing downloaded data...")
     task_edit = TASK_edit_layers(attribute_template, LPIS_config, ZABAGED_config, stacking_template,
-                                 str(Path(__file__).parent.parent / "colortables" / "landuse.qml"),
+                                 landuse_symbology,
                                  True, polygon_layer, ymin, xmin, ymax, xmax,
                                  None, None, LandUseLayers)
     task_edit.run()
-    save_layer(task_edit.merged_layer, output_path)
+    return task_edit.merged_layer
 
+def run_soil(polygon_layer, ymin, xmin, ymax, xmax, extent):
     message("Downloading soil data...")
+    # the local soil raster stays open for all AOIs of this process
     task_soil = TASK_process_soil_layer(polygon_layer, ymin, xmin, ymax, xmax,
-                                        extent, None, None, None, None, config_path)
+                                        extent, None, None, None, None, config_path, keep_raster_open=True)
     task_soil.run()
-    save_layer(task_soil.clipped_soil_layer, output_path)
-    
+    return task_soil.clipped_soil_layer
+
+def run_intersection(soil_layer, landuse_layer):
     message("Perform intersection...")
-    task_inter = TASK_Intersection(task_soil.clipped_soil_layer, task_edit.merged_layer,
+    task_inter = TASK_Intersection(soil_layer, landuse_layer,
                                    None, None)
     task_inter.run()
-    save_layer(task_inter.combined_layer, output_path)
-    
+    return task_inter.combined_layer
+
+def run_cn(combined_layer):
     message("Compute CN...")
-    if task_inter.combined_layer.fields().indexFromName("HSG") == -1 or \
-       task_inter.combined_layer.fields().indexFromName("LandUse_code") == -1:
-        QgsMessageLog.logMessage("Intersection layer does not contain HSG or LandUse_code attribute.",
-                                 "CzLandUseCN", level=Qgis.Critical)
+    if combined_layer.fields().indexFromName("HSG") == -1 or \
+       combined_layer.fields().indexFromName("LandUse_code") == -1:
+        raise StageError("Intersection layer does not contain HSG or LandUse_code attribute.")
 
     if not os.path.exists(CN_table):
-        QgsMessageLog.logMessage("CN table file does not exist.", "CzLandUseCN", level=Qgis.Critical)
+        raise StageError("CN table file does not exist.")
 
     if not is_valid_cn_csv(CN_table):
-        QgsMessageLog.logMessage("CN table file is not valid.", "CzLandUseCN", level=Qgis.Critical)
-    
-    task_cn = TASK_CN(task_inter.combined_layer, CN_table)
+        raise StageError("CN table file is not valid.")
+
+    task_cn = TASK_CN(combined_layer, CN_table)
     task_cn.run()
-    save_layer(task_cn.CNLayer, output_path)
-    
+    return task_cn.CNLayer
+
+def run_runoff(cn_layer):
     message("Computing RunOff...")
-    if task_cn.CNLayer.isValid() is False or task_cn.CNLayer.fields().indexFromName("CN2") == -1:
-        QgsMessageLog.logMessage("CN layer is not valid.", "CzLandUseCN", level=Qgis.Critical)
+    if cn_layer.isValid() is False or cn_layer.fields().indexFromName("CN2") == -1:
+        raise StageError("CN layer is not valid.")
 
     if args_config["runoff"].get("rainfall_depth") is not None:
         input_checker = InputChecker(None, None, None, None, None, None,
@@ -127,15 +287,80 @@ def process_aoi(polygon_layer, output_path):
         )
     else:
         user_defined_height = None
-    task_runoff = TASK_RunOff(task_cn.CNLayer, args_config["runoff"].get("return_periods"),
+    task_runoff = TASK_RunOff(cn_layer, args_config["runoff"].get("return_periods"),
                               "rainfall_depth" in args_config["runoff"],
                               user_defined_height,
                               args_config["runoff"]["coefficient"],
                               None, WPS_config)
     task_runoff.run()
-    save_layer(task_runoff.RunOffLayer, output_path)
-    
-    del polygon_layer
+    return task_runoff.RunOffLayer
+
+def warm_cache(polygon_layer):
+    cache = WFSTileCache.from_config(os.path.join(plugin_root, "config", "WFS_cache.yaml"))
+    if cache is None:
+        sys.exit("WFS cache is disabled, see config/WFS_cache.yaml")
+
+    zabaged_config, lpis_config = load_zabaged_config(ZABAGED_config), load_lpis_config(LPIS_config)
+    wfs_downloader = WFSDownloader(stacking_template, True, polygon_layer, True, cache,
+                                   required_attributes(zabaged_config, lpis_config))
+    sources = [(name, zabaged_config.uri) for name in wfs_downloader.get_ZABAGED_layers_list()]
+    sources.append((lpis_config.layer_name, lpis_config.uri))
+    sources = [(name, uri) for name, uri in sources if not uri.startswith("file://")]
+    workers = zabaged_config.download_workers
+
+    for aoi_feat in polygon_layer.getFeatures():
+        extent = aoi_feat.geometry().boundingBox()
+        message(f"Warming WFS cache for feature {aoi_feat.id()}...")
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            for name, uri in sources:
+                executor.submit(cache.warm, name, wfs_downloader.cache_source(name, uri), extent,
+                                lambda rect, name=name, uri=uri: wfs_downloader.load_wfs_layer(name, rect, uri),
+                                aoi_feat.geometry())
+
+    stats = cache.stats()
+    message(f"WFS cache warmed: {stats['hits']} tiles already cached, {stats['misses']} downloaded, "
+            f"{stats['evictions']} evicted")
+
+def build_tiles(polygon_layer, restart=False):
+    """Build the land use layer once per tile of the grid covering the AOI and store it in the pretiled GeoPackage."""
+    tiles_path = args_config["download"].get("pretiled")
+    if not tiles_path:
+        sys.exit("Option 'pretiled' (output GeoPackage) is not set in the download section")
+    if args_config["download"]["local_data"] is not True:
+        sys.exit("Land use tiles are built from local data only, set 'local_data' to True")
+
+    tiles = LandUseTiles(tiles_path, args_config["download"].get("tile_size", 5000))
+    built = set() if restart else tiles.built_tiles()
+    aoi = QgsGeometry.unaryUnion([feat.geometry() for feat in polygon_layer.getFeatures()])
+    # Same tiles as required by LandUseTiles.get_layer for the AOI
+    todo = [tile for tile in tiles.tiles_for_extent(polygon_layer.extent(), aoi) if tile not in built]
+    message(f"Building {len(todo)} land use tiles ({len(built)} already built) in {tiles_path}")
+
+    wfs_downloader = WFSDownloader(stacking_template, True, polygon_layer, True)
+    wfs_layers = wfs_downloader.get_ZABAGED_layers_list()
+    failed = 0
+    for i, tile in enumerate(todo, 1):
+        rect = tiles.tile_rect(tile)
+        message(f"Land use tile {tile} ({i}/{len(todo)})...")
+        # Process data around the tile, buffered features of neighbouring tiles reach into it
+        build_rect = QgsRectangle(rect)
+        build_rect.grow(TILE_MARGIN)
+        tile_polygon = get_polygon_from_extent(build_rect.yMinimum(), build_rect.xMinimum(),
+                                               build_rect.yMaximum(), build_rect.xMaximum())
+        try:
+            layer = run_landuse(tile_polygon, wfs_layers, build_rect.yMinimum(), build_rect.xMinimum(),
+                                build_rect.yMaximum(), build_rect.xMaximum(), build_rect, use_tiles=False)
+        except SystemExit:
+            # critical log messages exit via log_to_stderr, do not stop other tiles
+            layer = None
+        if layer is None:
+            message(f"Land use tile {tile} failed, AOIs over it will be processed from downloaded data")
+            failed += 1
+            continue
+        tiles.write_tile(tile, wfs_downloader.clip_layer(layer, rect, layer.name()))
+
+    message(f"{len(todo) - failed}/{len(todo)} land use tiles built")
+    return failed == 0
 
 def create_layer(layer, feature):
     # create memory layer for single feature
@@ -158,21 +383,17 @@ def create_layer(layer, feature):
 
     return mem_layer
 
-if __name__ == "__main__":
-    # define parser
-    parser = argparse.ArgumentParser(
-        description="Run computation in batch process."
-    )
-
-    parser.add_argument(
-        "config",
-        type=str,
-        help="YAML config"
-    )
+def setup(config_file):
+    """Initialize QGIS, import the plugin and set up the configuration (once per process)."""
+    global args_config, qgs, plugin_root, config_path, attribute_template, CN_table, WPS_config, \
+        ZABAGED_config, LPIS_config, stacking_template
+    global QgsApplication, QgsVectorLayer, Qgis, QgsVectorFileWriter, QgsCoordinateTransformContext, QgsField, \
+        QgsFeature, QgsWkbTypes, QgsMessageLog, QgsFeatureRequest, QgsGeometry, QgsRectangle
+    global WFSDownloader, dissolve_polygon, TASK_process_wfs_layer, TASK_edit_layers, TASK_process_soil_layer, \
+        TASK_Intersection, is_valid_cn_csv, TASK_CN, TASK_RunOff, InputChecker, WFSTileCache, \
+        LandUseTiles, get_polygon_from_extent, load_zabaged_config, load_lpis_config
 
-    args = parser.parse_args()
-
-    args_config = read_config(args.config)
+    args_config = read_config(config_file)
 
     if args_config["runoff"].get("return_periods") and args_config["runoff"].get("rainfall_depth"):
         sys.exit("Options 'return_periods' and 'rainfall_depth' are mutually exclusive")
@@ -186,7 +407,7 @@ if __name__ == "__main__":
         qgis_path = "/usr"
         sys.path.insert(0, str(Path(qgis_path, "share", "qgis", "python", "plugins"))
         )
-    from qgis.core import QgsApplication, QgsVectorLayer, Qgis, QgsVectorFileWriter, QgsCoordinateTransformContext, QgsField, QgsFeature, QgsWkbTypes
+    from qgis.core import QgsApplication, QgsVectorLayer, Qgis, QgsVectorFileWriter, QgsCoordinateTransformContext, QgsField, QgsFeature, QgsWkbTypes, QgsMessageLog, QgsFeatureRequest, QgsGeometry, QgsRectangle
     from processing.core.Processing import Processing
 
     plugin_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -199,8 +420,7 @@ if __name__ == "__main__":
 
     sys.path.insert(0, plugin_root)
     from qgis_plugin.WFSdownloader import WFSDownloader
-    from qgis_plugin.SoilDownloader import simple_clip
-    from qgis_plugin.LayerEditor import dissolve_polygon, buffer_QgsVectorLayer, add_constant_atr, merge_layers, apply_simple_difference
+    from qgis_plugin.LayerEditor import dissolve_polygon, get_polygon_from_extent
     from qgis_plugin.WFStask import TASK_process_wfs_layer
     from qgis_plugin.LayerEditorTask import TASK_edit_layers
     from qgis_plugin.SoilTask import TASK_process_soil_layer
@@ -209,6 +429,10 @@ if __name__ == "__main__":
     from qgis_plugin.CNtask import TASK_CN
     from qgis_plugin.RunOffTask import TASK_RunOff
     from qgis_plugin.InputChecker import InputChecker
+    from qgis_plugin.WFScache import WFSTileCache
+    from qgis_plugin.LandUseTiles import LandUseTiles
+    from qgis_plugin.PluginConfig import (load_zabaged_config, load_lpis_config, load_wps_config,
+                                          load_landuse_matcher, required_attributes)
 
     # initialize QGIS application in the main thread
     QgsApplication.setPrefixPath(qgis_path, True)
@@ -218,10 +442,7 @@ if __name__ == "__main__":
     QgsApplication.messageLog().messageReceived.connect(log_to_stderr)
 
     # configs
-    config_path = os.path.join(os.path.dirname(
-        os.path.dirname(os.path.abspath(__file__))),
-        "config"
-    )
+    config_path = os.path.join(plugin_root, "config")
     attribute_template = os.path.join(config_path, "zabaged_to_LandUseCode_table.yaml")
     CN_table = os.path.join(config_path, "CN_table.csv")
     WPS_config = os.path.join(config_path, "WPS_config.yaml")
@@ -234,7 +455,18 @@ if __name__ == "__main__":
     stacking_template = os.path.join(config_path,
                                      "layers_merging_order.csv")
 
-    # process area of interest
+    # Parse and validate the configs once, the tasks of this process reuse them
+    try:
+        load_zabaged_config(ZABAGED_config)
+        load_lpis_config(LPIS_config)
+        load_wps_config(os.path.join(config_path, "Soil.yaml"))
+        load_wps_config(WPS_config)
+        load_landuse_matcher(attribute_template)
+    except (ValueError, IOError) as e:
+        sys.exit(f"Invalid configuration: {e}")
+
+def load_aoi():
+    """Load the area of interest layer (dissolved unless processed per feature)."""
     aoi_path = Path(args_config["download"]["aoi"])
     if not aoi_path.exists():
         print(f"Chyba: Soubor '{aoi_path}' neexistuje.")
@@ -249,30 +481,177 @@ if __name__ == "__main__":
         # disolve the polygon layer for faster processing
         polygon_layer = dissolve_polygon(polygon_layer)
 
+    return polygon_layer
+
+def aoi_output_path(aoi_id):
     output_path = Path(args_config["output"]["path"])
+    if args_config["download"]["aoi_per_feature"] is False:
+        return output_path
+    return output_path / str(aoi_id).zfill(3)
+
+def run_aoi(polygon_layer, aoi_id, restart=False):
+    """Process a single AOI feature, returns (status, elapsed seconds, error)."""
+    start = time.perf_counter()
+    try:
+        process_aoi(create_layer(polygon_layer, polygon_layer.getFeature(aoi_id)), aoi_output_path(aoi_id),
+                    restart)
+    except (Exception, SystemExit) as e:
+        # critical log messages exit via log_to_stderr, do not stop other AOIs
+        return "failed", time.perf_counter() - start, str(e) or type(e).__name__
+    return "done", time.perf_counter() - start, None
+
+def worker_main(config_file, conn, restart=False):
+    """Worker process: initialize QGIS once, then process AOI ids received through conn until None."""
+    setup(config_file)
+    polygon_layer = load_aoi()
+    while True:
+        aoi_id = conn.recv()
+        if aoi_id is None:
+            break
+        conn.send(run_aoi(polygon_layer, aoi_id, restart))
+
+    del polygon_layer
+    qgs.exitQgis()
+
+def run_pool(config_file, aoi_ids, n_workers, restart=False):
+    """
+    Process AOIs in n_workers processes, each with its own QgsApplication.
+    A crashed worker fails only its current AOI and is replaced by a new one.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = deque(aoi_ids)
+    results = {}
+
+    def start_worker():
+        conn, child_conn = ctx.Pipe()
+        process = ctx.Process(target=worker_main, args=(config_file, child_conn, restart), daemon=True)
+        process.start()
+        child_conn.close()
+        return {"process": process, "conn": conn, "aoi": None, "start": None}
+
+    def assign(worker):
+        if queue:
+            worker["aoi"], worker["start"] = queue.popleft(), time.perf_counter()
+            worker["conn"].send(worker["aoi"])
+        else:
+            worker["aoi"] = None
+            worker["conn"].send(None)
+
+    workers = [start_worker() for _ in range(min(n_workers, len(queue)))]
+    for worker in workers:
+        assign(worker)
+
+    while any(worker["aoi"] is not None for worker in workers):
+        busy = [worker for worker in workers if worker["aoi"] is not None]
+        ready = wait([worker["conn"] for worker in busy] + [worker["process"].sentinel for worker in busy])
+        for i, worker in enumerate(workers):
+            if worker["aoi"] is None:
+                continue
+            aoi_id = worker["aoi"]
+            if worker["conn"] in ready:
+                try:
+                    results[aoi_id] = worker["conn"].recv()
+                except EOFError:
+                    ready.append(worker["process"].sentinel)
+                else:
+                    message(f"AOI {aoi_id}: {results[aoi_id][0]} in {results[aoi_id][1]:.1f}s")
+                    assign(worker)
+                    continue
+            if worker["process"].sentinel in ready:
+                # worker died while processing the AOI
+                worker["process"].join()
+                results[aoi_id] = ("crashed", time.perf_counter() - worker["start"],
+                                   f"worker exit code {worker['process'].exitcode}")
+                message(f"AOI {aoi_id}: crashed (exit code {worker['process'].exitcode})")
+                workers[i] = start_worker()
+                assign(workers[i])
+
+    for worker in workers:
+        worker["process"].join()
+
+    return results
+
+def report_timings(results, elapsed):
+    message("AOI    status     time [s]")
+    for aoi_id in sorted(results):
+        status, seconds, error = results[aoi_id]
+        message(f"{aoi_id:<6} {status:<10} {seconds:8.1f}" + (f"  {error}" if error else ""))
+    done = sum(1 for status, _, _ in results.values() if status == "done")
+    message(f"{done}/{len(results)} AOIs processed in {elapsed:.1f}s "
+            f"({len(results) / elapsed * 3600 if elapsed > 0 else 0:.1f} AOIs/hour)")
+
+if __name__ == "__main__":
+    # define parser
+    parser = argparse.ArgumentParser(
+        description="Run computation in batch process."
+    )
+
+    parser.add_argument(
+        "config",
+        type=str,
+        help="YAML config"
+    )
+
+    parser.add_argument(
+        "--warm-cache",
+        action="store_true",
+        help="only download WFS data covering the AOI into the tile cache (config/WFS_cache.yaml) and exit"
+    )
+
+    parser.add_argument(
+        "--build-tiles",
+        action="store_true",
+        help="only build the precomputed land use tiles (download/pretiled) covering the AOI from local data and exit"
+    )
+
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="ignore checkpoints of previous runs and process all stages again; checkpoints track the AOI, "
+             "configuration files and settings, but not changes of downloaded WFS/WPS data (with the WFS cache "
+             "enabled the land use stage expires with its ttl_days)"
+    )
+
+    args = parser.parse_args()
+
+    setup(args.config)
+    polygon_layer = load_aoi()
+
+    if args.warm_cache:
+        warm_cache(polygon_layer)
+        del polygon_layer
+        qgs.exitQgis()
+        sys.exit(0)
+
+    if args.build_tiles:
+        # tiles cover the whole AOI layer, not its single features
+        success = build_tiles(polygon_layer, args.restart)
+        del polygon_layer
+        qgs.exitQgis()
+        sys.exit(0 if success else 1)
+
+    if "skip_feature" in args_config["download"]:
+        message("Option 'skip_feature' is ignored, completed AOIs are skipped using checkpoint.json "
+                "in their output directory.")
+    aoi_ids = [aoi_feat.id() for aoi_feat in polygon_layer.getFeatures()]
+
+    start = time.perf_counter()
     n_workers = args_config["settings"]["workers"]
     if n_workers > 1:
-        from joblib import Parallel, delayed 
-
-        Parallel(n_jobs=n_workers, backend="threading")(
-            delayed(process_aoi)
-            (create_layer(polygon_layer, aoi_feat),
-                output_path if args_config["download"]["aoi_per_feature"] is False
-                else output_path / str(aoi_feat.id()).zfill(3)) for aoi_feat in polygon_layer.getFeatures()
-        )
+        # each worker process loads the AOI layer itself
+        del polygon_layer
+        results = run_pool(args.config, aoi_ids, n_workers, args.restart)
     else:
-        for aoi_feat in polygon_layer.getFeatures():
-            if "skip_feature" in args_config["download"] and \
-               aoi_feat.id() in args_config["download"]["skip_feature"]:
-                continue
-            process_aoi(
-                create_layer(polygon_layer, aoi_feat),
-                output_path if args_config["download"]["aoi_per_feature"] is False
-                else output_path / str(aoi_feat.id()).zfill(3)
-            )
+        results = {}
+        for aoi_id in aoi_ids:
+            results[aoi_id] = run_aoi(polygon_layer, aoi_id, args.restart)
+            message(f"AOI {aoi_id}: {results[aoi_id][0]} in {results[aoi_id][1]:.1f}s")
+        del polygon_layer
 
-    del polygon_layer
+    report_timings(results, time.perf_counter() - start)
 
     # exit QGIS application
     qgs.exitQgis()
 
+    if any(status != "done" for status, _, _ in results.values()):
+        sys.exit(1)
@@ -1,12 +1,14 @@
 import sys
 import os
 import pytest
+import numpy as np
 
-from qgis.core import QgsApplication, QgsVectorLayer
+from qgis.core import QgsApplication, QgsVectorLayer, QgsFeatureRequest
 
 # Add the parent directory to the PYTHONPATH
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from CNCreator import CNCreator
+from CNCreator import CNCreator, load_cn_lookup, cn_inputs_match, cn_lookup_array, calculate_cn_values
+from InputChecker import is_valid_cn_csv
 from utils_for_testing import assert_layers_equal, check_gpkg_layers
 
 # Initialize QGIS application in the main thread
@@ -58,4 +60,128 @@ class TestCNCreator:
 
         # Check if the CN layer was created successfully
         assert_layers_equal(cn_layer, ReferenceLayer)
-        print("[OK] CN layer created successfully and matches the reference layer.")
\ No newline at end of file
+        print("[OK] CN layer created successfully and matches the reference layer.")
+
+    def test_vectorized_cn(self, tmp_path):
+        """Test vectorized CN computation against the per-feature reference and CN table memoization."""
+        base_folder = os.path.dirname(__file__)
+        input_layer_path = os.path.join(base_folder, 'input_files', 'TESTING_ntersected_landuse_and_hsg.gpkg')
+        cn_table_path = str(tmp_path / 'CN_table.csv')
+        with open(os.path.join(base_folder, 'input_files', 'testing_CN_table.csv'), encoding='utf-8') as f:
+            table = f.read()
+        with open(cn_table_path, 'w', encoding='utf-8') as f:
+            f.write(table)
+
+        InputLayer = QgsVectorLayer(f"{input_layer_path}|layername=TESTING_ntersected_landuse_and_hsg",
+                                    "TESTING_ntersected_landuse_and_hsg", "ogr")
+        cn_creator = CNCreator(InputLayer, cn_table_path)
+        cn_layer = cn_creator.CreateCNLayer()
+        reference = cn_creator._create_memory_layer()
+        cn_creator._copy_features_with_cn_per_feature(reference, cn_creator._load_cn_table())
+
+        assert cn_layer.featureCount() == reference.featureCount()
+        for feature, reference_feature in zip(cn_layer.getFeatures(), reference.getFeatures()):
+            for name in ("CN2", "CN3"):
+                # NULL (no CN) is not a number
+                if not isinstance(reference_feature[name], (int, float)):
+                    assert not isinstance(feature[name], (int, float))
+                else:
+                    assert feature[name] == pytest.approx(reference_feature[name])
+        print("[OK] Vectorized CN values match the per-feature reference.")
+
+        lookup = load_cn_lookup(cn_table_path)
+        assert load_cn_lookup(cn_table_path) is lookup, "CN table was parsed again"
+        os.utime(cn_table_path, (0, 0))
+        assert load_cn_lookup(cn_table_path) is not lookup, "Modified CN table was not parsed again"
+        print("[OK] CN table memoized until modified.")
+
+        # Tables with large codes are searched by the sorted codes instead of indexed by a dense array
+        cn_dict = cn_creator._load_cn_table()
+        dense, searched = cn_lookup_array(cn_dict), cn_lookup_array(cn_dict, max_dense_code=0)
+        assert dense.codes is None and searched.codes is not None and len(searched.table) == len(cn_dict)
+        features = list(InputLayer.getFeatures())
+        landuse_values = [feature["LandUse_code"] for feature in features] + [None, "x", 10 ** 12, -1, 0]
+        hsg_values = [feature["HSG"] for feature in features] + [1, 1, 1, 1, 1]
+        np.testing.assert_array_equal(calculate_cn_values(landuse_values, hsg_values, searched)[0],
+                                      calculate_cn_values(landuse_values, hsg_values, dense)[0])
+        print("[OK] Sorted code lookup matches the dense lookup.")
+
+        with open(cn_table_path, 'a', encoding='utf-8') as f:
+            f.write("-10000,61,73,81,84\n")
+        assert not is_valid_cn_csv(cn_table_path), "Negative LandUse code accepted"
+        print("[OK] CN table with a negative LandUse code rejected.")
+
+    def test_update_cn_layer(self, tmp_path):
+        """Test in-place recomputation of CN values after the CN table changed."""
+        base_folder = os.path.dirname(__file__)
+        input_layer_path = os.path.join(base_folder, 'input_files', 'TESTING_ntersected_landuse_and_hsg.gpkg')
+        InputLayer = QgsVectorLayer(f"{input_layer_path}|layername=TESTING_ntersected_landuse_and_hsg",
+                                    "TESTING_ntersected_landuse_and_hsg", "ogr")
+        cn_layer = CNCreator(InputLayer, os.path.join(base_folder, 'input_files', 'testing_CN_table.csv')).CreateCNLayer()
+        geometries = {feature.id(): feature.geometry().asWkt() for feature in cn_layer.getFeatures()}
+
+        # CN table with all values lowered by 5
+        changed_table = str(tmp_path / 'CN_table_changed.csv')
+        with open(os.path.join(base_folder, 'input_files', 'testing_CN_table.csv'), encoding='utf-8') as f:
+            rows = [line.strip().split(',') for line in f if line.strip()]
+        with open(changed_table, 'w', encoding='utf-8') as f:
+            for i, row in enumerate(rows):
+                if i == 0 and not row[0].isdigit():
+                    f.write(','.join(row) + '\n')
+                else:
+                    f.write(','.join([row[0]] + [str(float(value) - 5) for value in row[1:]]) + '\n')
+
+        cn_creator = CNCreator(InputLayer, changed_table)
+        updated = cn_creator.UpdateCNLayer(cn_layer)
+        assert updated is cn_layer
+        reference = cn_creator.CreateCNLayer()
+        for feature, reference_feature in zip(updated.getFeatures(), reference.getFeatures()):
+            assert feature.geometry().asWkt() == geometries[feature.id()], "Geometry changed"
+            for name in ("CN2", "CN3"):
+                if not isinstance(reference_feature[name], (int, float)):
+                    assert not isinstance(feature[name], (int, float))
+                else:
+                    assert feature[name] == pytest.approx(reference_feature[name])
+        print("[OK] CN values updated in place.")
+
+    def test_update_cn_layer_edit_buffer(self):
+        """Test that CN values of a layer in edit mode are written through its edit buffer."""
+        base_folder = os.path.dirname(__file__)
+        input_layer_path = os.path.join(base_folder, 'input_files', 'TESTING_ntersected_landuse_and_hsg.gpkg')
+        InputLayer = QgsVectorLayer(f"{input_layer_path}|layername=TESTING_ntersected_landuse_and_hsg",
+                                    "TESTING_ntersected_landuse_and_hsg", "ogr")
+        cn_creator = CNCreator(InputLayer, os.path.join(base_folder, 'input_files', 'testing_CN_table.csv'))
+        cn_layer = cn_creator.CreateCNLayer()
+        cn_idx = cn_layer.fields().indexOf("CN2")
+        expected = {feature.id(): feature["CN2"] for feature in cn_layer.getFeatures()}
+
+        fid = next(iter(expected))
+        cn_layer.dataProvider().changeAttributeValues({fid: {cn_idx: 1.0}})
+        assert cn_layer.startEditing()
+        cn_creator.WriteCNValues(cn_layer, cn_creator.ComputeCNValues(cn_layer, cn_layer.fields()))
+        assert next(cn_layer.dataProvider().getFeatures(QgsFeatureRequest(fid))).attribute(cn_idx) == 1.0, "Provider changed"
+        assert cn_layer.getFeature(fid)["CN2"] == expected[fid]
+        assert cn_layer.commitChanges()
+        assert next(cn_layer.dataProvider().getFeatures(QgsFeatureRequest(fid)))["CN2"] == expected[fid]
+        print("[OK] CN values written to the edit buffer.")
+
+    def test_cn_inputs_match(self):
+        """Test detection of LandUse_code/HSG edits of the intersection layer after the CN layer was created."""
+        base_folder = os.path.dirname(__file__)
+        input_layer_path = os.path.join(base_folder, 'input_files', 'TESTING_ntersected_landuse_and_hsg.gpkg')
+        InputLayer = QgsVectorLayer(f"{input_layer_path}|layername=TESTING_ntersected_landuse_and_hsg",
+                                    "TESTING_ntersected_landuse_and_hsg", "ogr")
+        int_layer = InputLayer.materialize(QgsFeatureRequest())
+        cn_layer = CNCreator(int_layer, os.path.join(base_folder, 'input_files', 'testing_CN_table.csv')).CreateCNLayer()
+        assert cn_inputs_match(int_layer, cn_layer)
+
+        # Edited HSG in the edit buffer of the intersection layer, same feature count
+        hsg_idx = int_layer.fields().indexOf("HSG")
+        feature = next(int_layer.getFeatures())
+        assert int_layer.startEditing()
+        int_layer.changeAttributeValue(feature.id(), hsg_idx, "D" if feature["HSG"] != "D" else "A")
+        assert int_layer.featureCount() == cn_layer.featureCount()
+        assert not cn_inputs_match(int_layer, cn_layer)
+        int_layer.rollBack()
+        assert cn_inputs_match(int_layer, cn_layer)
+        print("[OK] Changed CN inputs detected.")
@@ -0,0 +1,108 @@
+import sys
+import os
+import pytest
+from qgis.core import QgsApplication, QgsVectorLayer, QgsRectangle, QgsGeometry, QgsFeature
+
+# Add the parent directory to the PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from LandUseTiles import LandUseTiles
+from LayerEditor import stack_polygon_layers
+from WFSdownloader import WFSDownloader
+
+# Initialize QGIS application in the main thread
+qgs = QgsApplication([], False)
+qgs.initQgis()
+
+
+def area_by_code(layer):
+    areas = {}
+    for feature in layer.getFeatures():
+        code = feature["LandUse_code"]
+        areas[code] = areas.get(code, 0) + feature.geometry().area()
+    return areas
+
+
+class TestLandUseTiles:
+    """Test the LandUseTiles class"""
+    @classmethod
+    def teardown_class(cls):
+        # Exit QGIS application
+        qgs.exitQgis()
+
+    def test_tiles(self, tmp_path):
+        """Land use assembled from tiles matches the stacked layer"""
+        print("")
+        reference_folder = os.path.join(os.path.dirname(__file__), 'reference')
+        layers = [QgsVectorLayer(f"{os.path.join(reference_folder, f'{name}_reference.gpkg')}|layername={name}_reference",
+                                 name, "ogr") for name in ("top", "mid", "low")]
+        stacked = stack_polygon_layers(layers, "LandUse Layer")
+        extent = stacked.extent()
+
+        # Grid of several tiles over the layer
+        tiles = LandUseTiles(str(tmp_path / "tiles.gpkg"), max(extent.width(), extent.height()) / 3)
+        grid = tiles.tiles_for_extent(extent)
+        assert len(grid) > 1
+        assert tiles.get_layer(extent) is None, "Layer returned without built tiles"
+
+        wfs_downloader = WFSDownloader(None, False, None, False)
+        for tile in grid:
+            tiles.write_tile(tile, wfs_downloader.clip_layer(stacked, tiles.tile_rect(tile), "tile"))
+        # Building a tile again replaces its data
+        tiles.write_tile(grid[0], wfs_downloader.clip_layer(stacked, tiles.tile_rect(grid[0]), "tile"))
+        assert tiles.built_tiles() == set(grid)
+        print(f"[OK] {len(grid)} tiles built")
+
+        # The grid size is read from the file
+        assert LandUseTiles(tiles.path).tile_size == tiles.tile_size
+
+        layer = LandUseTiles(tiles.path).get_layer(extent)
+        assert layer is not None and layer.name() == "LandUse Layer"
+        reference_areas, tiled_areas = area_by_code(stacked), area_by_code(layer)
+        assert tiled_areas.keys() == reference_areas.keys()
+        for code, area in reference_areas.items():
+            assert tiled_areas[code] == pytest.approx(area, rel=1e-6), f"Area of LandUse_code {code} differs"
+        print("[OK] Land use from tiles matches the stacked layer")
+
+        outside = QgsRectangle(extent)
+        outside.grow(tiles.tile_size)
+        assert tiles.get_layer(outside) is None, "Layer returned for an extent not covered by the tiles"
+        print("[OK] Missing tiles detected")
+
+    def test_aoi_tiles(self, tmp_path):
+        """Only tiles intersecting a non-rectangular AOI are built and required"""
+        print("")
+        reference_folder = os.path.join(os.path.dirname(__file__), 'reference')
+        layers = [QgsVectorLayer(f"{os.path.join(reference_folder, f'{name}_reference.gpkg')}|layername={name}_reference",
+                                 name, "ogr") for name in ("top", "mid", "low")]
+        stacked = stack_polygon_layers(layers, "LandUse Layer")
+        extent = stacked.extent()
+        # At least two tiles in both directions
+        tiles = LandUseTiles(str(tmp_path / "tiles.gpkg"), min(extent.width(), extent.height()) / 2)
+        grid = tiles.tiles_for_extent(extent)
+
+        # L-shaped AOI along the first column and the first row of the grid, inside the stacked layer
+        tx_min, ty_min = min(tx for tx, _ in grid), min(ty for _, ty in grid)
+        l_shape = QgsGeometry.unaryUnion([QgsGeometry.fromRect(tiles.tile_rect(tile)) for tile in grid
+                                         if tile[0] == tx_min or tile[1] == ty_min])
+        aoi = l_shape.buffer(-tiles.tile_size * 0.01, 2).intersection(QgsGeometry.fromRect(extent))
+        required = tiles.tiles_for_extent(aoi.boundingBox(), aoi)
+        assert 0 < len(required) < len(tiles.tiles_for_extent(aoi.boundingBox()))
+
+        wfs_downloader = WFSDownloader(None, False, None, False)
+        for tile in required:
+            tiles.write_tile(tile, wfs_downloader.clip_layer(stacked, tiles.tile_rect(tile), "tile"))
+        assert tiles.get_layer(aoi.boundingBox()) is None
+        print(f"[OK] {len(required)} tiles built for the L-shaped AOI")
+
+        polygon = QgsVectorLayer("Polygon?crs=EPSG:5514", "aoi", "memory")
+        feature = QgsFeature()
+        feature.setGeometry(aoi)
+        polygon.dataProvider().addFeatures([feature])
+        polygon.updateExtents()
+        layer = WFSDownloader(None, True, polygon, False).load_pretiled_layer(tiles.path, aoi.boundingBox())
+        assert layer is not None, "Pretiled layer not used for the L-shaped AOI"
+
+        expected = sum(f.geometry().intersection(aoi).area() for f in stacked.getFeatures())
+        assert sum(f.geometry().area() for f in layer.getFeatures()) == pytest.approx(expected, rel=1e-6)
+        print("[OK] Land use of the L-shaped AOI loaded from the tiles")
@@ -1,6 +1,10 @@
+import pytest
 import sys
 import os
-from qgis.core import QgsApplication, QgsVectorLayer
+from qgis.core import QgsApplication, QgsVectorLayer, QgsGeometry, QgsFeature, QgsField, QgsFields, QgsRectangle, \
+    QgsFeatureRequest, QgsSpatialIndex
+from PyQt5.QtCore import QVariant
+import processing
 from utils_for_testing import assert_layers_equal, check_gpkg_layers
 
 # Ensure that qgis packages are imported to your python environment when running locally
@@ -11,7 +15,10 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from WFSdownloader import WFSDownloader
 from PluginUtils import get_string_from_yaml
-from LayerEditor import LayerEditor
+from LayerEditor import LayerEditor, resolve_overlaping_buffers, stack_polygon_layers, add_constant_field, merge_layers, overlay_landuse_hsg, clip_larger_layer_to_smaller, \
+    attribute_layer_buffer, dissolve_polygon, BUFFER_POOL_MIN_FEATURES
+from SoilDownloader import simple_clip
+from stack_layers_reference import stack_layers_union
 
 # Initialize QGIS application in the main thread
 qgs = QgsApplication([], False)
@@ -118,8 +125,249 @@ class TestLayerEditor:
         assert_layers_equal(layer_list[2], TOP_ref_layer)
         print("[OK] Buffering successfully.")
 
+    def test_stack_layers(self):
+        """Test single pass stacking against the baseline processing union loop"""
+        print("\n")
+        base_folder = os.path.dirname(__file__)
+        reference_folder = os.path.join(base_folder, 'reference')
+        merging_conf = os.path.join(base_folder, 'input_files', "testing_LayerEditor_conf", 'testing_layers_merging_order.csv')
 
-
-
-
-
+        # Edited reference layers named by the stacking order
+        layers = [QgsVectorLayer(f"{os.path.join(reference_folder, f'{name}_reference.gpkg')}|layername={name}_reference",
+                                 name, "ogr") for name in ("low", "mid", "top")]
+        for layer in layers:
+            assert layer.isValid()
+
+        layer_editor = LayerEditor(None, None, None, merging_conf, None, True, layers[0], 0, 0, 0, 0)
+        stacked = layer_editor.stack_layers(layers)
+        ordered = sorted(layers, key=lambda L: ["top", "mid", "low"].index(L.name()))
+        reference = stack_layers_union(ordered)
+
+        # The baseline loop reloads its running union from the current layer, so its pieces may still overlap
+        # higher-priority ones. Those areas are left out of the comparison, the rest must match exactly.
+        reference_geometries = [(feature["LandUse_code"], feature.geometry()) for feature in reference.getFeatures()]
+        index = QgsSpatialIndex()
+        for i, (_, geom) in enumerate(reference_geometries):
+            index.addFeature(i, geom.boundingBox())
+        overlaps = []
+        for i, (_, geom) in enumerate(reference_geometries):
+            for j in index.intersects(geom.boundingBox()):
+                if j > i:
+                    overlap = geom.intersection(reference_geometries[j][1])
+                    if not overlap.isEmpty() and overlap.area() > 0:
+                        overlaps.append(overlap)
+        overlap = QgsGeometry.unaryUnion(overlaps) if overlaps else None
+
+        def area_by_code(geometries):
+            areas = {}
+            for code, geom in geometries:
+                if overlap is not None:
+                    geom = geom.difference(overlap)
+                areas[code] = areas.get(code, 0) + geom.area()
+            return areas
+
+        reference_areas = area_by_code(reference_geometries)
+        stacked_areas = area_by_code((feature["LandUse_code"], feature.geometry()) for feature in stacked.getFeatures())
+        assert stacked.name() == "LandUse Layer"
+        for code in reference_areas.keys() | stacked_areas.keys():
+            assert stacked_areas.get(code, 0) == pytest.approx(reference_areas.get(code, 0), rel=1e-6, abs=1e-6), \
+                f"Area of LandUse_code {code} differs"
+        stacked_area = sum(feature.geometry().area() for feature in stacked.getFeatures())
+        assert stacked_area == pytest.approx(QgsGeometry.unaryUnion([geom for _, geom in reference_geometries]).area(),
+                                             rel=1e-6)
+        print(f"[OK] Stacked layer matches the baseline stacking ({len(overlaps)} baseline overlaps left out)")
+
+        geometries = [feature.geometry() for feature in stacked.getFeatures()]
+        union_area = QgsGeometry.unaryUnion(geometries).area()
+        assert sum(geom.area() for geom in geometries) == pytest.approx(union_area, rel=1e-6)
+        print("[OK] No overlaps remain")
+
+    def test_overlay_landuse_hsg(self):
+        """Test the land use x HSG overlay against clipping, native:union and removing soil only parts"""
+        print("\n")
+        reference_folder = os.path.join(os.path.dirname(__file__), 'reference')
+        layers = [QgsVectorLayer(f"{os.path.join(reference_folder, f'{name}_reference.gpkg')}|layername={name}_reference",
+                                 name, "ogr") for name in ("top", "mid", "low")]
+        landuse = stack_polygon_layers(layers, "LandUse Layer")
+
+        # Soil layer of four HSG quadrants covering the land use layer
+        extent = landuse.extent()
+        extent.grow(10)
+        soil = QgsVectorLayer(f"MultiPolygon?crs={landuse.crs().authid()}", "Soil Layer HSG", "memory")
+        soil.dataProvider().addAttributes([QgsField("HSG", QVariant.Int), QgsField("layer", QVariant.String)])
+        soil.updateFields()
+        center = extent.center()
+        quadrants = [QgsRectangle(extent.xMinimum(), extent.yMinimum(), center.x(), center.y()),
+                     QgsRectangle(center.x(), extent.yMinimum(), extent.xMaximum(), center.y()),
+                     QgsRectangle(extent.xMinimum(), center.y(), center.x(), extent.yMaximum()),
+                     QgsRectangle(center.x(), center.y(), extent.xMaximum(), extent.yMaximum())]
+        for hsg, rect in enumerate(quadrants, 1):
+            feature = QgsFeature(soil.fields())
+            feature.setGeometry(QgsGeometry.fromRect(rect))
+            feature.setAttributes([hsg, "output"])
+            soil.dataProvider().addFeature(feature)
+
+        overlay = overlay_landuse_hsg(landuse, soil)
+
+        clipped_soil, clipped_landuse = clip_larger_layer_to_smaller(soil, landuse)
+        reference = processing.run("native:union", {'INPUT': clipped_landuse, 'OVERLAY': clipped_soil,
+                                                    'OUTPUT': 'memory:'})['OUTPUT']
+        reference.dataProvider().deleteFeatures([feature.id() for feature in reference.getFeatures(
+            QgsFeatureRequest().setFilterExpression('"layer" IS NULL'))])
+
+        assert overlay.fields().names() == reference.fields().names()
+        print("[OK] Overlay fields match native:union")
+
+        def area_by_codes(layer):
+            areas = {}
+            for feature in layer.getFeatures():
+                key = (feature["LandUse_code"], feature["HSG"])
+                areas[key] = areas.get(key, 0) + feature.geometry().area()
+            return areas
+
+        reference_areas, overlay_areas = area_by_codes(reference), area_by_codes(overlay)
+        assert overlay_areas.keys() == reference_areas.keys()
+        for key, area in reference_areas.items():
+            assert overlay_areas[key] == pytest.approx(area, rel=1e-6), f"Area of {key} differs"
+        print("[OK] Overlay matches the union reference")
+
+    def test_clip_larger_layer_to_smaller(self):
+        """Test clipping decided from summed areas against dissolving both layers"""
+        print("\n")
+        reference_folder = os.path.join(os.path.dirname(__file__), 'reference')
+        layers = [QgsVectorLayer(f"{os.path.join(reference_folder, f'{name}_reference.gpkg')}|layername={name}_reference",
+                                 name, "ogr") for name in ("top", "mid", "low")]
+        landuse = stack_polygon_layers(layers, "LandUse Layer")
+        extent = landuse.extent()
+        center = extent.center()
+
+        def polygon_layer(rects):
+            layer = QgsVectorLayer(f"Polygon?crs={landuse.crs().authid()}", "polygons", "memory")
+            layer.dataProvider().addAttributes([QgsField("HSG", QVariant.Int)])
+            layer.updateFields()
+            for rect in rects:
+                feature = QgsFeature(layer.fields())
+                feature.setGeometry(QgsGeometry.fromRect(rect))
+                feature.setAttributes([1])
+                layer.dataProvider().addFeature(feature)
+            return layer
+
+        def area(layer):
+            return sum(feature.geometry().area() for feature in layer.getFeatures())
+
+        def dissolve_reference(layer_one, layer_two):
+            # Previous implementation: dissolve both layers, clip the larger by the smaller dissolved one
+            dissolved_one, dissolved_two = dissolve_polygon(layer_one), dissolve_polygon(layer_two)
+            area_one, area_two = area(dissolved_one), area(dissolved_two)
+            if area_one > area_two:
+                return simple_clip(layer_one, dissolved_two), layer_two
+            if area_two > area_one:
+                return layer_one, simple_clip(layer_two, dissolved_one)
+            return layer_one, layer_two
+
+        grown = QgsRectangle(extent)
+        grown.grow(10)
+        cases = {
+            # larger layer filling its extent, land use is not clipped
+            "rectangle": polygon_layer([grown]),
+            # smaller L-shaped layer of three features clips the land use
+            "l-shape": polygon_layer([QgsRectangle(extent.xMinimum(), extent.yMinimum(), center.x(), center.y()),
+                                      QgsRectangle(center.x(), extent.yMinimum(), extent.xMaximum(), center.y()),
+                                      QgsRectangle(extent.xMinimum(), center.y(), center.x(), extent.yMaximum())]),
+        }
+        for name, soil in cases.items():
+            result = clip_larger_layer_to_smaller(soil, landuse)
+            reference = dissolve_reference(soil, landuse)
+            for layer, reference_layer in zip(result, reference):
+                assert area(layer) == pytest.approx(area(reference_layer), rel=1e-6), f"Clipped area differs ({name})"
+            print(f"[OK] Clipping matches the dissolve reference ({name})")
+
+    def test_attribute_layer_buffer(self):
+        """Test buffering grouped by distance, with the thread pool for larger layers"""
+        print("\n")
+        values, distances = [["a", "b", "c"], ["d"], ["e", "f"]], [3, 2, 1]
+        expected = {"a": 3, "b": 3, "c": 3, "d": 2, "e": 1, "f": 1, "x": 5}
+        keys = list(expected)
+
+        for size in (len(keys), BUFFER_POOL_MIN_FEATURES + 1):
+            layer = QgsVectorLayer("Point?crs=EPSG:5514", "points", "memory")
+            layer.dataProvider().addAttributes([QgsField("atr", QVariant.String)])
+            layer.updateFields()
+            features = []
+            for i in range(size):
+                feature = QgsFeature(layer.fields())
+                feature.setGeometry(QgsGeometry.fromWkt(f"POINT({i * 10} 0)"))
+                feature.setAttributes([keys[i % len(keys)]])
+                features.append(feature)
+            layer.dataProvider().addFeatures(features)
+
+            buffered = attribute_layer_buffer(layer, "atr", 5, ["1", "2", "3"], values, distances, "points")
+            assert buffered is not None and buffered.featureCount() == size
+            for i, feature in enumerate(buffered.getFeatures()):
+                # Features keep the input order
+                assert feature["atr"] == keys[i % len(keys)]
+                reference = QgsGeometry.fromWkt(f"POINT({i * 10} 0)").buffer(expected[feature["atr"]], 5)
+                assert feature.geometry().area() == pytest.approx(reference.area()), \
+                    f"Wrong buffer distance for value {feature['atr']}"
+            print(f"[OK] {size} features buffered by their attribute values")
+
+    def test_buffer_and_dissolve_layers(self):
+        """Test the fused buffer, dissolve and clip stage against the buffer, clip and dissolve pipeline"""
+        print("\n")
+        base_folder = os.path.dirname(__file__)
+        data_folder = os.path.join(base_folder, 'input_files', 'testing_LayerEditor_data')
+        conf_folder = os.path.join(base_folder, 'input_files', "testing_LayerEditor_conf")
+        merging_conf = os.path.join(conf_folder, 'testing_layers_merging_order.csv')
+        test_data_conf = os.path.join(conf_folder, 'test_data.yaml')
+        LU_atr_conf = os.path.join(conf_folder, 'test_data_to_LandUseCode_table.yaml')
+
+        def load(name):
+            return QgsVectorLayer(f"{os.path.join(data_folder, f'{name}.gpkg')}|layername={name}", name, "ogr")
+
+        LOW_layer = load("low")
+        extent = load("top").extent()
+        extent.scale(0.5)
+
+        for area_flag in (False, True):
+            layer_editor = LayerEditor(LU_atr_conf, None, test_data_conf, merging_conf, None, area_flag, LOW_layer,
+                                       extent.yMinimum(), extent.xMinimum(), extent.yMaximum(), extent.xMaximum())
+
+            reference = layer_editor.add_landuse_attribute([load("top")])
+            reference = layer_editor.buffer_layers(reference)
+            reference = layer_editor.clip_layers_after_edits(reference)
+            reference = resolve_overlaping_buffers(reference, test_data_conf)[0]
+
+            fused = layer_editor.buffer_and_dissolve_layers(layer_editor.add_landuse_attribute([load("top")]))[0]
+            assert fused.name() == "top"
+
+            reference_geoms = {f["LandUse_code"]: f.geometry() for f in reference.getFeatures()}
+            fused_geoms = {f["LandUse_code"]: f.geometry() for f in fused.getFeatures()}
+            assert fused_geoms.keys() == reference_geoms.keys()
+            for code, geom in reference_geoms.items():
+                assert fused_geoms[code].area() == pytest.approx(geom.area(), rel=1e-6)
+                assert fused_geoms[code].symDifference(geom).area() < 1e-6 * geom.area()
+            print(f"[OK] Fused buffering matches the pipeline (AreaFlag={area_flag})")
+
+    def test_add_constant_field(self):
+        """Test constant attributes added as expression fields and stored by merge_layers"""
+        print("\n")
+        layer = QgsVectorLayer("Polygon?crs=EPSG:5514", "aoi", "memory")
+        features = []
+        for i in range(3):
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(i, 0, i + 1, 1)))
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+
+        add_constant_field(layer, "HSG", 0)
+        add_constant_field(layer, "source", "aoi", QVariant.String)
+        idx = layer.fields().indexFromName("HSG")
+        assert layer.fields().fieldOrigin(idx) == QgsFields.OriginExpression
+        assert layer.dataProvider().fields().count() == 0, "Constant field written to the provider"
+        assert [(f["HSG"], f["source"]) for f in layer.getFeatures()] == [(0, "aoi")] * 3
+        print("[OK] Constant fields added without writing features")
+
+        merged = merge_layers([layer], "merged")
+        assert merged.dataProvider().fields().indexFromName("HSG") != -1
+        assert [(f["HSG"], f["source"]) for f in merged.getFeatures()] == [(0, "aoi")] * 3
+        print("[OK] Constant fields stored by merge_layers")
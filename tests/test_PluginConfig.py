@@ -0,0 +1,100 @@
+import sys
+import os
+import pytest
+
+# Add the parent directory to the PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PluginConfig import load_yaml, load_zabaged_config, load_landuse_rules, load_landuse_matcher, load_wps_config, \
+    load_lpis_config, preload_configs, required_attributes
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+
+
+class TestPluginConfig:
+    """Test the cached configuration loaders"""
+
+    def test_plugin_configs(self):
+        """Configs shipped with the plugin are valid"""
+        print("")
+        preload_configs(CONFIG_DIR)
+        preload_configs(os.path.join(CONFIG_DIR, 'local_data'))
+
+        zabaged = load_zabaged_config(os.path.join(CONFIG_DIR, 'ZABAGED.yaml'))
+        roads = zabaged.buffer_layers["ZABAGED_POLOHOPIS:Silnice__dálnice"]
+        assert roads.value_distances["D1"] == 15 and roads.value_distances["S2"] == 5
+        assert zabaged.buffer_layers["ZABAGED_POLOHOPIS:Ulice"].controlling_atr_name is None
+        assert load_wps_config(os.path.join(CONFIG_DIR, 'WPS_config.yaml')).url.startswith("http")
+        print("[OK] Plugin configs loaded")
+
+    def test_duplicate_entries(self):
+        """A layer listed more times in the configs keeps its first entry"""
+        print("")
+        zabaged = load_zabaged_config(os.path.join(CONFIG_DIR, 'ZABAGED.yaml'))
+        local = load_zabaged_config(os.path.join(CONFIG_DIR, 'local_data', 'ZABAGED.yaml'))
+        arable = "ZABAGED_POLOHOPIS:Orná_půda_a_ostatní_dále_nespecifikované_plochy"
+        assert zabaged.code_edits[arable].controlling_attribute == "TYP_PUDY_K"
+        assert local.code_edits["OrnaPudaAOstatniDaleNespecifikovanePlochy"].controlling_attribute == "typ_pudy_p"
+        print("[OK] First config entry of a layer is used")
+
+    def test_required_attributes(self):
+        """Attributes to download per typename are derived from the configs"""
+        print("")
+        zabaged = load_zabaged_config(os.path.join(CONFIG_DIR, 'ZABAGED.yaml'))
+        lpis = load_lpis_config(os.path.join(CONFIG_DIR, 'LPIS.yaml'))
+        attributes = required_attributes(zabaged, lpis)
+
+        assert attributes["ZABAGED_POLOHOPIS:Silnice__dálnice"] == ("typsil_k",)
+        assert attributes["ZABAGED_POLOHOPIS:Osa_letištní_dráhy"] == ("sirka", "povrch_k")
+        assert attributes["ZABAGED_POLOHOPIS:Heliport"] == ("povrfato_k",)
+        assert attributes[lpis.layer_name] == ("kultura",)
+        assert "ZABAGED_POLOHOPIS:Ulice" not in attributes  # simple buffer, geometry only
+        assert "LPIS_layer" not in attributes
+        print("[OK] Required attributes derived from ZABAGED.yaml and LPIS.yaml")
+
+    def test_cache(self, tmp_path):
+        """Configs are parsed once and reloaded after modification"""
+        print("")
+        path = tmp_path / "mapping.yaml"
+        path.write_text("land_use:\n  - keywords: [Silo, silo]\n    code: 44100\n", encoding="utf-8")
+
+        rules = load_landuse_rules(str(path))
+        assert rules[0].keywords == ("silo",) and rules[0].code == 44100
+        assert load_landuse_rules(str(path)) is rules
+        assert load_yaml(str(path))["land_use"][0]["code"] == 44100
+        print("[OK] Parsed config reused")
+
+        path.write_text("land_use:\n  - keywords: [Ulice]\n    code: 77200\n", encoding="utf-8")
+        os.utime(path, (os.path.getatime(path), os.path.getmtime(path) + 10))
+        assert load_landuse_rules(str(path))[0].code == 77200
+        print("[OK] Modified config reloaded")
+
+        path.write_text("land_use:\n  - keywords: [Ulice]\n", encoding="utf-8")
+        os.utime(path, (os.path.getatime(path), os.path.getmtime(path) + 20))
+        with pytest.raises(ValueError):
+            load_landuse_rules(str(path))
+        print("[OK] Invalid config rejected")
+
+    def test_landuse_matcher(self):
+        """Compiled matcher resolves layer names like checking the rules in order (last match wins)"""
+        print("")
+        path = os.path.join(CONFIG_DIR, 'zabaged_to_LandUseCode_table.yaml')
+        rules = load_landuse_rules(path)
+        matcher = load_landuse_matcher(path)
+
+        def last_match(layer_name):
+            code = None
+            for rule in rules:
+                if any(keyword in layer_name.lower() for keyword in rule.keywords):
+                    code = rule.code
+            return code
+
+        with open(os.path.join(CONFIG_DIR, 'layers_merging_order.csv'), encoding='utf-8') as file:
+            layer_names = [line.split(',')[0].strip() for line in file if line.strip()]
+        keywords = [keyword for rule in rules for keyword in rule.keywords]
+        # Names with keywords of several rules
+        layer_names += [f"{a}_{b}".upper() for a, b in zip(keywords, keywords[::-1])] + ["no keyword", ""]
+
+        for layer_name in layer_names:
+            assert matcher.match(layer_name) == last_match(layer_name), f"Wrong LandUse code of '{layer_name}'"
+        print(f"[OK] {len(layer_names)} layer names matched")
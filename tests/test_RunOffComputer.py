@@ -10,7 +10,8 @@ import sys
 # Add the parent directory to PYTHONPATH for module imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from qgis.core import QgsApplication, QgsVectorLayer
+from PyQt5.QtCore import QVariant
+from qgis.core import QgsApplication, QgsVectorLayer, QgsField, QgsFeature
 # Initialize QGIS application in the main thread
 qgs = QgsApplication([], False)
 qgs.initQgis()
@@ -94,4 +95,104 @@ class TestRunOffComputer:
         for fld in ("V_X_m3", "CN2_X_runoff_height_mm", "CN3_X_runoff_volume_m3"):
             assert new_layer.fields().indexFromName(fld) >= 0, f"Missing field {fld}"
 
-        print("[OK] Created new fields successfully")
\ No newline at end of file
+        print("[OK] Created new fields successfully")
+
+    def test_weighted_runoffs_match_reference(self, tmp_path):
+        """
+        Batch weighted runoff computation gives the same numbers as the per-feature loop.
+        """
+        print("")
+        reoccurrences = ["N2", "N5"]
+        shapes = ["A", "B", "C", "D", "E", "F"]
+
+        # WPS-like output table with shape probabilities and CN2 weights
+        csv_file = tmp_path / "output.csv"
+        row = {f"QAPI_tvar{shape}": 0.1 * (i + 1) for i, shape in enumerate(shapes)}
+        for rec in reoccurrences:
+            row.update({f"P_{rec}tvar{shape}_%": 10.0 + i for i, shape in enumerate(shapes)})
+        with open(csv_file, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(row.keys()))
+            writer.writeheader()
+            writer.writerow(row)
+
+        def build_layer():
+            layer = QgsVectorLayer("Polygon?crs=EPSG:5514", "runoff", "memory")
+            fields = [QgsField(f"V_{rec}_m3", QVariant.Double) for rec in reoccurrences]
+            for rec in reoccurrences:
+                fields += [QgsField(f"CN2_{rec}_runoff_volume_m3", QVariant.Double),
+                           QgsField(f"CN3_{rec}_runoff_volume_m3", QVariant.Double)]
+            layer.dataProvider().addAttributes(fields)
+            layer.updateFields()
+            features = []
+            for i in range(50):
+                feat = QgsFeature(layer.fields())
+                for rec in reoccurrences:
+                    # every 10th feature carries an invalid volume and must stay untouched
+                    feat[f"CN2_{rec}_runoff_volume_m3"] = -1.0 if i % 10 == 0 else 1.5 * i
+                    feat[f"CN3_{rec}_runoff_volume_m3"] = 2.0 * i + 0.25
+                features.append(feat)
+            layer.dataProvider().addFeatures(features)
+            return layer
+
+        reference = RunOffComputer(None, reoccurrences, False, [], 0.2, None, None)
+        reference.csv_list = [str(csv_file)]
+        reference.runoff_layer = build_layer()
+        reference._calculate_weighted_runoffs_per_feature()
+
+        batch = RunOffComputer(None, reoccurrences, False, [], 0.2, None, None)
+        batch.csv_list = [str(csv_file)]
+        batch.runoff_layer = build_layer()
+        batch.calculate_weighted_runoffs()
+
+        ref_features = {f.id(): f for f in reference.runoff_layer.getFeatures()}
+        for feat in batch.runoff_layer.getFeatures():
+            for rec in reoccurrences:
+                expected = ref_features[feat.id()][f"V_{rec}_m3"]
+                if feat[f"CN2_{rec}_runoff_volume_m3"] < 0:
+                    assert feat[f"V_{rec}_m3"] == expected
+                else:
+                    assert pytest.approx(expected, rel=1e-12) == feat[f"V_{rec}_m3"]
+        print("[OK] Weighted runoffs match the per-feature reference")
+
+    def test_base_runoffs_match_reference(self):
+        """
+        Columnar base runoff computation gives the same numbers as the per-feature loop.
+        """
+        print("")
+        heights = [10.0, 25.0, 40.0]
+
+        def build_computer():
+            roc = RunOffComputer(None, None, True, heights, 0.2, None, None)
+            layer = QgsVectorLayer("Polygon?crs=EPSG:5514", "runoff", "memory")
+            layer.dataProvider().addAttributes([QgsField("CN2", QVariant.Double),
+                                                QgsField("CN3", QVariant.Double),
+                                                QgsField("SHAPE_Area", QVariant.Double)])
+            layer.updateFields()
+            features = []
+            for i in range(40):
+                feat = QgsFeature(layer.fields())
+                # every 8th feature has an invalid CN and must stay untouched
+                feat["CN2"] = 0.0 if i % 8 == 0 else 50.0 + i
+                feat["CN3"] = 23 * (50.0 + i) / (10 + 0.13 * (50.0 + i))
+                feat["SHAPE_Area"] = 100.0 * (i + 1)
+                features.append(feat)
+            layer.dataProvider().addFeatures(features)
+            roc.runoff_layer = roc.create_new_fields(layer)
+            return roc
+
+        reference = build_computer()
+        reference._calculate_base_runoffs_per_feature()
+        columnar = build_computer()
+        columnar.calculate_base_runoffs()
+
+        ref_features = {f.id(): f for f in reference.runoff_layer.getFeatures()}
+        names = [f.name() for f in columnar.runoff_layer.fields() if "runoff" in f.name()]
+        assert len(names) == 4 * len(heights)
+        for feat in columnar.runoff_layer.getFeatures():
+            for name in names:
+                expected = ref_features[feat.id()][name]
+                if feat["CN2"] <= 0:
+                    assert feat[name] == expected
+                else:
+                    assert pytest.approx(expected, rel=1e-12) == feat[name]
+        print("[OK] Base runoffs match the per-feature reference")
@@ -5,13 +5,14 @@ import pytest
 import os
 import sys
 
-from osgeo import gdal
-from qgis.core import QgsVectorLayer,  QgsRasterLayer
+from osgeo import gdal, ogr
+from qgis.core import QgsVectorLayer,  QgsRasterLayer, QgsGeometry
 
 # Add the parent directory to the PYTHONPATH
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from SoilDownloader import SoilDownloader, load_tiff_from_zip, polygonize_raster
+from SoilDownloader import SoilDownloader, load_tiff_from_zip, vectorize_soil_raster, open_local_raster, raster_window, read_raster_block, \
+    close_local_rasters, simple_clip
 from PluginUtils import get_string_from_yaml
 from test_LayerEditor import check_layer_validity
 
@@ -75,3 +76,67 @@ def test_soil_downloader():
     print("[OK] Raster data matches reference raster")
 
 
+def test_vectorize_soil_raster(tmp_path):
+    """Test polygonizing the soil raster window against the previous polygonize_raster and simple_clip output."""
+    base_folder = os.path.dirname(__file__)
+    plg_path = os.path.join(base_folder, 'input_files', "testing_LayerEditor_data", 'low.gpkg')
+    polygon = QgsVectorLayer(f"{plg_path}|layername=low", "low", "ogr")
+    raster_path = os.path.join(base_folder, 'reference', 'soil_reference.tif')
+
+    # Reference - polygonize the whole raster into a GeoPackage (as gdal:polygonize) and clip it by the polygon
+    dataset = gdal.Open(raster_path)
+    band = dataset.GetRasterBand(1)
+    gpkg_path = str(tmp_path / "polygonized.gpkg")
+    ogr_ds = ogr.GetDriverByName("GPKG").CreateDataSource(gpkg_path)
+    ogr_layer = ogr_ds.CreateLayer("polygonized", dataset.GetSpatialRef(), ogr.wkbPolygon)
+    ogr_layer.CreateField(ogr.FieldDefn("HSG", ogr.OFTInteger))
+    gdal.Polygonize(band, band.GetMaskBand(), ogr_layer, 0, [])
+    ogr_layer = ogr_ds = None
+    reference = simple_clip(QgsVectorLayer(f"{gpkg_path}|layername=polygonized", "Soil Layer", "ogr"), polygon)
+
+    soil_layer = vectorize_soil_raster(raster_path, polygon)
+    assert soil_layer.isValid()
+    assert soil_layer.fields().names() == reference.fields().names()
+    assert soil_layer.featureCount() == reference.featureCount()
+
+    def features(layer):
+        return sorted(((f["HSG"], f.geometry()) for f in layer.getFeatures()),
+                      key=lambda item: (item[0], round(item[1].area(), 3), round(item[1].centroid().asPoint().x(), 3),
+                                        round(item[1].centroid().asPoint().y(), 3)))
+
+    for (hsg, geom), (reference_hsg, reference_geom) in zip(features(soil_layer), features(reference)):
+        assert hsg == reference_hsg
+        assert geom.symDifference(reference_geom).area() == pytest.approx(0, abs=1e-6), f"Polygon of HSG {hsg} differs"
+    print("[OK] Polygonized soil layer matches the previous output feature by feature")
+
+
+def test_open_local_raster():
+    """Test windowed reading from a reused local raster handle."""
+    base_folder = os.path.dirname(__file__)
+    plg_path = os.path.join(base_folder, 'input_files', "testing_LayerEditor_data", 'low.gpkg')
+    polygon = QgsVectorLayer(f"{plg_path}|layername=low", "low", "ogr")
+    raster_path = os.path.join(base_folder, 'reference', 'soil_reference.tif')
+
+    dataset = open_local_raster(raster_path)
+    assert open_local_raster(raster_path) is dataset, "Raster handle was not reused"
+    print("[OK] Raster handle reused")
+
+    # Window under the polygon matches the same pixels of the whole raster
+    xoff, yoff, xsize, ysize = raster_window(dataset, polygon.extent())
+    data, valid = read_raster_block(dataset, xoff, yoff, xsize, ysize)
+    whole = gdal.Open(raster_path).ReadAsArray()
+    assert data.shape == (ysize, xsize) and valid.shape == data.shape
+    assert (data == whole[yoff:yoff + ysize, xoff:xoff + xsize]).all()
+    print("[OK] Raster window read")
+
+    from_handle = vectorize_soil_raster(dataset, polygon)
+    from_path = vectorize_soil_raster(raster_path, polygon)
+    assert from_handle.featureCount() == from_path.featureCount()
+    assert sum(f.geometry().area() for f in from_handle.getFeatures()) == \
+        pytest.approx(sum(f.geometry().area() for f in from_path.getFeatures()))
+    print("[OK] Soil layer from the raster handle matches the one from the path")
+
+    close_local_rasters()
+    assert open_local_raster(raster_path) is not dataset, "Raster handle was not closed"
+    close_local_rasters()
+    print("[OK] Raster handle closed")
@@ -0,0 +1,138 @@
+import sys
+import os
+from qgis.core import QgsApplication, QgsRectangle, QgsGeometry, QgsVectorLayer, QgsFeature, QgsField, QgsWkbTypes
+from PyQt5.QtCore import QVariant
+
+# Add the parent directory to the PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from WFSdownloader import WFSDownloader
+from WFScache import WFSTileCache
+from LayerEditor import get_polygon_from_extent
+from wfs_stub_server import StubWFSServer, square_features
+
+# Initialize QGIS application in the main thread
+qgs = QgsApplication([], False)
+qgs.initQgis()
+
+
+class TestWFSTileCache:
+    """Test the WFSTileCache class against a local stand-in WFS"""
+    @classmethod
+    def teardown_class(cls):
+        # Exit QGIS application
+        qgs.exitQgis()
+
+    def test_cached_download(self, tmp_path):
+        """Second download of the same area is served from the cache"""
+        print("")
+        # Two rows of squares in neighbouring 1 km tiles
+        layers = {"Layer_a": square_features(-700500, -1100500, 100) + square_features(-699500, -1100500, 50)}
+        polygon = get_polygon_from_extent(-1100600, -700600, -1100400, -698900)
+        cache = WFSTileCache(str(tmp_path / "cache.sqlite"), tile_size=1000)
+        wfs_downloader = WFSDownloader(None, True, polygon, False, cache)
+        ymin, xmin, ymax, xmax, extent = wfs_downloader.get_wfs_info(["stub:Layer_a"])
+
+        with StubWFSServer(layers) as server:
+            first = wfs_downloader.process_wfs_layer("stub:Layer_a", ymin, xmin, ymax, xmax, extent, server.url)
+            downloads = len(server.get_feature_requests())
+            second = wfs_downloader.process_wfs_layer("stub:Layer_a", ymin, xmin, ymax, xmax, extent, server.url)
+            assert len(server.get_feature_requests()) == downloads, "Cached tiles were downloaded again"
+
+        assert first.featureCount() == second.featureCount() == 150
+        assert sorted(f["kod"] for f in first.getFeatures()) == sorted(f["kod"] for f in second.getFeatures())
+        print("[OK] Cached layer matches the downloaded one")
+
+        stats = cache.stats()
+        tiles = len(cache.tiles_for_extent(QgsRectangle(xmin, ymin, xmax, ymax)))
+        assert stats["misses"] == tiles and stats["hits"] == tiles, stats
+        print(f"[OK] Cache stats {stats}")
+
+    def test_expiration_and_eviction(self, tmp_path):
+        """Expired tiles are downloaded again and the cache size is kept under max_size"""
+        print("")
+        layers = {"Layer_a": square_features(-700500, -1100500, 50), "Layer_b": square_features(-700500, -1100500, 50)}
+        extent = QgsRectangle(-700600, -1100600, -699600, -1100400)
+        cache = WFSTileCache(str(tmp_path / "cache.sqlite"), tile_size=1000, ttl=0)
+        wfs_downloader = WFSDownloader(None, True, None, False, cache)
+
+        with StubWFSServer(layers) as server:
+            def fetch(name):
+                return lambda rect: wfs_downloader.load_wfs_layer(name, rect, server.url)
+
+            cache.get_layer("stub:Layer_a", server.url, extent, fetch("stub:Layer_a"))
+            cache.get_layer("stub:Layer_a", server.url, extent, fetch("stub:Layer_a"))
+            assert cache.stats()["hits"] == 0, "Expired tiles were served from the cache"
+            print("[OK] Expired tiles are downloaded again")
+
+            cache.ttl = 3600
+            cache.max_size = 1  # a single tile does not fit
+            layer = cache.get_layer("stub:Layer_b", server.url, extent, fetch("stub:Layer_b"))
+
+        assert cache.stats()["evictions"] > 0
+        assert layer.featureCount() == 50, "Tiles of the current request were evicted"
+        print(f"[OK] Least recently used tiles evicted {cache.stats()}")
+
+    def test_aoi_tiles(self, tmp_path):
+        """Only tiles intersecting the AOI polygon are cached, downloaded by runs of adjacent tiles"""
+        print("")
+        x0, y0 = -703000, -1103000
+        # L-shaped AOI along the bottom row and the left column of a 3 x 3 tile grid
+        aoi = QgsGeometry.fromRect(QgsRectangle(x0 + 100, y0 + 100, x0 + 2900, y0 + 300)).combine(
+            QgsGeometry.fromRect(QgsRectangle(x0 + 100, y0 + 100, x0 + 300, y0 + 2900)))
+        extent = aoi.boundingBox()
+        cache = WFSTileCache(str(tmp_path / "cache.sqlite"), tile_size=1000)
+
+        tiles = cache.tiles_for_extent(extent, aoi)
+        assert len(cache.tiles_for_extent(extent)) == 9 and len(tiles) == 5
+        assert len(cache._tile_runs(tiles)) == 3
+
+        layers = {"Layer_a": square_features(x0 + 200, y0 + 200, 200, size=10.0)}
+        wfs_downloader = WFSDownloader(None, True, None, False, cache)
+        with StubWFSServer(layers) as server:
+            layer = cache.get_layer("stub:Layer_a", server.url, extent,
+                                    lambda rect: wfs_downloader.load_wfs_layer("stub:Layer_a", rect, server.url), aoi)
+            downloads = len(server.get_feature_requests())
+
+        assert downloads == 3 and cache.stats()["misses"] == 5
+        assert layer.featureCount() == 200
+        print(f"[OK] {len(tiles)} of 9 tiles cached in {downloads} downloads")
+
+    def test_tile_schemas(self, tmp_path):
+        """Tiles stored with different fields and geometry types are read by field name as multi geometries"""
+        print("")
+        cache = WFSTileCache(str(tmp_path / "cache.sqlite"), tile_size=1000)
+
+        def tile_layer(geometry_type, names, rect, values):
+            layer = QgsVectorLayer(f"{geometry_type}?crs=EPSG:5514", "tile", "memory")
+            layer.dataProvider().addAttributes([QgsField(name, QVariant.String) for name in names])
+            layer.updateFields()
+            feature = QgsFeature(layer.fields())
+            geom = QgsGeometry.fromRect(rect)
+            if geometry_type.startswith("Multi"):
+                geom.convertToMultiType()
+            feature.setGeometry(geom)
+            feature.setAttributes(values)
+            layer.dataProvider().addFeatures([feature])
+            return layer
+
+        first = tile_layer("Polygon", ["kod"], QgsRectangle(-700900, -1100900, -700800, -1100800), ["a"])
+        second = tile_layer("MultiPolygon", ["gml_id", "kod"], QgsRectangle(-699900, -1100900, -699800, -1100800),
+                            ["Layer.2", "b"])
+        cache.get_layer("stub:Layer", "source", QgsRectangle(-700900, -1100900, -700800, -1100800),
+                        lambda rect: first)
+        layer = cache.get_layer("stub:Layer", "source", QgsRectangle(-700900, -1100900, -699800, -1100800),
+                                lambda rect: second)
+
+        assert layer.wkbType() == QgsWkbTypes.MultiPolygon
+        assert layer.fields().names() == ["kod", "gml_id"]
+        assert sorted((f["kod"], f["gml_id"]) for f in layer.getFeatures()) == [("a", None), ("b", "Layer.2")]
+        assert all(f.geometry().isMultipart() for f in layer.getFeatures())
+        print("[OK] Tile fields mapped by name, geometries converted to multi")
+
+        wfs_downloader = WFSDownloader(None, True, None, False, cache, {"stub:Layer": ("KOD",)})
+        full_downloader = WFSDownloader(None, True, None, False, cache)
+        assert wfs_downloader.cache_source("stub:Layer", "url") != full_downloader.cache_source("stub:Layer", "url")
+        assert wfs_downloader.cache_source("stub:Layer", "url") == \
+            WFSDownloader(None, True, None, False, cache, {"stub:Layer": ("kod",)}).cache_source("stub:Layer", "url")
+        print("[OK] Attribute sets are cached apart")
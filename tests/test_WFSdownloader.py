@@ -1,7 +1,9 @@
 import pytest
 import sys
 import os
-from qgis.core import QgsApplication, QgsVectorLayer
+import time
+from qgis.core import QgsApplication, QgsVectorLayer, QgsRectangle, QgsGeometry, QgsFeature, QgsPointXY, \
+    QgsVectorFileWriter, QgsCoordinateTransformContext
 import requests
 
 # Ensure that qgis packages are imported to your python environment when running locally
@@ -10,8 +12,10 @@ import requests
 # Add the parent directory to the PYTHONPATH
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from WFSdownloader import WFSDownloader
+from WFSdownloader import WFSDownloader, FILTER_MAX_GET_LENGTH, SRS_NAME
 from PluginUtils import get_string_from_yaml
+from LayerEditor import get_polygon_from_extent
+from wfs_stub_server import StubWFSServer, square_features, grid_features
 
 # Initialize QGIS application in the main thread
 qgs = QgsApplication([], False)
@@ -83,3 +87,250 @@ class TestWFSDownloader:
         response = requests.get(LPIS_URI)
         assert response.status_code == 200, f"Failed to access LPIS URI: {LPIS_URI}"
         print("[OK] Successfully accessed the LPIS URI")
+
+    def test_concurrent_download(self):
+        """Test concurrent download of several layers from a local stand-in WFS with artificial latency"""
+        print("")
+        names = ["Layer_a", "Layer_b", "Layer_c", "Layer_d"]
+        layers = {name: square_features(-700000 + i * 1000, -1100000, 3 + i) for i, name in enumerate(names)}
+        # The first layer is the slowest one, so it finishes last
+        latency = {"Layer_a": 1.5, "Layer_b": 0.5, "Layer_c": 0.5, "Layer_d": 0.5}
+
+        polygon = get_polygon_from_extent(-1100100, -700100, -1099000, -695000)
+        wfs_downloader = WFSDownloader(None, True, polygon, False)
+        ymin, xmin, ymax, xmax, extent = wfs_downloader.get_wfs_info(names)
+        typenames = [f"stub:{name}" for name in names]
+
+        with StubWFSServer(layers, latency, page_limit=50) as server:
+            start = time.perf_counter()
+            sequential = wfs_downloader.process_wfs_layers(typenames, ymin, xmin, ymax, xmax, extent, server.url)
+            sequential_time = time.perf_counter() - start
+
+            completed = []
+            start = time.perf_counter()
+            concurrent = wfs_downloader.process_wfs_layers(typenames, ymin, xmin, ymax, xmax, extent, server.url,
+                                                           workers=4,
+                                                           layer_done=lambda name, lyr: completed.append(name))
+            concurrent_time = time.perf_counter() - start
+
+            # Canceled run does not download anything
+            canceled = wfs_downloader.process_wfs_layers(typenames, ymin, xmin, ymax, xmax, extent, server.url,
+                                                         workers=4, is_canceled=lambda: True)
+
+        # Services without paging are loaded by the WFS provider, serially in the calling thread
+        with StubWFSServer(layers, latency) as server:
+            start = time.perf_counter()
+            provider = wfs_downloader.process_wfs_layers(typenames, ymin, xmin, ymax, xmax, extent, server.url,
+                                                         workers=4)
+            provider_time = time.perf_counter() - start
+
+        assert [lyr.name() for lyr in concurrent] == typenames, "Stacking order is not kept"
+        for seq_layer, con_layer, name in zip(sequential, concurrent, names):
+            assert con_layer.featureCount() == len(layers[name])
+            assert seq_layer.featureCount() == con_layer.featureCount()
+        print("[OK] Concurrent download keeps the order of layers")
+
+        assert sorted(completed) == sorted(typenames) and completed[-1] == "stub:Layer_a"
+        print("[OK] Progress reported per completed layer")
+
+        assert concurrent_time < sequential_time, f"{concurrent_time:.2f}s >= {sequential_time:.2f}s"
+        print(f"[OK] Concurrent download {sequential_time:.2f}s -> {concurrent_time:.2f}s")
+
+        assert canceled == [None] * len(typenames)
+        print("[OK] Canceled download returns no layers")
+
+        assert [lyr.featureCount() for lyr in provider] == [len(layers[name]) for name in names]
+        assert provider_time >= sum(latency.values()), "WFS provider layers were loaded concurrently"
+        print(f"[OK] WFS provider layers loaded serially in {provider_time:.2f}s")
+
+    @pytest.mark.parametrize("geojson", [False, True])
+    def test_paged_download(self, geojson):
+        """Test paged download from a local stand-in WFS limiting the features per GetFeature response"""
+        print("")
+        features = square_features(-700000, -1100000, 95)
+        bbox = QgsRectangle(-700100, -1100100, -698000, -1099000)
+        wfs_downloader = WFSDownloader(None, True, None, False)
+
+        with StubWFSServer({"Layer_paged": features}, page_limit=20, geojson=geojson) as server:
+            layer = wfs_downloader.load_wfs_layer("stub:Layer_paged", bbox, server.url)
+            page_requests = server.get_feature_requests()
+            gzip_responses = server.gzip_responses
+
+        assert layer is not None and layer.isValid()
+        assert layer.featureCount() == len(features)
+        assert sorted(f["kod"] for f in layer.getFeatures()) == sorted(kod for kod, _ in features)
+        assert sum(f.geometry().area() for f in layer.getFeatures()) == pytest.approx(len(features) * 100)
+        print(f"[OK] {layer.featureCount()} features downloaded in pages")
+
+        assert [int(params["startindex"]) for params in page_requests] == [0, 20, 40, 60, 80]
+        assert all(int(params["count"]) == 20 for params in page_requests)
+        assert all(("json" in params.get("outputformat", "")) == geojson for params in page_requests)
+        assert gzip_responses >= len(page_requests)
+        print(f"[OK] {len(page_requests)} pages of CountDefault features, gzip transfer")
+
+        assert all(params.get("srsname") == SRS_NAME and "sortby" not in params for params in page_requests)
+        with StubWFSServer({"Layer_paged": features}, page_limit=20, geojson=geojson, sorting=True) as server:
+            sorted_layer = wfs_downloader.load_wfs_layer("stub:Layer_paged", bbox, server.url)
+            sorted_requests = server.get_feature_requests()
+        assert sorted_layer is not None and sorted_layer.featureCount() == len(features)
+        assert all(params.get("sortby") == "OBJECTID ASC" for params in sorted_requests)
+        print("[OK] Pages requested in EPSG:5514, sorted by the feature identifier if the service implements sorting")
+
+    @pytest.mark.parametrize("geojson", [False, True])
+    def test_paged_download_checks(self, geojson):
+        """Test paging without numberMatched and failing on invalid pages instead of treating them as the last one"""
+        print("")
+        features = square_features(-700000, -1100000, 95)
+        bbox = QgsRectangle(-700100, -1100100, -698000, -1099000)
+        wfs_downloader = WFSDownloader(None, True, None, False)
+
+        # Without numberMatched a short page (server limit) is not the last one, paging ends with an empty page
+        with StubWFSServer({"Layer_paged": features}, page_limit=20, geojson=geojson, number_matched=False) as server:
+            layer = wfs_downloader.load_wfs_layer("stub:Layer_paged", bbox, server.url)
+            page_requests = server.get_feature_requests()
+        assert layer is not None and layer.featureCount() == len(features)
+        assert [int(params["startindex"]) for params in page_requests] == [0, 20, 40, 60, 80, 100]
+        print("[OK] Pages read until an empty one without numberMatched")
+
+        for invalid in ("exception", "truncated"):
+            with StubWFSServer({"Layer_paged": features}, page_limit=20, geojson=geojson, invalid_at=40,
+                               invalid=invalid) as server:
+                layer = wfs_downloader.load_wfs_layer("stub:Layer_paged", bbox, server.url)
+                page_requests = server.get_feature_requests()
+            assert layer is None, f"Download with {invalid} page did not fail"
+            assert [int(params["startindex"]) for params in page_requests] == [0, 20, 40]
+        print("[OK] ExceptionReport and truncated pages fail the download")
+
+    def test_attribute_projection(self):
+        """Test that only attributes required by the configs are requested from paged WFS and kept by clipping"""
+        print("")
+        features = square_features(-700000, -1100000, 30)
+        polygon = get_polygon_from_extent(-1100100, -700100, -1099000, -699000)
+        with StubWFSServer({"Layer_geom": features, "Layer_kod": features}, page_limit=50) as server:
+            wfs_downloader = WFSDownloader(None, True, polygon, False, None, {"stub:Layer_kod": ("kod",)})
+            ymin, xmin, ymax, xmax, extent = wfs_downloader.get_wfs_info(["stub:Layer_geom", "stub:Layer_kod"])
+            geom_only, with_kod = wfs_downloader.process_wfs_layers(["stub:Layer_geom", "stub:Layer_kod"],
+                                                                   ymin, xmin, ymax, xmax, extent, server.url)
+            requested = {params["typenames"]: params.get("propertyname") for params in server.get_feature_requests()}
+
+        assert requested == {"stub:Layer_geom": "geom", "stub:Layer_kod": "kod,geom"}
+        assert geom_only.featureCount() == with_kod.featureCount() == len(features)
+        assert geom_only.fields().names() == []
+        assert with_kod.fields().names() == ["kod"]
+        assert sorted(f["kod"] for f in with_kod.getFeatures()) == sorted(kod for kod, _ in features)
+        print("[OK] propertyName projection derived from the required attributes")
+
+        # Sources read without projection (WFS provider, file://) are projected when clipping
+        full = wfs_downloader.clip_layer(with_kod, extent, "full")
+        projected = wfs_downloader.clip_layer(with_kod, extent, "projected", ["KOD", "OBJECTID"])
+        empty = wfs_downloader.clip_layer(with_kod, extent, "empty", [])
+        assert full.fields().names() == projected.fields().names() == ["kod"]
+        assert empty.fields().names() == [] and empty.featureCount() == full.featureCount()
+        print("[OK] Clipped layer keeps only the required attributes")
+
+    def test_aoi_filter(self, tmp_path):
+        """Test downloading features of an elongated AOI instead of its whole extent"""
+        print("")
+        x0, y0 = -700000, -1100000
+        features = grid_features(x0, y0, 40, 40)  # 400 x 400 m
+        # Thin diagonal strip over the grid
+        strip = [(1.5, 0.5), (25.5, 0.5), (398.5, 375.5), (398.5, 399.5), (374.5, 399.5), (1.5, 24.5)]
+        aoi = QgsGeometry.fromPolygonXY([[QgsPointXY(x0 + x, y0 + y) for x, y in strip]])
+        polygon = QgsVectorLayer("Polygon?crs=EPSG:5514", "strip", "memory")
+        feature = QgsFeature()
+        feature.setGeometry(aoi)
+        polygon.dataProvider().addFeatures([feature])
+        polygon.updateExtents()
+
+        squares = {}
+        for kod, coords in features:
+            values = [float(value) for value in coords.split()]
+            squares[kod] = QgsGeometry.fromRect(QgsRectangle(values[0], values[1], values[4], values[5]))
+        expected = sorted(kod for kod, square in squares.items() if square.intersects(aoi))
+
+        wfs_downloader = WFSDownloader(None, True, polygon, False)
+        ymin, xmin, ymax, xmax, extent = wfs_downloader.get_wfs_info(["stub:Grid"])
+        bbox = QgsRectangle(xmin, ymin, xmax, ymax)
+
+        with StubWFSServer({"Grid": features}, page_limit=5000, spatial_filter="bbox") as server:
+            by_extent = wfs_downloader.load_wfs_layer("stub:Grid", bbox, server.url)
+            by_boxes = wfs_downloader.load_wfs_layer("stub:Grid", bbox, server.url, wfs_downloader.aoi_geometry())
+            box_requests = len(server.get_feature_requests()) - 1
+        with StubWFSServer({"Grid": features}, page_limit=5000, spatial_filter="intersects", post=True) as server:
+            by_filter = wfs_downloader.load_wfs_layer("stub:Grid", bbox, server.url, wfs_downloader.aoi_geometry())
+            filter_requests = server.get_feature_requests()
+            processed = wfs_downloader.process_wfs_layer("stub:Grid", ymin, xmin, ymax, xmax, extent, server.url)
+            max_url_length = server.max_url_length
+
+        assert by_extent.featureCount() == len(features)
+        assert filter_requests[0].get("method") == "post", "Filter was not sent by POST"
+        assert "filter" in filter_requests[0] and "bbox" not in filter_requests[0]
+        assert filter_requests[0].get("srsname") == SRS_NAME
+        assert sorted(f["kod"] for f in by_filter.getFeatures()) == expected
+        assert sorted(f["kod"] for f in processed.getFeatures()) == expected
+        assert max_url_length < 500
+        print(f"[OK] Intersects filter: {by_filter.featureCount()} instead of {len(features)} features "
+              f"({len(features) / by_filter.featureCount():.1f}x less)")
+
+        # Without POST a short filter is sent in the URL, a long one is replaced by sub-bboxes
+        round_aoi = QgsGeometry.fromPointXY(QgsPointXY(x0 + 200, y0 + 200)).buffer(150, 100)
+        with StubWFSServer({"Grid": features}, page_limit=5000, spatial_filter="intersects") as server:
+            by_get = wfs_downloader.load_wfs_layer("stub:Grid", bbox, server.url, wfs_downloader.aoi_geometry())
+            get_requests = server.get_feature_requests()
+            wfs_downloader.load_wfs_layer("stub:Grid", bbox, server.url, round_aoi)
+            round_requests = server.get_feature_requests()[len(get_requests):]
+            max_url_length = server.max_url_length
+        assert "filter" in get_requests[0] and get_requests[0].get("method") != "post"
+        assert sorted(f["kod"] for f in by_get.getFeatures()) == expected
+        assert len(round_requests) > 1 and all("filter" not in params for params in round_requests)
+        assert max_url_length <= FILTER_MAX_GET_LENGTH + 500
+        print(f"[OK] Without POST: short filter in the URL, long filter replaced by {len(round_requests)} sub-bboxes")
+
+        box_kods = [f["kod"] for f in by_boxes.getFeatures()]
+        assert box_requests > 1 and len(box_kods) == len(set(box_kods)), "Features of more boxes were duplicated"
+        assert set(expected) <= set(box_kods) and len(box_kods) < len(features) / 2
+        print(f"[OK] {box_requests} sub-bboxes: {len(box_kods)} instead of {len(features)} features "
+              f"({len(features) / len(box_kods):.1f}x less)")
+
+        # Features are told apart by their gml:id, an equal feature with another identifier is not a duplicate
+        with StubWFSServer({"Grid": features + [features[0]]}, page_limit=5000, spatial_filter="bbox") as server:
+            twin_boxes = wfs_downloader.load_wfs_layer("stub:Grid", bbox, server.url, wfs_downloader.aoi_geometry())
+        assert sorted(f["kod"] for f in twin_boxes.getFeatures()) == sorted(box_kods + [features[0][0]])
+        print("[OK] Sub-bbox features deduplicated by the feature identifier")
+
+        # Local GeoPackage: features outside of the AOI are dropped while reading the extent
+        gpkg_path = str(tmp_path / "grid.gpkg")
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "GPKG"
+        options.layerName = "Grid"
+        error = QgsVectorFileWriter.writeAsVectorFormatV3(by_extent, gpkg_path, QgsCoordinateTransformContext(),
+                                                          options)[0]
+        assert error == QgsVectorFileWriter.NoError
+        local = wfs_downloader.process_wfs_layer("Grid", ymin, xmin, ymax, xmax, extent, f"file://{gpkg_path}")
+        assert sorted(f["kod"] for f in local.getFeatures()) == expected
+        print("[OK] Local GeoPackage filtered by the AOI")
+
+    def test_clip_layer(self):
+        """Test clipping of inner, boundary and outer features to the extent"""
+        print("")
+        layer = QgsVectorLayer("Polygon?crs=EPSG:5514", "squares", "memory")
+        features = []
+        # 10x10 squares on a 0..100 grid, the extent cuts the outer ones in half
+        for x in range(0, 100, 10):
+            for y in range(0, 100, 10):
+                feature = QgsFeature()
+                feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(x, y, x + 10, y + 10)))
+                features.append(feature)
+        layer.dataProvider().addFeatures(features)
+        extent = QgsRectangle(15, 15, 55, 75)
+        extent_geom = QgsGeometry.fromRect(extent)
+
+        clipped = WFSDownloader(None, False, None, False).clip_layer(layer, extent, "clipped")
+
+        expected = [f.geometry().intersection(extent_geom) for f in layer.getFeatures()
+                    if f.geometry().intersects(extent_geom)]
+        assert clipped.featureCount() == len(expected)
+        assert sum(f.geometry().area() for f in clipped.getFeatures()) == pytest.approx(40 * 60)
+        assert sorted(round(f.geometry().area(), 6) for f in clipped.getFeatures()) == \
+            sorted(round(g.area(), 6) for g in expected)
+        print("[OK] Clipped layer matches per-feature intersection")
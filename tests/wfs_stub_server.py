@@ -0,0 +1,328 @@
+"""Local stand-in WFS 2.0 server serving canned GML, used to test downloads without the real services."""
+
+import gzip
+import json
+import time
+import threading
+import xml.etree.ElementTree as ET
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+NAMESPACE = "http://example.com/stub"
+
+CAPABILITIES = """<?xml version="1.0" encoding="UTF-8"?>
+<wfs:WFS_Capabilities version="2.0.0" xmlns:wfs="http://www.opengis.net/wfs/2.0"
+    xmlns:ows="http://www.opengis.net/ows/1.1" xmlns:fes="http://www.opengis.net/fes/2.0"
+    xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:stub="{ns}">
+  <ows:OperationsMetadata>
+    <ows:Operation name="GetCapabilities"><ows:DCP><ows:HTTP><ows:Get xlink:href="{url}"/></ows:HTTP></ows:DCP></ows:Operation>
+    <ows:Operation name="DescribeFeatureType"><ows:DCP><ows:HTTP><ows:Get xlink:href="{url}"/></ows:HTTP></ows:DCP></ows:Operation>
+    <ows:Operation name="GetFeature"><ows:DCP><ows:HTTP><ows:Get xlink:href="{url}"/>{post}</ows:HTTP></ows:DCP>
+      <ows:Parameter name="outputFormat"><ows:AllowedValues><ows:Value>application/gml+xml; version=3.2</ows:Value>{json_format}</ows:AllowedValues></ows:Parameter>
+    </ows:Operation>
+    <ows:Constraint name="ImplementsResultPaging"><ows:NoValues/><ows:DefaultValue>{paging}</ows:DefaultValue></ows:Constraint>
+    <ows:Constraint name="CountDefault"><ows:NoValues/><ows:DefaultValue>{count_default}</ows:DefaultValue></ows:Constraint>
+  </ows:OperationsMetadata>
+  <wfs:FeatureTypeList>
+{feature_types}
+  </wfs:FeatureTypeList>
+{filter_capabilities}
+</wfs:WFS_Capabilities>
+"""
+
+SPATIAL_CAPABILITIES = """<fes:Spatial_Capabilities>
+    <fes:GeometryOperands><fes:GeometryOperand name="gml:Polygon"/><fes:GeometryOperand name="gml:MultiSurface"/></fes:GeometryOperands>
+    <fes:SpatialOperators><fes:SpatialOperator name="BBOX"/><fes:SpatialOperator name="Intersects"/></fes:SpatialOperators>
+  </fes:Spatial_Capabilities>"""
+
+SORTING_CAPABILITIES = """<fes:Conformance>
+    <fes:Constraint name="ImplementsSorting"><ows:NoValues/><ows:DefaultValue>TRUE</ows:DefaultValue></fes:Constraint>
+  </fes:Conformance>"""
+
+FEATURE_TYPE = """    <wfs:FeatureType>
+      <wfs:Name>stub:{name}</wfs:Name>
+      <wfs:Title>{name}</wfs:Title>
+      <wfs:DefaultCRS>urn:ogc:def:crs:EPSG::5514</wfs:DefaultCRS>
+      <ows:WGS84BoundingBox><ows:LowerCorner>12 48</ows:LowerCorner><ows:UpperCorner>19 51</ows:UpperCorner></ows:WGS84BoundingBox>
+    </wfs:FeatureType>"""
+
+SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:gml="http://www.opengis.net/gml/3.2"
+    xmlns:stub="{ns}" targetNamespace="{ns}" elementFormDefault="qualified">
+  <xsd:import namespace="http://www.opengis.net/gml/3.2" schemaLocation="http://schemas.opengis.net/gml/3.2.1/gml.xsd"/>
+{types}
+</xsd:schema>
+"""
+
+SCHEMA_TYPE = """  <xsd:complexType name="{name}Type"><xsd:complexContent><xsd:extension base="gml:AbstractFeatureType"><xsd:sequence>
+    {object_id}<xsd:element name="kod" type="xsd:string" minOccurs="0"/>
+    <xsd:element name="geom" type="gml:SurfacePropertyType" minOccurs="0"/>
+  </xsd:sequence></xsd:extension></xsd:complexContent></xsd:complexType>
+  <xsd:element name="{name}" type="stub:{name}Type" substitutionGroup="gml:AbstractFeature"/>"""
+
+COLLECTION = """<?xml version="1.0" encoding="UTF-8"?>
+<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" xmlns:gml="http://www.opengis.net/gml/3.2"
+    xmlns:stub="{ns}" numberMatched="{matched}" numberReturned="{returned}" timeStamp="2025-01-01T00:00:00Z">
+{members}
+</wfs:FeatureCollection>
+"""
+
+EXCEPTION_REPORT = """<?xml version="1.0" encoding="UTF-8"?>
+<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows/1.1" version="2.0.0">
+  <ows:Exception exceptionCode="OperationProcessingFailed"><ows:ExceptionText>Stub failure</ows:ExceptionText></ows:Exception>
+</ows:ExceptionReport>
+"""
+
+MEMBER = """  <wfs:member><stub:{name} gml:id="{name}.{fid}">{kod}<stub:geom>
+    <gml:Polygon gml:id="{name}.{fid}.geom" srsName="urn:ogc:def:crs:EPSG::5514"><gml:exterior><gml:LinearRing>
+      <gml:posList>{coords}</gml:posList>
+    </gml:LinearRing></gml:exterior></gml:Polygon>
+  </stub:geom></stub:{name}></wfs:member>"""
+
+
+def square_features(origin_x, origin_y, count, size=10.0):
+    """Return (kod, posList) tuples of `count` adjacent squares starting at the origin."""
+    features = []
+    for i in range(count):
+        x0, y0 = origin_x + i * size, origin_y
+        x1, y1 = x0 + size, y0 + size
+        features.append((f"k{i}", f"{x0} {y0} {x1} {y0} {x1} {y1} {x0} {y1} {x0} {y0}"))
+    return features
+
+
+def grid_features(origin_x, origin_y, cols, rows, size=10.0):
+    """Return (kod, posList) tuples of a cols x rows grid of squares starting at the origin."""
+    features = []
+    for j in range(rows):
+        for kod, coords in square_features(origin_x, origin_y + j * size, cols, size):
+            features.append((f"{kod}_{j}", coords))
+    return features
+
+
+def _square_bounds(coords):
+    values = [float(value) for value in coords.split()]
+    return min(values[0::2]), min(values[1::2]), max(values[0::2]), max(values[1::2])
+
+
+def _point_in_ring(x, y, ring):
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def _segments_cross(p1, p2, q1, q2):
+    def orientation(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    return orientation(p1, p2, q1) * orientation(p1, p2, q2) <= 0 and \
+        orientation(q1, q2, p1) * orientation(q1, q2, p2) <= 0
+
+
+def ring_intersects_square(ring, bounds):
+    """Return True if the polygon ring [(x, y), ...] intersects the axis aligned square."""
+    x0, y0, x1, y1 = bounds
+    corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]
+    if any(x0 <= x <= x1 and y0 <= y <= y1 for x, y in ring):
+        return True
+    if any(_point_in_ring(x, y, ring) for x, y in corners[:4]):
+        return True
+    return any(_segments_cross(p1, p2, q1, q2) for p1, p2 in zip(ring, ring[1:]) for q1, q2 in zip(corners, corners[1:]))
+
+
+def filter_rings(fes_filter):
+    """Return the polygon rings of a fes:Intersects filter."""
+    rings = []
+    for pos_list in ET.fromstring(fes_filter).iter("{http://www.opengis.net/gml/3.2}posList"):
+        values = [float(value) for value in pos_list.text.split()]
+        rings.append(list(zip(values[0::2], values[1::2])))
+    return rings
+
+
+def get_feature_params(body):
+    """Return the GET parameters (lower case keys) of an XML GetFeature request."""
+    root = ET.fromstring(body)
+    params = {"request": "getfeature", "method": "post"}
+    for name in ("count", "startIndex", "outputFormat"):
+        if root.get(name) is not None:
+            params[name.lower()] = root.get(name)
+    query = root.find("{http://www.opengis.net/wfs/2.0}Query")
+    params["typenames"] = query.get("typeNames")
+    if query.get("srsName") is not None:
+        params["srsname"] = query.get("srsName")
+    properties = [element.text for element in query.iter("{http://www.opengis.net/wfs/2.0}PropertyName")]
+    if properties:
+        params["propertyname"] = ",".join(properties)
+    fes_filter = query.find("{http://www.opengis.net/fes/2.0}Filter")
+    if fes_filter is not None:
+        params["filter"] = ET.tostring(fes_filter, encoding="unicode")
+    sort_property = query.find("{http://www.opengis.net/fes/2.0}SortBy/{http://www.opengis.net/fes/2.0}SortProperty")
+    if sort_property is not None:
+        params["sortby"] = " ".join(element.text for element in sort_property)
+    return params
+
+
+def geojson_collection(name, page, start, matched, with_kod=True):
+    """Return a GeoJSON FeatureCollection of the (kod, posList) tuples."""
+    features = []
+    for i, (kod, coords) in enumerate(page):
+        values = [float(value) for value in coords.split()]
+        ring = [values[j:j + 2] for j in range(0, len(values), 2)]
+        features.append({"type": "Feature", "id": f"{name}.{start + i}", "properties": {"kod": kod} if with_kod else {},
+                         "geometry": {"type": "Polygon", "coordinates": [ring]}})
+    return json.dumps({"type": "FeatureCollection", "numberMatched": matched, "numberReturned": len(page),
+                       "features": features})
+
+
+class StubWFSServer:
+    """
+    Threaded HTTP server answering GetCapabilities, DescribeFeatureType and GetFeature requests
+    with canned GML. GetFeature responses are delayed by `latency` seconds per typename,
+    `page_limit` caps the number of features returned by a single GetFeature request.
+    With `geojson` the server also offers GeoJSON output. Responses are gzip compressed when the client asks for it,
+    propertyName without kod leaves the attribute out. `spatial_filter` "bbox" applies the bbox parameter,
+    "intersects" also announces and applies fes:Intersects filters, other requests get all features.
+    With `post` GetFeature is also accepted as an XML document by HTTP POST. `max_url_length` is the longest
+    request URL received. Without `number_matched` numberMatched is "unknown". The GetFeature page starting at
+    `invalid_at` is answered (with status 200) by an ExceptionReport, or cut in half if `invalid` is "truncated".
+    With `sorting` the server announces ImplementsSorting and an OBJECTID property (without values).
+    """
+
+    def __init__(self, layers, latency=None, page_limit=None, geojson=False, spatial_filter=None, post=False,
+                 number_matched=True, invalid_at=None, invalid="exception", sorting=False):
+        self.layers = layers  # typename (without prefix) -> list of (kod, posList)
+        self.latency = latency or {}
+        self.page_limit = page_limit
+        self.geojson = geojson
+        self.spatial_filter = spatial_filter
+        self.post = post
+        self.number_matched = number_matched
+        self.invalid_at = invalid_at
+        self.invalid = invalid
+        self.sorting = sorting
+        self.max_url_length = 0
+        self.gzip_responses = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/wfs"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_feature_requests(self):
+        with self._lock:
+            return [params for params in self.requests if params.get("request", "").lower() == "getfeature"]
+
+    def _respond(self, params):
+        request = params.get("request", "").lower()
+        if request == "getcapabilities":
+            filter_capabilities = (SORTING_CAPABILITIES if self.sorting else "") + \
+                (SPATIAL_CAPABILITIES if self.spatial_filter == "intersects" else "")
+            types = "\n".join(FEATURE_TYPE.format(name=name) for name in self.layers)
+            return CAPABILITIES.format(ns=NAMESPACE, url=self.url, feature_types=types,
+                                       paging="TRUE" if self.page_limit else "FALSE",
+                                       json_format="<ows:Value>application/json</ows:Value>" if self.geojson else "",
+                                       count_default=self.page_limit or 1000000,
+                                       post=f'<ows:Post xlink:href="{self.url}"/>' if self.post else "",
+                                       filter_capabilities=f"  <fes:Filter_Capabilities>{filter_capabilities}"
+                                       "</fes:Filter_Capabilities>" if filter_capabilities else "")
+        if request == "describefeaturetype":
+            object_id = '<xsd:element name="OBJECTID" type="xsd:long" minOccurs="0"/>' if self.sorting else ""
+            types = "\n".join(SCHEMA_TYPE.format(name=name, object_id=object_id) for name in self.layers)
+            return SCHEMA.format(ns=NAMESPACE, types=types)
+        if request == "getfeature":
+            name = params.get("typenames", params.get("typename", "")).split(":")[-1]
+            time.sleep(self.latency.get(name, 0))
+            features = self._filter(self.layers.get(name, []), params)
+            if params.get("resulttype", "").lower() == "hits":
+                return COLLECTION.format(ns=NAMESPACE, matched=len(features), returned=0, members="")
+            start = int(params.get("startindex", 0))
+            count = int(params.get("count", params.get("maxfeatures", len(features))))
+            if self.page_limit:
+                count = min(count, self.page_limit)
+            if start == self.invalid_at and self.invalid == "exception":
+                return EXCEPTION_REPORT
+            page = features[start:start + count]
+            with_kod = "propertyname" not in params or "kod" in params["propertyname"].split(",")
+            matched = len(features) if self.number_matched else "unknown"
+            if self.geojson and "json" in params.get("outputformat", "").lower():
+                body = geojson_collection(name, page, start, matched, with_kod)
+            else:
+                members = "\n".join(MEMBER.format(name=name, fid=start + i, coords=coords,
+                                                  kod=f"<stub:kod>{kod}</stub:kod>" if with_kod else "")
+                                    for i, (kod, coords) in enumerate(page))
+                body = COLLECTION.format(ns=NAMESPACE, matched=matched, returned=len(page), members=members)
+            if start == self.invalid_at:
+                return body[:len(body) // 2]
+            return body
+        return None
+
+    def _filter(self, features, params):
+        if self.spatial_filter == "intersects" and "filter" in params:
+            rings = filter_rings(params["filter"])
+            return [feature for feature in features
+                    if any(ring_intersects_square(ring, _square_bounds(feature[1])) for ring in rings)]
+        if self.spatial_filter in ("bbox", "intersects") and "bbox" in params:
+            x0, y0, x1, y1 = (float(value) for value in params["bbox"].split(",")[:4])
+
+            def in_bbox(coords):
+                fx0, fy0, fx1, fy1 = _square_bounds(coords)
+                return fx0 <= x1 and fx1 >= x0 and fy0 <= y1 and fy1 >= y0
+            return [feature for feature in features if in_bbox(feature[1])]
+        return features
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {key.lower(): values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                with server._lock:
+                    server.max_url_length = max(server.max_url_length, len(self.path))
+                self._answer(params)
+
+            def do_POST(self):
+                if not server.post:
+                    self.send_error(405, "POST not supported")
+                    return
+                try:
+                    params = get_feature_params(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                except (ET.ParseError, AttributeError):
+                    self.send_error(400, "Invalid GetFeature request")
+                    return
+                self._answer(params)
+
+            def _answer(self, params):
+                with server._lock:
+                    server.requests.append(params)
+                body = server._respond(params)
+                if body is None:
+                    self.send_error(400, "Unsupported request")
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                content_type = "application/json" if body.startswith("{") else "text/xml; charset=utf-8"
+                self.send_header("Content-Type", content_type)
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    data = gzip.compress(data)
+                    self.send_header("Content-Encoding", "gzip")
+                    with server._lock:
+                        server.gzip_responses += 1
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler